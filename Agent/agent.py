@@ -1,20 +1,41 @@
 from learner_model import LearnerModel
+from strategy_detector import StrategyDetector
+from knowledge_cache import get_knowledge_cache
+from response_cache import get_response_cache
 from rag import RAG
+from event_store import format_time, now_ms
+from checkpoint import SessionCheckpointer
+from clients import get_openai_client, log_client_metrics
+from resilience import get_guard, get_guard_metrics, CircuitOpenError
+from model_routing import get_route, guard_name
+from structured_logging import stop_logging
+from tracing import traced, span, begin_trace, current_span
+from rate_limiter import get_llm_limiter, estimate_tokens, RateLimitShed, INTERACTIVE, BACKGROUND
 import os
 from globals import Config
-import openai
 import logging
-import datetime
-import pytz
 import time
-import gradio as gr
 import json
+import threading
 import time
 from dotenv import load_dotenv
 load_dotenv()
 
 epoch_time = str(time.time()).split(".")[0]
 
+llm_error_message = "There was an error. Please ask your teacher or research for help."
+
+# Shown in the chat window of a worker process that has no agent for the session's group yet
+not_connected_message = "Your group is not connected yet. Please open your C2STEM project and try again."
+
+# Used when `Config.conversation_summary_prompt_path` is not set
+default_conversation_summary_prompt = (
+    "You maintain a running summary of a conversation between a group of students and Copa, a peer agent "
+    "helping them build a C2STEM truck simulation. Update the current summary with the new turns. Keep what the "
+    "students asked, what they were stuck on, what Copa suggested and what was resolved. Reply with the updated "
+    "summary only, in at most 150 words."
+)
+
 logging.info("Successfully imported Agent class libraries.")
 logging.basicConfig(level=logging.INFO)
 
@@ -31,6 +52,8 @@ class Agent:
     ----------
     use_gui : bool
         A flag indicating whether the agent should use a graphical user interface (GUI) for interaction.
+    group : str or int
+        The id of the student group this agent serves.
     RAG : RAG
         An instance of the `RAG` class responsible for retrieval-augmented generation, enabling domain knowledge retrieval.
     has_spoken : bool
@@ -44,14 +67,20 @@ class Agent:
         The total number of words in the conversation history, used for monitoring token usage.
     message_truncation_count : int
         The number of times messages have been truncated to stay within token limits.
+    conversation_summary : str
+        Running summary of the truncated turns, sent in place of them when `Config.summarization_enabled`.
+    summarized_count : int
+        The number of messages (after the system prompt) folded into `conversation_summary`.
     strategy_generation_task : asyncio.Task or None
         The async task for periodic strategy generation, if running.
     domain_knowledge_task : asyncio.Task or None
         The async task for periodic domain knowledge retrieval, if running.
+    checkpointer : SessionCheckpointer
+        Writes incremental checkpoints of the session state and restores them after a restart.
 
     Methods
     -------
-    __init__(use_gui=False)
+    __init__(use_gui=False, group=0)
         Initializes the agent, loads system prompts, and sets up conversation management.
     _get_formatted_time()
         Returns the current time formatted as a string in the 'America/Chicago' timezone.
@@ -61,8 +90,8 @@ class Agent:
         Saves the conversation history to a file in JSON format.
     _save_dialogue_policy_response(response_data)
         Saves the full dialogue policy response data to a separate file for analysis.
-    _get_openai_response(messages, reasoning="mininmal", verbosity="low")
-        Calls OpenAI's API to generate a response based on the provided conversation history.
+    _get_openai_response(messages, task="reply", priority=INTERACTIVE)
+        Calls the LLM routed for the task (see `model_routing.py`) to generate a response based on the provided conversation history.
     _print_messages(i=0)
         Prints the stored conversation messages along with metadata.
     _process_query(user_query)
@@ -103,12 +132,13 @@ class Agent:
     - Periodic strategy generation runs automatically every minute, analyzing recent student actions to classify learning strategies.
     """
 
-    def __init__(self,use_gui=False):
-                
-        self.openai_client = openai.OpenAI()
+    def __init__(self,use_gui=False,group=0):
+
+        # OpenAI client is created on first use so that importing/constructing the Agent stays cheap
+        self._openai_client = None
 
-        # Currently hard-coded but will need to be dynamic
-        self.group = 0
+        # Group id from the WebSocket connection, used in save and checkpoint file names
+        self.group = group
 
         self.use_gui = use_gui
         self.RAG = RAG() 
@@ -119,6 +149,10 @@ class Agent:
         self.running_word_count = len(self.messages[0]["content"].split())
 
         self.learner_model = LearnerModel()
+        self.strategy_detector = StrategyDetector()
+        self.knowledge_cache = get_knowledge_cache()
+        self.response_cache = get_response_cache()
+        self.last_domain_knowledge_model = None
 
         if Config.env == "dev":
             self.learner_model.user_model = self._load_file(f'test/g{Config.group}/test_student_model.txt')
@@ -129,6 +163,33 @@ class Agent:
         self.message_truncation_count = 0
         self.strategy_generation_task = None
         self.domain_knowledge_task = None
+        self.checkpointer = SessionCheckpointer(self)
+
+        # Serializes chat turns from the group's browser sessions so they cannot interleave in `messages`
+        self.query_lock = threading.Lock()
+
+        # Running summary of the turns truncated out of the prompt, maintained off the interactive path
+        self.conversation_summary = ""
+        self.summarized_count = 0
+        self.summary_lock = threading.Lock()
+        self.summary_pending = False
+
+    @property
+    def openai_client(self):
+        """
+        The OpenAI client used for chat completions.
+
+        This is the process-wide pooled client from `clients.get_openai_client`, shared with RAG and every
+        other session, and is constructed lazily on first access.
+
+        Returns
+        -------
+        openai.OpenAI
+            The shared client instance.
+        """
+        if self._openai_client is None:
+            self._openai_client = get_openai_client()
+        return self._openai_client
 
     def _get_formatted_time(self):
         """
@@ -143,11 +204,7 @@ class Agent:
         str
             The formatted current time in Central Time with timezone information.
         """
-        utc_now = datetime.datetime.now(pytz.utc)
-        central_tz = pytz.timezone('America/Chicago')
-        central_now = utc_now.astimezone(central_tz)
-        formatted_time = central_now.strftime('%Y-%m-%d %H:%M:%S %Z%z')
-        return formatted_time
+        return format_time(now_ms())
 
     def _load_file(self, file_path):
         """
@@ -171,6 +228,7 @@ class Agent:
             logging.error(f"Error loading file from Agent class: '{file_path}': {e}")
             return ""
         
+    @traced("save_messages")
     def _save_messages(self):
         """
         Save the conversation messages to a file in JSON format.
@@ -209,10 +267,12 @@ class Agent:
 
             with open(save_path, 'w') as f:
                 json.dump(save_messages, f, indent=4)
+                current_span().set(messages=len(save_messages), bytes=f.tell())
                 logging.info(f"Successfully saved conversation from Agent class to: '{save_path}'")
         except Exception as e:
             logging.error(f"Error saving conversation from Agent class to: '{save_path}': {e}")
 
+    @traced("save_dialogue_policy")
     def _save_dialogue_policy_response(self, response_data):
         """
         Save the full dialogue policy response data to a separate file for analysis.
@@ -241,25 +301,33 @@ class Agent:
             # Write back to file
             with open(save_path, 'w') as f:
                 json.dump(dialogue_list, f, indent=4)
+                current_span().set(entries=len(dialogue_list), bytes=f.tell())
 
             logging.info(f"Successfully saved dialogue policy response to: '{save_path}'")
         except Exception as e:
             logging.error(f"Error saving dialogue policy response to: '{save_path}': {e}")
 
-    def _get_openai_response(self, messages, reasoning="low", verbosity="low", legacy_llm=False):
+    @traced("llm", attrs=lambda self, messages, task="reply", priority=INTERACTIVE: {"task": task, "messages": len(messages)})
+    def _get_openai_response(self, messages, task="reply", priority=INTERACTIVE):
         """
-        Calls the OpenAI API to generate a response based on the provided conversation history.
+        Calls the LLM routed for a task to generate a response based on the provided conversation history.
 
-        This method sends a list of conversation messages to the OpenAI chat completions API
-        and retrieves the assistant's response. If the API call fails due to rate limits, 
-        connection issues, or other errors, it retries the request up to `Config.max_retries` 
-        times, with an exponential backoff between retries.
+        This method sends a list of conversation messages to the model that `model_routing.get_route(task)`
+        selects (OpenAI or a local OpenAI-compatible server) and retrieves the assistant's response. If the API
+        call fails due to rate limits, connection issues, or other errors, it retries the request up to
+        `Config.max_retries` times, with an exponential backoff between retries.
 
         Parameters
         ----------
         messages : list of dict
             A list of dictionaries representing the conversation history, with each dictionary
             containing the role (e.g., "system", "user", "assistant") and the content of the message.
+        task : str, optional
+            The calling task, one of `model_routing.tasks`, by default "reply". Its route sets the model,
+            reasoning effort, verbosity, temperature, output token cap, timeout and endpoint.
+        priority : int, optional
+            `INTERACTIVE` for student-facing calls or `BACKGROUND` for periodic analysis, by default `INTERACTIVE`.
+            Determines the call's standing in the shared rate limiter (see `rate_limiter.py`).
 
         Returns
         -------
@@ -269,6 +337,8 @@ class Agent:
 
         Raises
         ------
+        RateLimitShed
+            Raised for `BACKGROUND` calls that the shared rate limiter drops under pressure.
         openai.RateLimitError
             Raised when the OpenAI API's rate limit is exceeded. The function will retry after an 
             exponential backoff.
@@ -283,39 +353,103 @@ class Agent:
         - The retry mechanism is controlled by `Config.max_retries`, which specifies the maximum number of retry attempts.
         - The exponential backoff mechanism waits for `Config.backoff_factor * (2 ** i)` seconds before retrying, where `i` 
         is the current retry attempt.
+        - Each OpenAI attempt first acquires capacity from the shared rate limiter; interactive calls are served before
+        background ones, and an interactive call that cannot be admitted in time gets the default error message.
+        The tokens charged for a failed attempt are returned, and after a rate-limit error the limiter's hold replaces
+        the backoff sleep.
+        Calls routed to a local server do not use the OpenAI rate limiter.
+        - Each attempt runs under the route's guard (see `resilience.py` and `model_routing.guard_name`): it is bounded
+        by the route's timeout, may be hedged, and fails fast without retrying while the circuit breaker is open.
         - If the retries are exhausted, a default error message is returned: 
         "I'm sorry, I don't think I'm understanding you correctly. Can you explain?"
         """
+        import openai
+
+        route = get_route(task)
+        guard = get_guard(guard_name(route), route["timeout"])
+        limiter = get_llm_limiter()
+        request_tokens = estimate_tokens(messages)
+        current_span().set(model=route["model"], request_tokens_est=request_tokens)
         for i in range(Config.max_retries):
+            charged = None
+            reconciled = False
+            if not route["base_url"]:
+                try:
+                    with span("rate_limiter", priority=priority):
+                        charged = limiter.acquire(request_tokens, priority=priority)
+                except RateLimitShed as e:
+                    logging.error(f"OpenAI response call from Agent not admitted by rate limiter: {e}")
+                    if priority == BACKGROUND:
+                        raise
+                    break
             try:
-                if not legacy_llm:
-                    response = self.openai_client.responses.create(
-                        model=Config.model,
-                        input=messages,
-                        reasoning={"effort": reasoning},
-                        text={"verbosity": verbosity}
-                    )
-                    logging.info(f"Successfully called OpenAI API in Agent class.")
-                    return response.output_text
-                else:
-                    response = self.openai_client.responses.create(
-                        model="gpt-4o-2024-08-06",
-                        input=messages,
-                        temperature=0.0
-                    )
-                    logging.info(f"Successfully called OpenAI API in Agent class.")
-                    return response.output_text
+                # One span per attempt: retried attempts show up with their attempt number and error
+                with span("llm_attempt", attempt=i + 1, model=route["model"]) as attempt_span:
+                    output_text, total_tokens = self._call_route(route, guard, messages)
+                    attempt_span.set(response_chars=len(output_text or ""), total_tokens=total_tokens)
+                if charged is not None:
+                    limiter.reconcile(charged, total_tokens)
+                    reconciled = True
+                logging.info(f"Successfully called {route['model']} for '{task}' in Agent class.")
+                return output_text
+            except CircuitOpenError as e:
+                logging.error(f"OpenAI API degraded, failing fast for response call from Agent: {e}")
+                break
+            except TimeoutError as e:
+                # The guard already hedged (if enabled); retrying would only extend the student's wait
+                logging.error(f"OpenAI API timeout for response call from Agent: {e}")
+                break
             except openai.RateLimitError:
                 logging.error(f"Open AI Rate limit exceeded for response call from Agent, retry {i+1}/{Config.max_retries}.")
-                time.sleep(Config.backoff_factor * (2 ** i))
+                # Hold every queued call so the limiter, not each caller, absorbs the provider's backoff;
+                # the next attempt's acquire waits out the hold
+                if not route["base_url"]:
+                    limiter.backoff(Config.backoff_factor * (2 ** i))
+                else:
+                    time.sleep(Config.backoff_factor * (2 ** i))
             except openai.APIConnectionError as e:
                 logging.error(f"OpenAI API connection error for response call from Agent: {e}, retry {i+1}/{Config.max_retries}")
                 time.sleep(Config.backoff_factor * (2 ** i))
             except openai.APIError as e:
                 logging.error(f"OpenAI API error for response call from Agent: {e}, retry {i+1}/{Config.max_retries}")
                 time.sleep(Config.backoff_factor * (2 ** i))
-        return "There was an error. Please ask your teacher or research for help."
-        
+            finally:
+                if charged is not None and not reconciled:
+                    # A failed attempt reports no usage; return its tokens so retries do not drain the bucket
+                    limiter.reconcile(charged, 0)
+        return llm_error_message
+
+    def _call_route(self, route, guard, messages):
+        """
+        Makes one guarded call for a route through the Responses API or, for local servers, Chat Completions.
+
+        Returns
+        -------
+        tuple
+            (output text, total tokens used or None).
+        """
+        client = self.openai_client if not route["base_url"] else get_openai_client(route["base_url"])
+        kwargs = {"model": route["model"]}
+        if route["temperature"] is not None:
+            kwargs["temperature"] = route["temperature"]
+
+        if route["api"] == "chat":
+            if route["max_output_tokens"]:
+                kwargs["max_tokens"] = route["max_output_tokens"]
+            if route["reasoning"]:
+                kwargs["reasoning_effort"] = route["reasoning"]
+            response = guard.call(client.chat.completions.create, messages=messages, timeout=guard.timeout, **kwargs)
+            return response.choices[0].message.content, getattr(getattr(response, "usage", None), "total_tokens", None)
+
+        if route["max_output_tokens"]:
+            kwargs["max_output_tokens"] = route["max_output_tokens"]
+        if route["reasoning"]:
+            kwargs["reasoning"] = {"effort": route["reasoning"]}
+        if route["verbosity"]:
+            kwargs["text"] = {"verbosity": route["verbosity"]}
+        response = guard.call(client.responses.create, input=messages, timeout=guard.timeout, **kwargs)
+        return response.output_text, getattr(getattr(response, "usage", None), "total_tokens", None)
+
     def _print_messages(self,i=0):
         """
         Print the stored messages along with their roles and content.
@@ -354,6 +488,7 @@ class Agent:
         print(f"Truncation count: {self.message_truncation_count}")
         print("***************************************************************************\n\n")
 
+    @traced("process_query", attrs=lambda self, user_query: {"group": self.group, "query_chars": len(user_query)}, root=True)
     def _process_query(self, user_query):
         """
         Processes a user query using the dialogue policy interface format, interacts with OpenAI's API, and updates the conversation.
@@ -380,6 +515,8 @@ class Agent:
         - Stores only the response field in conversation messages for chat flow.
         - If the token count exceeds `Config.word_threshold`, older messages are truncated to fit within the model's limits.
         - Handles JSON parsing errors gracefully with fallback to plain text response.
+        - With `Config.response_cache_enabled`, a response cached for a similar query in the same learner state is
+          served directly ("serve" mode) or given to the model as a draft ("draft" mode).
         """
         # Get domain knowledge from the latest needed_domain_knowledge
         if len(self.learner_model.needed_domain_knowledge) > 0:
@@ -439,12 +576,20 @@ class Agent:
 
 [DOMAIN_KNOWLEDGE]:
 {domain_knowledge}"""
+
+        # Reuse the response to a similar question asked in the same learner state (opt-in)
+        cached_response, cache_key = self._lookup_cached_response(user_query)
+        if cached_response is not None and Config.response_cache_mode == "draft":
+            user_message_str += f"""
+
+[DRAFT_RESPONSE]:
+{cached_response["response"]}"""
         
         self.messages.append({"role": "user", "content": user_message_str})
         self.message_timestamps.append(self._get_formatted_time())
 
         # Truncate messages if approaching token threshold for the model
-        truncated_messages = [self.messages[0]]+self.messages[1+self.message_truncation_count:]
+        truncated_messages = self._get_prompt_messages()
 
         # # To test truncation
         # if len(truncated_messages)!=len(self.messages):
@@ -459,7 +604,13 @@ class Agent:
         #     print(f"Truncation count: {self.message_truncation_count}")
         #     print("***************************************************************************\n\n")
 
-        response_text = self._get_openai_response(truncated_messages, legacy_llm=False)
+        if cached_response is not None and Config.response_cache_mode == "serve":
+            response_source = "cache"
+            response_text = json.dumps(cached_response)
+        else:
+            response_source = "llm"
+            response_text = self._get_openai_response(truncated_messages, task="reply")
+        current_span().set(source=response_source, prompt_messages=len(truncated_messages), response_chars=len(response_text))
 
         # Parse the JSON response and extract the response field
         logging.info(f"Raw OpenAI response: {response_text}")
@@ -474,8 +625,11 @@ class Agent:
                 "summary": response_data.get("summary", ""),
                 "agent_talk_move": response_data.get("agent_talk_move", ""),
                 "dialogue_policy": response_data.get("dialogue_policy", ""),
-                "response": agent_response
+                "response": agent_response,
+                "source": response_source
             }
+            if cache_key is not None and response_source == "llm":
+                self.response_cache.store(*cache_key, {k: full_response_data[k] for k in ("summary", "agent_talk_move", "dialogue_policy", "response")})
 
             if not self.use_gui:
                 print(f"\n{Config.agent_name}: {agent_response}\n")
@@ -492,7 +646,8 @@ class Agent:
                 "summary": "",
                 "agent_talk_move": "",
                 "dialogue_policy": "",
-                "response": agent_response
+                "response": agent_response,
+                "source": response_source
             }
             if not self.use_gui:
                 print(f"\n{Config.agent_name}: {agent_response}\n")
@@ -507,16 +662,125 @@ class Agent:
         
         if self.running_word_count > Config.word_threshold:
             self.message_truncation_count += 2
+            self._schedule_summary()
 
             # To test truncation
             # print(f"TRUNCATED NOW {self.message_truncation_count}")
 
-        self._print_messages(2)
+        # Printing the latest turn is a debugging aid; skip it unless debug logging is on
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            self._print_messages(2)
         self._save_messages()
 
         # Save the full response data for analysis (separate from conversation messages)
         self._save_dialogue_policy_response(full_response_data)
 
+    @traced("response_cache_lookup")
+    def _lookup_cached_response(self, user_query):
+        """
+        Looks up the semantic response cache for a student query when `Config.response_cache_enabled`.
+
+        Parameters
+        ----------
+        user_query : str
+            The student's query.
+
+        Returns
+        -------
+        tuple
+            (cached response data or None, (fingerprint, embedding) to store the new response under, or None
+            if the cache is disabled or the query could not be embedded).
+        """
+        if not Config.response_cache_enabled:
+            return None, None
+        embeddings = self.RAG.get_embeddings([user_query])
+        if not embeddings:
+            return None, None
+        fingerprint = self.response_cache.fingerprint(self.learner_model)
+        return self.response_cache.lookup(fingerprint, embeddings[0]), (fingerprint, embeddings[0])
+
+    def _get_prompt_messages(self):
+        """
+        Builds the prompt: the system prompt, the running conversation summary and the recent window of turns.
+
+        Truncated turns that have not been folded into the summary yet stay in the window, so no context is
+        lost while the background summary catches up.
+
+        Returns
+        -------
+        list of dict
+            The messages to send to the model.
+        """
+        if not Config.summarization_enabled:
+            return [self.messages[0]]+self.messages[1+self.message_truncation_count:]
+
+        with self.summary_lock:
+            summary = self.conversation_summary
+            start = min(self.message_truncation_count, self.summarized_count)
+        prompt = [self.messages[0]]
+        if summary:
+            prompt.append({"role": "system", "content": f"[CONVERSATION_SUMMARY]\n{summary}"})
+        return prompt + self.messages[1+start:]
+
+    def _dialogue_text(self, message):
+        """
+        The conversational part of a stored message: the student query for structured user messages
+        (the model, scores and knowledge are not worth summarizing), or the content as is.
+        """
+        content = message["content"]
+        if message["role"] == "user" and content.startswith("[STUDENT_QUERY]"):
+            content = content[len("[STUDENT_QUERY]"):].split("[STUDENT_MODEL]")[0]
+        speaker = "Students" if message["role"] == "user" else Config.agent_name
+        return f"{speaker}: {content.strip()}"
+
+    def _schedule_summary(self):
+        """
+        Starts a background compaction of newly truncated turns unless one is already running.
+        """
+        if not Config.summarization_enabled:
+            return
+        with self.summary_lock:
+            if self.summary_pending:
+                return
+            self.summary_pending = True
+        threading.Thread(target=self._summarize_truncated_turns, name=f"summary-group-{self.group}", daemon=True).start()
+
+    @traced("summary_cycle", attrs=lambda self: {"group": self.group}, root=True)
+    def _summarize_truncated_turns(self):
+        """
+        Folds the turns truncated out of the prompt into `conversation_summary` using the "conversation_summary" model route
+        at background priority, until the summary covers every truncated turn.
+        """
+        try:
+            while True:
+                with self.summary_lock:
+                    start, end = self.summarized_count, self.message_truncation_count
+                    summary = self.conversation_summary
+                if start >= end:
+                    return
+
+                turns = "\n".join(self._dialogue_text(m) for m in self.messages[1+start:1+end])
+                summary_messages = [
+                    {"role": "system", "content": self._load_file(Config.conversation_summary_prompt_path) if Config.conversation_summary_prompt_path else default_conversation_summary_prompt},
+                    {"role": "user", "content": f"[CURRENT_SUMMARY]\n{summary or 'None yet.'}\n\n[NEW_TURNS]\n{turns}"}
+                ]
+                try:
+                    new_summary = self._get_openai_response(summary_messages, task="conversation_summary", priority=BACKGROUND)
+                except RateLimitShed:
+                    logging.info("Conversation summary deferred by rate limiter; truncated turns stay in the prompt.")
+                    return
+                if new_summary == llm_error_message:
+                    logging.error("Failed to update conversation summary; truncated turns stay in the prompt.")
+                    return
+
+                with self.summary_lock:
+                    self.conversation_summary = new_summary.strip()
+                    self.summarized_count = end
+                logging.info(f"Successfully folded {end - start} truncated messages into the conversation summary.")
+        finally:
+            with self.summary_lock:
+                self.summary_pending = False
+
     def _get_query_plus_comp_model_summary(self, user_query):
         """
         Summarizes the user's query and compares it with the student's computational model to identify the student's issue
@@ -559,7 +823,7 @@ class Agent:
         current_group_query_model_string = f"Student Group:\n1\n\Student Query:\n{user_query}\n\nStudent Computational Model:\n{self.learner_model.user_model}"
         summary_messages.append({"role": "user", "content": current_group_query_model_string})
 
-        summary = self._get_openai_response(summary_messages,legacy_llm=True)
+        summary = self._get_openai_response(summary_messages, task="rag_summary")
         logging.info(f"\n\nRetrieved the following summary of the students' current problem in the Agent class: {summary}\n\n")
         return summary
        
@@ -579,7 +843,7 @@ class Agent:
                     {"role": "system", "content": "Rephrase this introduction with no formatting and only once:\n"},
                     {"role": "user", "content": intro_str}
                 ],
-            legacy_llm=True
+            task="intro"
         )
         return intro_str_rephrase
     
@@ -600,14 +864,19 @@ class Agent:
         return message in {}
         # return message in {"q", "quit", "stop", "end"}
 
-    def talk(self):
+    def talk(self, agent_for_group=None):
         """
         Starts an interactive conversation with the user and continues until a termination command is given.
 
         This function defers to `_talk_with_gui` if `use_gui` is set to `True`.
+
+        Parameters
+        ----------
+        agent_for_group : callable, optional
+            Passed to `_talk_with_gui` to route each browser session to its group's agent.
         """
         if self.use_gui:
-            self._talk_with_gui()
+            self._talk_with_gui(agent_for_group)
             return
         
         intro_str = self._get_dynamic_intro_string()
@@ -627,6 +896,7 @@ class Agent:
 
         # self._end_conversation()
     
+    @traced("turn", attrs=lambda self, message, chat_history: {"group": self.group, "query_chars": len(message)}, root=True)
     def _gui_respond(self, message, chat_history):
         """
         Handles the chatbot's response to a user message within the Gradio GUI.
@@ -645,16 +915,64 @@ class Agent:
         chat_history : list of tuples
             The updated chat history, with the new user message and the chatbot's response appended.
         """
-        self._process_query(message)
-        bot_message = self.messages[-1]["content"]
+        with self.query_lock:
+            self._process_query(message)
+            bot_message = self.messages[-1]["content"]
         chat_history.append((message, bot_message))
         return "",chat_history
     
-    def _talk_with_gui(self):
+    def _talk_with_gui(self, agent_for_group=None):
+        """
+        Launches the Gradio GUI for interacting with the agent (see `launch_gui`).
+
+        Parameters
+        ----------
+        agent_for_group : callable, optional
+            Returns the Agent for a group id (e.g. `main.get_agent`).
         """
-        Launches the Gradio GUI for interacting with the agent.
+        Agent.launch_gui(agent_for_group, default_agent=self)
+
+    @staticmethod
+    def launch_gui(agent_for_group=None, default_agent=None):
         """
-        import threading
+        Launches the Gradio GUI for interacting with the agents of this process.
+
+        Each browser session keeps its own chat history and its group id (read from the `group` query
+        parameter of the chat URL) in Gradio session state. With `agent_for_group`, every message is answered
+        by that group's agent, so groups chatting at once neither share history nor wait on each other;
+        otherwise every session talks to this agent. Requests go through the Gradio queue with
+        `Config.gradio_concurrency_limit` concurrent turns and at most `Config.gradio_max_queue_size` waiting.
+
+        Without a default agent (worker processes), no agent is created here: each session is greeted and
+        answered by its group's agent, and a group without an agent in this process is asked to connect
+        from C2STEM first.
+
+        Parameters
+        ----------
+        agent_for_group : callable, optional
+            Returns the Agent for a group id (e.g. `main.get_agent`), or None if the group has none.
+        default_agent : Agent, optional
+            Answers sessions without `agent_for_group` and provides the greeting.
+        """
+        # Gradio is only needed for the GUI, so it is not imported at module load
+        import gradio as gr
+
+        def session_agent(group):
+            return agent_for_group(group) if agent_for_group is not None else default_agent
+
+        def session_start(request: gr.Request):
+            group = request.query_params.get("group") if request is not None else None
+            if default_agent is not None:
+                return group, [[None, greeting]]
+            agent = session_agent(group)
+            return group, [[None, agent._get_dynamic_intro_string() if agent is not None else not_connected_message]]
+
+        def respond(message, chat_history, group):
+            agent = session_agent(group)
+            if agent is None:
+                chat_history.append((message, not_connected_message))
+                return "", chat_history
+            return agent._gui_respond(message, chat_history)
 
         with gr.Blocks() as demo:
             with gr.Row():
@@ -673,20 +991,25 @@ class Agent:
                 "Copa: A Collaborative Peer Agent for C2STEM"
                 "</h2>"
             )
-            greeting = self._get_dynamic_intro_string()
-            chatbot = gr.Chatbot(height=240,value=[[None, greeting]],show_label=False)
+            greeting = default_agent._get_dynamic_intro_string() if default_agent is not None else None
+            chatbot = gr.Chatbot(height=240,value=[[None, greeting]] if greeting else [],show_label=False)
+
+            group = gr.State(None)
+            demo.load(session_start, inputs=None, outputs=[group, chatbot])
 
             msg = gr.Textbox(label="Message")
-            msg.submit(self._gui_respond, inputs=[msg, chatbot], outputs=[msg, chatbot]) #Press enter to submit
+            msg.submit(respond, inputs=[msg, chatbot, group], outputs=[msg, chatbot]) #Press enter to submit
 
             send_btn = gr.Button("Send")
-            send_btn.click(self._gui_respond, inputs=[msg, chatbot], outputs=[msg, chatbot])
+            send_btn.click(respond, inputs=[msg, chatbot, group], outputs=[msg, chatbot])
 
             # end_btn = gr.Button("End Conversation")
             # end_btn.click(self._end_conversation)
 
+        demo.queue(default_concurrency_limit=Config.gradio_concurrency_limit, max_size=Config.gradio_max_queue_size)
+
         # Launch Gradio in a separate thread to prevent blocking the async event loop
-        gradio_thread = threading.Thread(target=lambda: demo.launch(share=False, inbrowser=False), daemon=True)
+        gradio_thread = threading.Thread(target=lambda: demo.launch(share=False, inbrowser=False, server_port=Config.gradio_port), daemon=True)
         gradio_thread.start()
 
         # Keep the main thread alive to allow async tasks to run
@@ -696,18 +1019,20 @@ class Agent:
                 time.sleep(1)
         except KeyboardInterrupt:
             logging.info("Shutting down gracefully")
-            self.stop_strategy_generation()
+            if default_agent is not None:
+                default_agent.stop_strategy_generation()
     
     async def _generate_strategies_periodically(self):
         """
         Asynchronously generates learning strategies every minute based on recent student actions.
 
         This method:
-        1. Checks if there are at least Config.n_actions in the action_groups deque
-        2. Creates a message with the strategies prompt and last n actions
-        3. Calls OpenAI API to generate strategy analysis
-        4. Saves the result to a JSON file in saved_chats/strategies
-        5. Appends the strategy to the learner model's strategies deque
+        1. Tries the rule-based `StrategyDetector` on the recent raw actions; if it labels the window, steps 2-4 are skipped
+        2. Checks if there are at least Config.n_actions in the action_groups stream
+        3. Creates a message with the strategies prompt and last n actions
+        4. Calls OpenAI API to generate strategy analysis
+        5. Saves the result to a JSON file in saved_chats/strategies
+        6. Appends the strategy to the learner model's strategies stream
 
         The function runs continuously every 60 seconds until cancelled.
         """
@@ -717,51 +1042,67 @@ class Agent:
         logging.info("Strategy generation periodic task started - entering main loop")
 
         while True:
+            cycle = None
             try:
                 logging.info(f"Strategy generation task - waiting {Config.n_seconds} seconds")
                 await asyncio.sleep(Config.n_seconds)  
                 logging.info(f"Strategy generation task running - checking action count")
+                cycle = begin_trace("strategy_cycle", group=self.group)
 
-                # Check if we have enough actions to analyze
-                if len(self.learner_model.action_groups) < Config.n_actions:
-                    logging.info(f"Not enough actions for strategy generation: {len(self.learner_model.action_groups)}/{Config.n_actions}")
-                    continue
-
-                # Get the last n_actions from action_groups
-                recent_actions = list(self.learner_model.action_groups)[-Config.n_actions:]
-
-                # Format the actions for the prompt
-                actions_text = "\n".join([str(action["action"]) for action in recent_actions])
+                # Label clear-cut windows locally from the raw action stream; only ambiguous ones go to the LLM
+                detected = None
+                if Config.strategy_rules_enabled:
+                    detected = self.strategy_detector.classify(self.learner_model.features, int(time.time()*1000))
 
-                # Load the strategies prompt
-                strategies_prompt = self._load_file("prompts/strategies_prompt.txt")
-
-                # Create messages for OpenAI API
-                strategy_messages = [
-                    {"role": "system", "content": strategies_prompt},
-                    {"role": "user", "content": actions_text}
-                ]
-
-                # Get strategy analysis from OpenAI
-                strategy_response = self._get_openai_response(strategy_messages, legacy_llm=False)
-
-                # Parse JSON response
-                try:
-                    strategy_data = json.loads(strategy_response)
-                    summary = strategy_data.get("summary", "")
-                    strategy = strategy_data.get("strategy", "")
-                except json.JSONDecodeError:
-                    logging.error(f"Failed to parse strategy response as JSON: {strategy_response}")
-                    continue
-
-                # Create timestamp
-                timestamp = self._get_formatted_time()
+                if detected is not None:
+                    summary = detected["summary"]
+                    strategy = detected["strategy"]
+                    source = "rules"
+                else:
+                    # Check if we have enough actions to analyze
+                    if len(self.learner_model.action_groups) < Config.n_actions:
+                        logging.info(f"Not enough actions for strategy generation: {len(self.learner_model.action_groups)}/{Config.n_actions}")
+                        continue
+
+                    # Get the last n_actions from action_groups
+                    recent_actions = self.learner_model.action_groups.tail(Config.n_actions)
+
+                    # Format the actions for the prompt
+                    actions_text = "\n".join([str(action["action"]) for action in recent_actions])
+
+                    # Load the strategies prompt
+                    strategies_prompt = self._load_file("prompts/strategies_prompt.txt")
+
+                    # Create messages for OpenAI API
+                    strategy_messages = [
+                        {"role": "system", "content": strategies_prompt},
+                        {"role": "user", "content": actions_text}
+                    ]
+
+                    # Get strategy analysis from OpenAI
+                    strategy_response = self._get_openai_response(strategy_messages, task="strategy", priority=BACKGROUND)
+
+                    # Parse JSON response
+                    try:
+                        strategy_data = json.loads(strategy_response)
+                        summary = strategy_data.get("summary", "")
+                        strategy = strategy_data.get("strategy", "")
+                    except json.JSONDecodeError:
+                        logging.error(f"Failed to parse strategy response as JSON: {strategy_response}")
+                        continue
+                    source = "llm"
+                cycle.set(source=source, strategy=strategy)
+
+                # Create timestamp (epoch ms in the learner model, Central Time in the saved file)
+                event_time = now_ms()
+                timestamp = format_time(event_time)
 
                 # Create strategy entry for JSON file
                 strategy_entry = {
                     "timestamp": timestamp,
                     "summary": summary,
-                    "strategy": strategy
+                    "strategy": strategy,
+                    "source": source
                 }
 
                 # Save to strategies folder with same naming convention
@@ -783,8 +1124,9 @@ class Agent:
                     strategies_list.append(strategy_entry)
 
                     # Write back to file
-                    with open(strategies_save_path, 'w') as f:
+                    with span("save_strategies"), open(strategies_save_path, 'w') as f:
                         json.dump(strategies_list, f, indent=4)
+                        current_span().set(entries=len(strategies_list), bytes=f.tell())
 
                     logging.info(f"Strategy saved to: {strategies_save_path}")
 
@@ -792,30 +1134,39 @@ class Agent:
                     logging.error(f"Error saving strategy to file: {e}")
                     continue
 
-                # Add to learner model's strategies deque
-                strategy_dict = {"time": timestamp, "strategy": strategy}
+                # Add to learner model's strategies stream
+                strategy_dict = {"time": event_time, "strategy": strategy}
                 self.learner_model.strategies.append(strategy_dict)
 
                 logging.info(f"Strategy generated and added: {strategy}")
 
+            except RateLimitShed as e:
+                logging.info(f"Skipping strategy generation cycle: {e}")
             except asyncio.CancelledError:
                 logging.info("Strategy generation task cancelled")
                 break
             except Exception as e:
                 logging.error(f"Error in strategy generation: {e}")
                 # Continue the loop even if there's an error
+            finally:
+                if cycle is not None:
+                    cycle.end()
 
     async def _retrieve_domain_knowledge_periodically(self):
         """
         Asynchronously retrieves domain knowledge every n seconds based on the student's current model.
 
         This method:
-        1. Waits for Config.n_seconds/2 initially to stagger with strategy generation
-        2. Creates a message with the domain knowledge prompt and current user model
-        3. Calls OpenAI API to generate domain knowledge analysis
-        4. Performs RAG retrieval based on the analysis
+        1. Precomputes the shared per-segment knowledge cache (once per process), then waits for Config.n_seconds/2
+           initially to stagger with strategy generation
+        2. Skips the cycle if the student's model is unchanged since the last analysis; otherwise creates a message with
+           the domain knowledge prompt and current user model
+        3. Calls OpenAI API to generate domain knowledge analysis, unless another session already analyzed an identical model
+        4. Serves cached passages if the recommended query matches a precomputed one (by text, then by embedding),
+           otherwise performs RAG retrieval
         5. Saves the result to a JSON file in saved_chats/retrieved_domain_knowledge
-        6. Appends the knowledge to the learner model's needed_domain_knowledge deque
+        6. Appends the knowledge to the learner model's needed_domain_knowledge stream and records the analyzed model,
+           so a failed retrieval or save is retried on the next cycle
 
         The function runs continuously every Config.n_seconds until cancelled.
         """
@@ -824,75 +1175,120 @@ class Agent:
 
         logging.info("Domain knowledge retrieval periodic task started - entering main loop")
 
+        if Config.knowledge_cache_enabled:
+            try:
+                self.knowledge_cache.precompute(self.RAG)
+            except Exception as e:
+                logging.error(f"Error precomputing domain knowledge cache: {e}")
+
         # Initial delay to stagger with strategy generation
         logging.info(f"Domain knowledge task - initial wait {Config.n_seconds // 2} seconds to stagger")
         await asyncio.sleep(Config.n_seconds // 2)
 
         while True:
+            cycle = None
             try:
                 logging.info(f"Domain knowledge task - waiting {Config.n_seconds} seconds")
                 await asyncio.sleep(Config.n_seconds)
                 logging.info("Domain knowledge task running - analyzing current model")
+                cycle = begin_trace("domain_knowledge_cycle", group=self.group)
 
-                # Load the domain knowledge prompt
-                domain_knowledge_prompt = self._load_file(Config.rag_domain_knowledge_prompt_path)
-                if not domain_knowledge_prompt:
-                    logging.error("Failed to load domain knowledge prompt")
+                # The analysis depends only on the student's model, so an unchanged model keeps the current knowledge
+                current_model = self.learner_model.user_model
+                if Config.knowledge_cache_enabled and current_model == self.last_domain_knowledge_model:
+                    logging.info("Domain knowledge task - student model unchanged since last analysis, skipping")
                     continue
 
-                # Create messages for OpenAI API
-                domain_messages = [
-                    {"role": "system", "content": domain_knowledge_prompt},
-                    {"role": "user", "content": self.learner_model.user_model}
-                ]
-
-                # Get domain knowledge analysis from OpenAI
-                domain_response = self._get_openai_response(domain_messages, legacy_llm=False)
-
-                # Parse JSON response
-                try:
-                    domain_data = json.loads(domain_response)
-                    summary = domain_data.get("summary", "")
-                    knowledge_query = domain_data.get("recommended_domain_knowledge", "")
-                except json.JSONDecodeError:
-                    logging.error(f"Failed to parse domain knowledge response as JSON: {domain_response}")
-                    continue
+                analysis = self.knowledge_cache.analysis(current_model) if Config.knowledge_cache_enabled else None
+                if analysis is not None:
+                    logging.info("Domain knowledge task - reusing the analysis of an identical student model")
+                    summary, knowledge_query = analysis
+                else:
+                    # Load the domain knowledge prompt
+                    domain_knowledge_prompt = self._load_file(Config.rag_domain_knowledge_prompt_path)
+                    if not domain_knowledge_prompt:
+                        logging.error("Failed to load domain knowledge prompt")
+                        continue
+
+                    # Create messages for OpenAI API
+                    domain_messages = [
+                        {"role": "system", "content": domain_knowledge_prompt},
+                        {"role": "user", "content": current_model}
+                    ]
+
+                    # Get domain knowledge analysis from OpenAI
+                    domain_response = self._get_openai_response(domain_messages, task="domain_knowledge", priority=BACKGROUND)
+
+                    # Parse JSON response
+                    try:
+                        domain_data = json.loads(domain_response)
+                        summary = domain_data.get("summary", "")
+                        knowledge_query = domain_data.get("recommended_domain_knowledge", "")
+                    except json.JSONDecodeError:
+                        logging.error(f"Failed to parse domain knowledge response as JSON: {domain_response}")
+                        continue
+                    if Config.knowledge_cache_enabled:
+                        self.knowledge_cache.remember_analysis(current_model, summary, knowledge_query)
 
                 # Perform RAG retrieval
+                source = "live"
+                retrieved = False
                 try:
-                    # Get embeddings for the knowledge query
-                    logging.info(f"Performing RAG retrieval for domain knowledge with query: {knowledge_query}")
-                    q_embed = self.RAG.get_embeddings([knowledge_query])
-
-                    if q_embed is None:
-                        logging.error("Failed to retrieve embeddings for domain knowledge")
-                        domain_context = "No domain knowledge available due to failed embedding retrieval."
+                    # Keyword-heavy queries are answered from the local lexical index without an embedding call
+                    lexical_result = self.RAG.lexical_search(knowledge_query, 3)
+                    # A query identical to a precomputed one is served without an embedding call
+                    cached = self.knowledge_cache.lookup(knowledge_query) if Config.knowledge_cache_enabled and lexical_result is None else None
+                    if lexical_result is not None:
+                        source = "lexical"
+                        domain_context = "\n\n".join([m["metadata"]["text"] for m in lexical_result["matches"]])
+                        retrieved = True
+                    elif cached is not None:
+                        source, domain_context = cached
+                        retrieved = True
                     else:
-                        # Embedding retrieval successful
-                        q_embed = q_embed[0]
+                        # Get embeddings for the knowledge query
+                        logging.info(f"Performing RAG retrieval for domain knowledge with query: {knowledge_query}")
+                        q_embed = self.RAG.get_embeddings([knowledge_query])
 
-                        retrieval_result = self.RAG.retrieve(q_embed, 3)
-                        if retrieval_result is None or "matches" not in retrieval_result or not retrieval_result["matches"]:
-                            logging.error("Failed to retrieve knowledge base matches for domain knowledge")
-                            domain_context = "No domain knowledge available currently due to failed RAG retrieval."
+                        if q_embed is None:
+                            logging.error("Failed to retrieve embeddings for domain knowledge")
+                            domain_context = "No domain knowledge available due to failed embedding retrieval."
                         else:
-                            # Matches retrieved successfully
-                            matches = retrieval_result["matches"]
-                            domain_context = "\n\n".join([m["metadata"]["text"] for m in matches])
+                            # Embedding retrieval successful
+                            q_embed = q_embed[0]
+
+                            # Serve precomputed passages when the query matches a segment/template; retrieve live otherwise
+                            cached = self.knowledge_cache.match(q_embed) if Config.knowledge_cache_enabled else None
+                            if cached is not None:
+                                source, domain_context = cached
+                                retrieved = True
+                            else:
+                                retrieval_result = self.RAG.retrieve(q_embed, 3, query_text=knowledge_query)
+                                if retrieval_result is None or "matches" not in retrieval_result or not retrieval_result["matches"]:
+                                    logging.error("Failed to retrieve knowledge base matches for domain knowledge")
+                                    domain_context = "No domain knowledge available currently due to failed RAG retrieval."
+                                else:
+                                    # Matches retrieved successfully
+                                    matches = retrieval_result["matches"]
+                                    domain_context = "\n\n".join([m["metadata"]["text"] for m in matches])
+                                    retrieved = True
 
                 except Exception as e:
                     logging.error(f"Error during RAG retrieval: {e}")
                     domain_context = "Error occurred during domain knowledge retrieval."
+                cycle.set(source=source, knowledge_chars=len(domain_context))
 
-                # Create timestamp
-                timestamp = self._get_formatted_time()
+                # Create timestamp (epoch ms in the learner model, Central Time in the saved file)
+                event_time = now_ms()
+                timestamp = format_time(event_time)
 
                 # Create domain knowledge entry for JSON file
                 domain_entry = {
                     "timestamp": timestamp,
                     "summary": summary,
                     "recommended_domain_knowledge": knowledge_query,
-                    "knowledge": domain_context
+                    "knowledge": domain_context,
+                    "source": source
                 }
 
                 # Save to retrieved_domain_knowledge folder with same naming convention
@@ -911,8 +1307,9 @@ class Agent:
                     domain_list.append(domain_entry)
 
                     # Write back to file
-                    with open(domain_save_path, 'w') as f:
+                    with span("save_domain_knowledge"), open(domain_save_path, 'w') as f:
                         json.dump(domain_list, f, indent=4)
+                        current_span().set(entries=len(domain_list), bytes=f.tell())
 
                     logging.info(f"Domain knowledge saved to: {domain_save_path}")
 
@@ -920,18 +1317,50 @@ class Agent:
                     logging.error(f"Error saving domain knowledge to file: {e}")
                     continue
 
-                # Add to learner model's needed_domain_knowledge deque
-                domain_dict = {"time": timestamp, "summary": summary, "recommended_domain_knowledge": knowledge_query, "knowledge": domain_context}
+                # Add to learner model's needed_domain_knowledge stream
+                domain_dict = {"time": event_time, "summary": summary, "recommended_domain_knowledge": knowledge_query, "knowledge": domain_context}
                 self.learner_model.needed_domain_knowledge.append(domain_dict)
+                if retrieved:
+                    # Only a delivered result lets later cycles skip an unchanged model; failures are retried
+                    self.last_domain_knowledge_model = current_model
 
                 logging.info(f"Domain knowledge generated and added: {self.learner_model.needed_domain_knowledge[-1]}")
+                log_client_metrics()
+                logging.info(f"Upstream guard metrics: {get_guard_metrics()}")
 
+            except RateLimitShed as e:
+                logging.info(f"Skipping domain knowledge retrieval cycle: {e}")
             except asyncio.CancelledError:
                 logging.info("Domain knowledge retrieval task cancelled")
                 break
             except Exception as e:
                 logging.error(f"Error in domain knowledge retrieval: {e}")
                 # Continue the loop even if there's an error
+            finally:
+                if cycle is not None:
+                    cycle.end()
+
+    def serve_segment_knowledge(self, segment):
+        """
+        Immediately serves the precomputed domain knowledge for a task segment the students just entered.
+
+        Parameters
+        ----------
+        segment : str
+            A key of `LearnerModel.task_contexts_map`.
+        """
+        if not Config.knowledge_cache_enabled:
+            return
+        knowledge = self.knowledge_cache.for_segment(segment)
+        if knowledge is None:
+            return
+        self.learner_model.needed_domain_knowledge.append({
+            "time": now_ms(),
+            "summary": f"Precomputed domain knowledge for task segment '{segment}'.",
+            "recommended_domain_knowledge": self.learner_model.task_contexts_map.get(segment, ""),
+            "knowledge": knowledge
+        })
+        logging.info(f"Served precomputed domain knowledge for task segment: {segment}")
 
     def start_strategy_generation(self):
         """
@@ -999,5 +1428,9 @@ class Agent:
         """
         self.stop_strategy_generation()
         self.stop_domain_knowledge_retrieval()
+        if Config.checkpoint_enabled:
+            self.checkpointer.discard()
         self._print_messages()
+        # os._exit skips atexit handlers, so flush the background log writer first
+        stop_logging()
         os._exit(0)
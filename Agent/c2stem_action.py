@@ -90,7 +90,7 @@ class C2STEMAction:
                 self.block_map[block_id] = self.block
             else:
                 self.block = ''
-            logging.info(f"Action received at {self.t}: action={self.action_type}, block={self.block}")
+            logging.info("Action received at %s: action=%s, block=%s", self.t, self.action_type, self.block, extra={"category": "action"})
         elif self.action_type=="moveBlock":
             block_str = self.data['args'][0]
             if len(block_str) > 0:
@@ -107,13 +107,13 @@ class C2STEMAction:
                         self.block = ''
             else:
                 self.block = ''
-            logging.info(f"Action received at {self.t}: action={self.action_type}, block={self.block}")
+            logging.info("Action received at %s: action=%s, block=%s", self.t, self.action_type, self.block, extra={"category": "action"})
         elif self.action_type=="setField":
             block_str = self.data['args'][0].split("/")[0]
             if len(block_str) > 0:
                 if block_str in self.block_map:
                     self.block = self.block_map[block_str]
-                    logging.info(f"Action received at {self.t}: action={self.action_type}, block={self.block}")
+                    logging.info("Action received at %s: action=%s, block=%s", self.t, self.action_type, self.block, extra={"category": "action"})
                 else:
                     self.block = ""
                     logging.error(f"No 's' attribute found in block string: {data}")
@@ -125,7 +125,7 @@ class C2STEMAction:
             if len(block_str) > 0:
                 if block_str in self.block_map:
                     self.block = self.block_map[block_str]
-                    logging.info(f"Action received at {self.t}: action={self.action_type}, block={self.block}")
+                    logging.info("Action received at %s: action=%s, block=%s", self.t, self.action_type, self.block, extra={"category": "action"})
                 else:
                     self.block = ""
                     logging.error(f"No 's' attribute found in block string: {data}")
@@ -137,7 +137,7 @@ class C2STEMAction:
             if len(block_str) > 0:
                 if block_str in self.block_map:
                     self.block = self.block_map[block_str]
-                    logging.info(f"Action received at {self.t}: action={self.action_type}, block={self.block}")
+                    logging.info("Action received at %s: action=%s, block=%s", self.t, self.action_type, self.block, extra={"category": "action"})
                 else:
                     self.block = ""
                     logging.error(f"No 's' attribute found in block string: {data}")
@@ -146,13 +146,13 @@ class C2STEMAction:
                 logging.error(f"No 's' attribute found in block string: {data}")
         elif self.action_type == "toggleWatcher":
             self.block = self.data['args'][0]
-            logging.info(f"Action received at {self.t}: action={self.action_type}, block={self.block}")
+            logging.info("Action received at %s: action=%s, block=%s", self.t, self.action_type, self.block, extra={"category": "action"})
         elif self.action_type == "tableDialog":
             self.block = ""
-            logging.info(f"Action received at {self.t}: action={self.action_type}, block={self.block}")
+            logging.info("Action received at %s: action=%s, block=%s", self.t, self.action_type, self.block, extra={"category": "action"})
         elif self.action_type == "graphDialog":
             self.block = ""
-            logging.info(f"Action received at {self.t}: action={self.action_type}, block={self.block}")
+            logging.info("Action received at %s: action=%s, block=%s", self.t, self.action_type, self.block, extra={"category": "action"})
         else:
             self.block = ""
 
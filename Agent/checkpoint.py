@@ -0,0 +1,265 @@
+from globals import Config
+from c2stem_action import C2STEMAction
+from learner_features import ActivityFeatures
+import logging
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+"""
+Compact binary checkpoints of a session's Agent and LearnerModel state, and fast restore.
+
+A checkpoint file (`Config.checkpoint_dir`/<task>_Group<group>.ckpt) is a sequence of records, each a
+4-byte big-endian length followed by a zlib-compressed pickle. The first record is a full snapshot; every
+later record is a delta holding only what changed since the previous record: items appended to each
+append-only stream (messages, timestamps and the LearnerModel event streams), changed scalars and new or
+reassigned `C2STEMAction.block_map` entries. Only the new part of each stream is copied, so writes are
+proportional to new activity, not session length.
+After `Config.checkpoint_compact_every` deltas the file is rewritten as one full snapshot (atomically,
+via a temporary file). Restoring replays the records in order and rebuilds the activity features from
+the restored actions.
+
+Checkpoints are taken by a daemon thread every `Config.checkpoint_interval` seconds, off the WebSocket
+and chat paths. They are for recovering a session that was interrupted, so a checkpoint not written to for
+`Config.checkpoint_max_age` seconds belongs to an earlier class and is not restored, and a conversation
+that ends cleanly deletes its checkpoint.
+"""
+
+agent_streams = ["messages", "message_timestamps"]
+agent_scalars = ["has_spoken", "running_word_count", "message_truncation_count", "last_domain_knowledge_model", "conversation_summary", "summarized_count"]
+learner_streams = ["raw_actions", "action_groups", "model_scores", "task_contexts", "strategies", "learner_state", "needed_domain_knowledge"]
+learner_scalars = ["user_model"]
+
+record_header = struct.Struct(">I")
+
+
+class SessionCheckpointer:
+    """
+    Writes incremental checkpoints of one Agent's session state and restores them.
+
+    Parameters
+    ----------
+    agent : Agent
+        The agent whose state is checkpointed.
+    """
+    def __init__(self, agent):
+        self.agent = agent
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.discarded = False
+        self._reset_marks()
+
+    @property
+    def path(self):
+        return os.path.join(Config.checkpoint_dir, f"{Config.c2stem_task}_Group{self.agent.group}.ckpt")
+
+    def _reset_marks(self):
+        # Stream lengths, scalar values and a copy of block_map as of the last written record
+        self.stream_marks = {}
+        self.scalar_marks = {}
+        self.block_map_mark = {}
+        self.deltas = 0
+
+    def _stream(self, name):
+        owner, attr = name.split(".", 1)
+        return getattr(self.agent if owner == "agent" else self.agent.learner_model, attr)
+
+    def _stream_items(self, name, start):
+        """
+        A consistent copy of a stream's items from index `start` on (list slices are atomic under the GIL;
+        event stores slice under their own lock), or None if the stream is shorter than `start`.
+        """
+        stream = self._stream(name)
+        if len(stream) < start:
+            return None
+        return stream.rows_from(start) if name.startswith("learner.") else stream[start:]
+
+    def _scalars(self):
+        learner = self.agent.learner_model
+        scalars = {f"agent.{name}": getattr(self.agent, name) for name in agent_scalars}
+        scalars.update({f"learner.{name}": getattr(learner, name) for name in learner_scalars})
+        return scalars
+
+    def _build_record(self, full):
+        starts = {} if full else self.stream_marks
+        streams = {}
+        for name in [f"agent.{n}" for n in agent_streams] + [f"learner.{n}" for n in learner_streams]:
+            items = self._stream_items(name, starts.get(name, 0))
+            if items is None:
+                # A stream that shrank cannot be expressed as an append, so fall back to a full snapshot
+                return self._build_record(True)
+            streams[name] = items
+        scalars = self._scalars()
+        # dict() copies atomically under the GIL; moveBlock reassigns existing ids, so diff values, not just keys
+        block_map = dict(C2STEMAction.block_map)
+
+        if full:
+            record = {"kind": "full", "streams": streams, "scalars": scalars, "block_map": list(block_map.items())}
+        else:
+            record = {
+                "kind": "delta",
+                "streams": {name: items for name, items in streams.items() if items},
+                "scalars": {name: value for name, value in scalars.items() if self.scalar_marks.get(name) != value},
+                "block_map": [(key, value) for key, value in block_map.items() if key not in self.block_map_mark or self.block_map_mark[key] != value]
+            }
+        marks = ({name: starts.get(name, 0) + len(items) for name, items in streams.items()}, scalars, block_map)
+        return record, marks
+
+    def _encode(self, record):
+        payload = zlib.compress(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+        return record_header.pack(len(payload)) + payload
+
+    def checkpoint(self):
+        """
+        Appends a delta record (or writes a full snapshot on the first call and on compaction).
+
+        Returns
+        -------
+        bool
+            True if anything was written.
+        """
+        with self.lock:
+            if self.discarded:
+                return False
+            try:
+                full = not os.path.exists(self.path) or not self.stream_marks or self.deltas >= Config.checkpoint_compact_every
+                record, (stream_marks, scalar_marks, block_map_mark) = self._build_record(full)
+                if record["kind"] == "delta" and not (record["streams"] or record["scalars"] or record["block_map"]):
+                    return False
+
+                os.makedirs(Config.checkpoint_dir, exist_ok=True)
+                data = self._encode(record)
+                if record["kind"] == "full":
+                    tmp_path = f"{self.path}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp_path, self.path)
+                    self.deltas = 0
+                else:
+                    with open(self.path, 'ab') as f:
+                        f.write(data)
+                    self.deltas += 1
+
+                self.stream_marks, self.scalar_marks, self.block_map_mark = stream_marks, scalar_marks, block_map_mark
+                return True
+            except Exception as e:
+                logging.error(f"Error writing session checkpoint to '{self.path}': {e}")
+                return False
+
+    def _read_records(self):
+        records = []
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + record_header.size <= len(data):
+            (length,) = record_header.unpack_from(data, offset)
+            offset += record_header.size
+            if offset + length > len(data):
+                # Torn final record from a crash mid-write; everything before it is intact
+                logging.error(f"Ignoring truncated record at the end of session checkpoint '{self.path}'.")
+                break
+            records.append(pickle.loads(zlib.decompress(data[offset:offset + length])))
+            offset += length
+        return records
+
+    def restore(self):
+        """
+        Rebuilds the agent's session state from its checkpoint file, if one exists.
+
+        Returns
+        -------
+        bool
+            True if a checkpoint was restored.
+        """
+        with self.lock:
+            if not os.path.exists(self.path):
+                return False
+            age = time.time() - os.path.getmtime(self.path)
+            if age > Config.checkpoint_max_age:
+                # Left by an earlier class using the same group number; it is overwritten by this session's first checkpoint
+                logging.info(f"Not restoring session checkpoint '{self.path}': last written {age / 3600:.1f} hours ago.")
+                return False
+            try:
+                records = self._read_records()
+            except Exception as e:
+                logging.error(f"Error reading session checkpoint from '{self.path}': {e}")
+                return False
+            if not records or records[0]["kind"] != "full":
+                logging.error(f"Session checkpoint '{self.path}' does not start with a full snapshot; not restoring.")
+                return False
+
+            streams, scalars, block_map = {}, {}, {}
+            for record in records:
+                if record["kind"] == "full":
+                    streams = {name: list(items) for name, items in record["streams"].items()}
+                    scalars = dict(record["scalars"])
+                    block_map = dict(record["block_map"])
+                else:
+                    for name, items in record["streams"].items():
+                        streams.setdefault(name, []).extend(items)
+                    scalars.update(record["scalars"])
+                    block_map.update(record["block_map"])
+
+            learner = self.agent.learner_model
+            for name in agent_streams:
+                setattr(self.agent, name, streams.get(f"agent.{name}", []))
+            for name in learner_streams:
+                store = learner.new_stream(name)
+                store.extend(streams.get(f"learner.{name}", []))
+                setattr(learner, name, store)
+            for name in agent_scalars:
+                if f"agent.{name}" in scalars:
+                    setattr(self.agent, name, scalars[f"agent.{name}"])
+            for name in learner_scalars:
+                if f"learner.{name}" in scalars:
+                    setattr(learner, name, scalars[f"learner.{name}"])
+            C2STEMAction.block_map.update(block_map)
+
+            learner.features = ActivityFeatures()
+            for entry in learner.raw_actions:
+                learner.features.ingest(entry["time"], entry["action"])
+
+            self.stream_marks = {f"agent.{name}": len(getattr(self.agent, name)) for name in agent_streams}
+            self.stream_marks.update({f"learner.{name}": len(getattr(learner, name)) for name in learner_streams})
+            self.scalar_marks = self._scalars()
+            self.block_map_mark = dict(C2STEMAction.block_map)
+            self.deltas = len(records) - 1
+            logging.info(f"Successfully restored session checkpoint for group {self.agent.group} from '{self.path}' ({len(records)} records).")
+            return True
+
+    def start(self):
+        """
+        Starts the periodic checkpoint thread.
+        """
+        if self.thread is None:
+            def run():
+                while not self.stop_event.wait(Config.checkpoint_interval):
+                    self.checkpoint()
+
+            self.thread = threading.Thread(target=run, name="session-checkpointer", daemon=True)
+            self.thread.start()
+            logging.info(f"Session checkpointing started every {Config.checkpoint_interval} seconds.")
+
+    def stop(self):
+        """
+        Stops the periodic thread and writes a final checkpoint.
+        """
+        self.stop_event.set()
+        self.checkpoint()
+
+    def discard(self):
+        """
+        Stops the periodic thread and deletes the checkpoint; used when the conversation ends cleanly.
+        """
+        self.stop_event.set()
+        with self.lock:
+            self.discarded = True
+            for path in (self.path, f"{self.path}.tmp"):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._reset_marks()
+        logging.info(f"Deleted session checkpoint for group {self.agent.group} after the conversation ended.")
@@ -0,0 +1,186 @@
+from globals import Config
+import logging
+import threading
+
+"""
+Process-wide pooled clients for OpenAI and Pinecone.
+
+Every Agent, RAG instance and session in the process shares the clients created here, so
+they share one connection pool per upstream instead of each opening (and handshaking) its
+own. Pool sizes, keep-alive and timeouts are set in `Config`. Connection reuse is tracked
+and can be read with `get_client_metrics()`.
+"""
+
+_lock = threading.Lock()
+_openai_clients = {}
+_pinecone_client = None
+_pinecone_indexes = {}
+
+# Counters for the OpenAI httpx pool, updated from httpcore trace events
+_openai_metrics = {"requests": 0, "new_connections": 0, "responses": 0, "errors": 0}
+_metrics_lock = threading.Lock()
+
+
+def _count(key):
+    with _metrics_lock:
+        _openai_metrics[key] += 1
+
+
+def _trace(event_name, info):
+    """
+    httpcore trace callback: counts TCP connects and sent requests so reuse can be derived.
+    """
+    if event_name == "connection.connect_tcp.complete":
+        _count("new_connections")
+    elif event_name.endswith("send_request_headers.started"):
+        _count("requests")
+
+
+def _attach_trace(request):
+    """
+    httpx request hook that attaches the trace callback to every outgoing request.
+    """
+    request.extensions["trace"] = _trace
+
+
+def _count_response(response):
+    """
+    httpx response hook that counts responses and upstream errors.
+    """
+    _count("responses")
+    if response.status_code >= 500 or response.status_code == 429:
+        _count("errors")
+
+
+def get_openai_client(base_url=None):
+    """
+    Returns the shared OpenAI client, creating it on first use.
+
+    The client is backed by a single `httpx.Client` configured with the connection limits,
+    keep-alive expiry and timeouts from `Config`.
+
+    Parameters
+    ----------
+    base_url : str, optional
+        URL of a local OpenAI-compatible server (see `model_routing.py`); each server gets its own
+        pooled client. By default the OpenAI API.
+
+    Returns
+    -------
+    openai.OpenAI
+        The process-wide client for the endpoint.
+    """
+    with _lock:
+        if base_url not in _openai_clients:
+            import httpx
+            import openai
+
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=Config.http_max_connections,
+                    max_keepalive_connections=Config.http_max_keepalive_connections,
+                    keepalive_expiry=Config.http_keepalive_expiry
+                ),
+                timeout=httpx.Timeout(Config.http_timeout, connect=Config.http_connect_timeout),
+                event_hooks={"request": [_attach_trace], "response": [_count_response]}
+            )
+            if base_url is None:
+                _openai_clients[base_url] = openai.OpenAI(http_client=http_client)
+                logging.info("Successfully created shared OpenAI client.")
+            else:
+                # Local servers usually ignore the key, but the client requires one
+                _openai_clients[base_url] = openai.OpenAI(base_url=base_url, api_key=Config.local_llm_api_key, http_client=http_client)
+                logging.info(f"Successfully created shared client for local LLM server '{base_url}'.")
+    return _openai_clients[base_url]
+
+
+def get_pinecone_client():
+    """
+    Returns the shared Pinecone client, creating it on first use.
+
+    Returns
+    -------
+    Pinecone
+        The process-wide Pinecone client.
+    """
+    global _pinecone_client
+    with _lock:
+        if _pinecone_client is None:
+            from pinecone import Pinecone
+            _pinecone_client = Pinecone(api_key=Config.vector_store_api_key, pool_threads=Config.pinecone_pool_threads)
+            logging.info("Successfully created shared Pinecone client.")
+    return _pinecone_client
+
+
+def get_pinecone_index(index_name):
+    """
+    Returns the shared handle for a Pinecone index, connecting it on first use.
+
+    Parameters
+    ----------
+    index_name : str
+        The name of the Pinecone index.
+
+    Returns
+    -------
+    Pinecone.Index
+        The process-wide index handle, whose urllib3 pool is shared by all callers.
+    """
+    client = get_pinecone_client()
+    with _lock:
+        if index_name not in _pinecone_indexes:
+            _pinecone_indexes[index_name] = client.Index(
+                index_name,
+                pool_threads=Config.pinecone_pool_threads,
+                connection_pool_maxsize=Config.pinecone_connection_pool_maxsize
+            )
+            logging.info(f"Successfully connected to shared Pinecone index '{index_name}'.")
+    return _pinecone_indexes[index_name]
+
+
+def _pinecone_pool_stats(index):
+    """
+    Reads request/connection counts from the urllib3 pools behind a Pinecone index.
+
+    Pinecone does not expose its pool publicly, so this walks the generated API client on a
+    best-effort basis and returns None if the layout is not recognized.
+    """
+    try:
+        pool_manager = index._vector_api.api_client.rest_client.pool_manager
+        requests, connections = 0, 0
+        for key in list(pool_manager.pools.keys()):
+            pool = pool_manager.pools[key]
+            requests += pool.num_requests
+            connections += pool.num_connections
+        return {"requests": requests, "new_connections": connections, "reused": max(requests - connections, 0)}
+    except Exception:
+        return None
+
+
+def get_client_metrics():
+    """
+    Returns connection-reuse metrics for the shared clients.
+
+    Returns
+    -------
+    dict
+        "openai": counts of requests sent, new TCP connections opened, connections reused,
+        responses and upstream errors (429/5xx).
+        "pinecone": per-index request and connection counts, or None where unavailable.
+    """
+    with _metrics_lock:
+        openai_metrics = dict(_openai_metrics)
+    openai_metrics["reused"] = max(openai_metrics["requests"] - openai_metrics["new_connections"], 0)
+
+    with _lock:
+        indexes = dict(_pinecone_indexes)
+    pinecone_metrics = {name: _pinecone_pool_stats(index) for name, index in indexes.items()}
+
+    return {"openai": openai_metrics, "pinecone": pinecone_metrics}
+
+
+def log_client_metrics():
+    """
+    Logs the current connection-reuse metrics at info level.
+    """
+    logging.info(f"Shared client metrics: {get_client_metrics()}")
@@ -0,0 +1,112 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import queue
+import threading
+import time
+
+class Coalescer:
+    """
+    Base class for coalescing concurrent requests from many sessions into batched upstream calls.
+
+    Callers `submit` a (key, payload) pair and block on the result. A collector thread waits up to
+    `window_ms` after the first pending request (or until `max_items` payload units are pending),
+    groups the collected requests by key and hands each group to `_flush` on a small pool, so
+    collection continues while a batch is in flight. Subclasses implement `_flush` and resolve
+    every future in the group with a result or an exception.
+
+    Parameters
+    ----------
+    name : str
+        Thread-name prefix.
+    window_ms : callable
+        Returns the collection window in milliseconds (read on every batch so Config changes apply).
+    max_items : callable
+        Returns the maximum number of payload units per batch.
+    """
+    def __init__(self, name, window_ms, max_items):
+        self.name = name
+        self.window_ms = window_ms
+        self.max_items = max_items
+        self.requests = queue.Queue()
+        self._collector = None
+        self._start_lock = threading.Lock()
+        self._flush_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix=f"{name}-flush")
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **increments):
+        # Batches are flushed on several pool threads at once, and `+=` on a dict entry is not atomic
+        with self._stats_lock:
+            for name, n in increments.items():
+                self.stats[name] += n
+
+    def _size(self, payload):
+        """
+        Number of units a payload counts toward `max_items`; one by default.
+        """
+        return 1
+
+    def submit(self, key, payload):
+        """
+        Queues a request and blocks until its batch has been flushed.
+
+        Parameters
+        ----------
+        key : hashable
+            Requests with the same key are flushed together.
+        payload : Any
+            Request data passed to `_flush`.
+
+        Returns
+        -------
+        Any
+            The result set by `_flush` for this request.
+        """
+        with self._start_lock:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name=self.name, daemon=True)
+                self._collector.start()
+        future = Future()
+        self.requests.put((key, payload, future))
+        return future.result()
+
+    def _collect(self):
+        while True:
+            batch = [self.requests.get()]
+            pending = self._size(batch[0][1])
+            deadline = time.monotonic() + self.window_ms() / 1000
+            while pending < self.max_items():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                pending += self._size(item[1])
+
+            groups = {}
+            for key, payload, future in batch:
+                groups.setdefault(key, []).append((payload, future))
+            for key, items in groups.items():
+                self._flush_pool.submit(self._safe_flush, key, items)
+
+    def _safe_flush(self, key, items):
+        try:
+            self._flush(key, items)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _flush(self, key, items):
+        """
+        Executes one batch.
+
+        Parameters
+        ----------
+        key : hashable
+            The group key.
+        items : list of tuple
+            (payload, future) pairs; every future must be resolved.
+        """
+        raise NotImplementedError
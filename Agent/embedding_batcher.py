@@ -0,0 +1,82 @@
+from globals import Config
+from clients import get_openai_client
+from resilience import get_guard
+from coalescer import Coalescer
+import logging
+
+class EmbeddingBatcher(Coalescer):
+    """
+    Coalesces concurrent embedding requests from all sessions into batched OpenAI calls.
+
+    Each caller's texts are queued; the collector waits up to `Config.embedding_batch_window_ms`
+    after the first pending request (or until `Config.embedding_batch_max` texts are pending), sends
+    the distinct texts in one `embeddings.create` call per model, and fans the vectors back out to the
+    callers. Errors from the batched call are raised in every caller that was part of the batch, so
+    callers keep their own retry handling.
+
+    Attributes
+    ----------
+    stats : dict
+        Counts of caller requests, texts, distinct texts sent and API calls made.
+    """
+    def __init__(self):
+        super().__init__("embedding-batcher", lambda: Config.embedding_batch_window_ms, lambda: Config.embedding_batch_max)
+        self.stats = {"requests": 0, "texts": 0, "sent_texts": 0, "api_calls": 0}
+
+    def _size(self, payload):
+        return len(payload)
+
+    def embed(self, texts, model):
+        """
+        Returns embeddings for `texts`, batched with any other concurrent requests.
+
+        Parameters
+        ----------
+        texts : list of str
+            Texts to embed.
+        model : str
+            The embedding model name.
+
+        Returns
+        -------
+        list of list of float
+            One embedding per input text, in order.
+
+        Raises
+        ------
+        Exception
+            Whatever the batched API call raised (e.g. `openai.RateLimitError`, `TimeoutError`).
+        """
+        return self.submit(model, list(texts))
+
+    def _flush(self, model, items):
+        """
+        Sends the distinct texts of a batch in as few calls as `Config.embedding_batch_max` allows and
+        resolves each caller's future.
+        """
+        distinct = list(dict.fromkeys(t for texts, _ in items for t in texts))
+        self._count(requests=len(items), texts=sum(len(texts) for texts, _ in items), sent_texts=len(distinct))
+
+        guard = get_guard("openai_embeddings", Config.embedding_timeout)
+        vectors = {}
+        for start in range(0, len(distinct), Config.embedding_batch_max):
+            chunk = distinct[start:start + Config.embedding_batch_max]
+            res = guard.call(get_openai_client().embeddings.create, input=chunk, model=model, timeout=guard.timeout)
+            self._count(api_calls=1)
+            for text, r in zip(chunk, res.data):
+                vectors[text] = r.embedding
+
+        if len(items) > 1:
+            logging.info(f"Coalesced {len(items)} embedding requests into one batch of {len(distinct)} texts.")
+        for texts, future in items:
+            future.set_result([vectors[t] for t in texts])
+
+
+_batcher = EmbeddingBatcher()
+
+
+def get_embedding_batcher():
+    """
+    Returns the process-wide embedding batcher shared by every RAG instance.
+    """
+    return _batcher
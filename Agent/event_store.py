@@ -0,0 +1,174 @@
+from array import array
+import bisect
+import datetime
+import threading
+import pytz
+
+"""
+Columnar in-memory store for the LearnerModel event streams.
+
+Each stream keeps its timestamps in an int64 epoch-milliseconds column, its low-cardinality fields
+(segments, strategies, learner states) as int32 codes into an interned label table, and any other fields
+as plain object columns. Appending an event therefore allocates no per-event dict or timestamp string,
+and time-range queries are binary searches over the time column.
+
+Human-readable Central-time strings are produced only when events are exported (`to_records`,
+`format_time`), not when they are recorded.
+"""
+
+central_tz = pytz.timezone('America/Chicago')
+
+
+def now_ms():
+    """
+    The current time in epoch milliseconds.
+    """
+    return int(datetime.datetime.now(datetime.timezone.utc).timestamp() * 1000)
+
+
+def format_time(t_ms):
+    """
+    Formats epoch milliseconds as Central Time, e.g. '2025-03-04 10:15:00 CST-0600'.
+    """
+    return datetime.datetime.fromtimestamp(t_ms / 1000, central_tz).strftime('%Y-%m-%d %H:%M:%S %Z%z')
+
+
+class EventStore:
+    """
+    Append-only columnar event stream with a deque-like read interface.
+
+    Indexing and iteration return events as dicts ({"time": <epoch ms>, <field>: <value>, ...}), so code
+    written against the old deques of dicts keeps working. Object fields are returned by reference, so
+    in-place updates of the latest event's payload (e.g. adding a total to a scores dict) are kept.
+
+    Parameters
+    ----------
+    categorical : list of str, optional
+        Fields stored as interned codes.
+    fields : list of str, optional
+        Fields stored as objects.
+    """
+    def __init__(self, categorical=(), fields=()):
+        self.times = array('q')
+        self.codes = {name: array('i') for name in categorical}
+        self.labels = {name: [] for name in categorical}
+        self._interned = {name: {} for name in categorical}
+        self.columns = {name: [] for name in fields}
+        self._lock = threading.Lock()
+
+    def _intern(self, name, value):
+        table = self._interned[name]
+        if value not in table:
+            table[value] = len(self.labels[name])
+            self.labels[name].append(value)
+        return table[value]
+
+    def append(self, event):
+        """
+        Appends an event.
+
+        Parameters
+        ----------
+        event : dict
+            An event with "time" in epoch milliseconds and a value for every field (missing fields are None).
+        """
+        with self._lock:
+            for name in self.codes:
+                self.codes[name].append(self._intern(name, event.get(name)))
+            for name, column in self.columns.items():
+                column.append(event.get(name))
+            # The time column is appended last: its length is the number of complete events
+            self.times.append(int(event["time"]))
+
+    def extend(self, events):
+        for event in events:
+            self.append(event)
+
+    def __len__(self):
+        return len(self.times)
+
+    def _row(self, i):
+        row = {"time": self.times[i]}
+        for name, codes in self.codes.items():
+            row[name] = self.labels[name][codes[i]]
+        for name, column in self.columns.items():
+            row[name] = column[i]
+        return row
+
+    def __getitem__(self, i):
+        with self._lock:
+            n = len(self.times)
+            if i < 0:
+                i += n
+            if not 0 <= i < n:
+                raise IndexError("event index out of range")
+            return self._row(i)
+
+    def __iter__(self):
+        return iter(self.copy())
+
+    def copy(self):
+        """
+        A consistent snapshot of every event as a list of dicts.
+        """
+        with self._lock:
+            return [self._row(i) for i in range(len(self.times))]
+
+    def rows_from(self, start):
+        """
+        The events from index `start` on, oldest first.
+        """
+        with self._lock:
+            return [self._row(i) for i in range(start, len(self.times))]
+
+    def tail(self, n):
+        """
+        The last n events, oldest first.
+        """
+        with self._lock:
+            total = len(self.times)
+            return [self._row(i) for i in range(max(0, total - n), total)]
+
+    def _span(self, start_ms, end_ms):
+        lo = bisect.bisect_left(self.times, start_ms) if start_ms is not None else 0
+        hi = bisect.bisect_left(self.times, end_ms) if end_ms is not None else len(self.times)
+        return lo, hi
+
+    def between(self, start_ms=None, end_ms=None):
+        """
+        Events with start_ms <= time < end_ms (either bound may be None).
+        """
+        with self._lock:
+            lo, hi = self._span(start_ms, end_ms)
+            return [self._row(i) for i in range(lo, hi)]
+
+    def count_between(self, start_ms=None, end_ms=None):
+        """
+        Number of events with start_ms <= time < end_ms, without materializing them.
+        """
+        with self._lock:
+            lo, hi = self._span(start_ms, end_ms)
+            return hi - lo
+
+    def value_counts(self, name, start_ms=None, end_ms=None):
+        """
+        Counts of each label of a categorical field over a time range.
+        """
+        with self._lock:
+            lo, hi = self._span(start_ms, end_ms)
+            counts = {}
+            for code in self.codes[name][lo:hi]:
+                counts[code] = counts.get(code, 0) + 1
+            return {self.labels[name][code]: n for code, n in counts.items()}
+
+    def to_records(self):
+        """
+        Exports every event as a dict with "time" formatted as a Central Time string.
+        """
+        records = self.copy()
+        for record in records:
+            record["time"] = format_time(record["time"])
+        return records
+
+    def __repr__(self):
+        return f"EventStore({len(self)} events, fields={list(self.codes) + list(self.columns)})"
@@ -0,0 +1,122 @@
+from globals import Config
+import json
+import logging
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+"""
+Frame encoding for the C2STEM WebSocket channel.
+
+Clients may send either JSON text frames (the original protocol) or MessagePack binary frames with the
+same {"type": ..., "data": ...} structure. Each connection answers in the encoding of the last frame its
+client sent, so existing JSON clients are unaffected. Independently of the encoding, frames are
+compressed with the negotiated permessage-deflate extension (`Config.websocket_compression`).
+
+MessagePack support needs the `msgpack` package; without it, binary frames are answered with a JSON error.
+"""
+
+
+def deflate_extensions():
+    """
+    The server-side permessage-deflate settings for `websockets.serve`, or None when compression is disabled.
+    """
+    from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+    if not Config.websocket_compression:
+        return None
+    return [ServerPerMessageDeflateFactory(
+        server_max_window_bits=12,
+        compress_settings={"level": Config.websocket_compression_level, "memLevel": 5}
+    )]
+
+
+def serve_options():
+    """
+    Keyword arguments for `websockets.serve` that apply the compression settings.
+    """
+    extensions = deflate_extensions()
+    if extensions is None:
+        return {"compression": None}
+    return {"compression": "deflate", "extensions": extensions}
+
+
+def _payload_size(frame):
+    return len(frame.encode("utf-8")) if isinstance(frame, str) else len(frame)
+
+
+class FrameCodec:
+    """
+    Decodes and encodes the frames of one connection and counts its traffic.
+
+    Attributes
+    ----------
+    binary : bool
+        Whether the client last sent a MessagePack frame; replies use the same encoding.
+    stats : dict
+        Frames and payload bytes in each direction, counted before permessage-deflate compression
+        (text frames as UTF-8).
+    """
+    def __init__(self):
+        self.binary = False
+        self.stats = {"frames_in": 0, "bytes_in": 0, "frames_out": 0, "bytes_out": 0}
+
+    def decode(self, frame):
+        """
+        Parses a received frame.
+
+        Parameters
+        ----------
+        frame : str or bytes
+            A JSON text frame or a MessagePack binary frame.
+
+        Returns
+        -------
+        Any
+            The decoded message.
+
+        Raises
+        ------
+        ValueError
+            If the frame cannot be decoded (JSON and MessagePack decoding errors are ValueErrors).
+        """
+        self.stats["frames_in"] += 1
+        self.stats["bytes_in"] += _payload_size(frame)
+        if isinstance(frame, bytes):
+            if msgpack is None:
+                raise ValueError("MessagePack frames are not supported by this server (msgpack is not installed).")
+            self.binary = True
+            return msgpack.unpackb(frame, raw=False)
+        self.binary = False
+        return json.loads(frame)
+
+    def encode(self, message):
+        """
+        Encodes a message in the connection's current encoding.
+        """
+        if self.binary:
+            return msgpack.packb(message, use_bin_type=True)
+        return json.dumps(message)
+
+    async def send(self, websocket, message):
+        """
+        Encodes and sends a message.
+        """
+        await self.send_raw(websocket, self.encode(message))
+
+    async def send_raw(self, websocket, frame):
+        """
+        Sends an already-encoded frame (e.g. the plain-text chat window URL).
+        """
+        self.stats["frames_out"] += 1
+        self.stats["bytes_out"] += _payload_size(frame)
+        await websocket.send(frame)
+
+    def log_stats(self, session):
+        logging.info(
+            f"Session {session} traffic (uncompressed payload): {self.stats['bytes_in']} bytes in ({self.stats['frames_in']} frames), "
+            f"{self.stats['bytes_out']} bytes out ({self.stats['frames_out']} frames), "
+            f"encoding {'msgpack' if self.binary else 'json'}."
+        )
@@ -21,6 +21,78 @@ class Config:
     n_seconds = int(os.getenv("N_SECONDS"))
     n_rubric_scores = int(os.getenv("N_RUBRIC_SCORES"))
 
+    # Per-task LLM routing overrides (model_routing.py) and the API key for local OpenAI-compatible servers
+    model_routes_path = os.getenv("MODEL_ROUTES_PATH")
+    local_llm_api_key = os.getenv("LOCAL_LLM_API_KEY", "local")
+
+    # Rolling summary of turns truncated out of the prompt, built in the background with a cheaper model
+    summarization_enabled = os.getenv("SUMMARIZATION_ENABLED", "false").lower() == "true"
+    summary_model = os.getenv("SUMMARY_MODEL", model)
+    # Reasoning effort for SUMMARY_MODEL; empty for non-reasoning models (default "minimal" only when it is CHAT_MODEL)
+    summary_reasoning = os.getenv("SUMMARY_REASONING", "minimal" if os.getenv("SUMMARY_MODEL") is None else "") or None
+    conversation_summary_prompt_path = os.getenv("CONVERSATION_SUMMARY_PROMPT_PATH")
+
+    # Opt-in semantic cache of student-reply responses ("serve" returns the cached response, "draft" passes it to the model)
+    response_cache_enabled = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    response_cache_mode = os.getenv("RESPONSE_CACHE_MODE", "serve")
+    response_cache_threshold = float(os.getenv("RESPONSE_CACHE_THRESHOLD", 0.95))
+    response_cache_ttl = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+    response_cache_size = int(os.getenv("RESPONSE_CACHE_SIZE", 1000))
+    response_cache_mastery_step = float(os.getenv("RESPONSE_CACHE_MASTERY_STEP", 10))
+
+    # Rule-based strategy detection over raw C2STEM actions
+    strategy_rules_enabled = os.getenv("STRATEGY_RULES_ENABLED", "true").lower() == "true"
+    strategy_window_seconds = int(os.getenv("STRATEGY_WINDOW_SECONDS", 60))
+    run_action_types = [t.strip() for t in os.getenv("RUN_ACTION_TYPES", "greenFlag,runScripts").split(",") if t.strip()]
+    run_repeat_min = int(os.getenv("RUN_REPEAT_MIN", 3))
+    drafting_min = int(os.getenv("DRAFTING_MIN", 2))
+
+    # Sliding windows (seconds) for incremental learner activity features
+    feature_windows = [int(w) for w in os.getenv("FEATURE_WINDOWS", "30,60,300").split(",") if w.strip()]
+
+    # Servers: public WebSocket port, Gradio port, and multi-process workers routed by group id (supervisor.py)
+    websocket_port = int(os.getenv("WEBSOCKET_PORT", 8080))
+    gradio_port = int(os.getenv("GRADIO_PORT", 7860))
+    gradio_concurrency_limit = int(os.getenv("GRADIO_CONCURRENCY_LIMIT", 8))
+    gradio_max_queue_size = int(os.getenv("GRADIO_MAX_QUEUE_SIZE", 64))
+    workers = int(os.getenv("WORKERS", 1))
+    worker_base_port = int(os.getenv("WORKER_BASE_PORT", 8100))
+    hash_ring_replicas = int(os.getenv("HASH_RING_REPLICAS", 100))
+    worker_monitor_interval = float(os.getenv("WORKER_MONITOR_INTERVAL", 5))
+    worker_stop_timeout = float(os.getenv("WORKER_STOP_TIMEOUT", 10))
+
+    # Latest-wins coalescing of C2STEM "state"/"score" messages: at most one update per interval (seconds, 0 disables)
+    state_coalesce_interval = float(os.getenv("STATE_COALESCE_INTERVAL", 0.5))
+
+    # WebSocket framing: permessage-deflate compression (zlib level) for the C2STEM channel (framing.py)
+    websocket_compression = os.getenv("WEBSOCKET_COMPRESSION", "true").lower() == "true"
+    websocket_compression_level = int(os.getenv("WEBSOCKET_COMPRESSION_LEVEL", 6))
+
+    # Incremental session checkpoints for restart/crash recovery
+    checkpoint_enabled = os.getenv("CHECKPOINT_ENABLED", "false").lower() == "true"
+    checkpoint_dir = os.getenv("CHECKPOINT_DIR", "saved_chats/checkpoints")
+    checkpoint_interval = float(os.getenv("CHECKPOINT_INTERVAL", 15))
+    checkpoint_compact_every = int(os.getenv("CHECKPOINT_COMPACT_EVERY", 200))
+    checkpoint_max_age = float(os.getenv("CHECKPOINT_MAX_AGE", 3 * 3600))
+
+    # Logging: queue-based writer, format ("json" or "text"), per-category sampling and message size cap
+    log_level = os.getenv("LOG_LEVEL", "INFO")
+    log_format = os.getenv("LOG_FORMAT", "json")
+    log_path = os.getenv("LOG_PATH")
+    log_sample_rates = os.getenv("LOG_SAMPLE_RATES", "action=0.1,state=0.2,score=1.0")
+    log_max_chars = int(os.getenv("LOG_MAX_CHARS", 2000))
+    log_queue_size = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+    # Request tracing: spans per student turn and background cycle, written as Chrome trace-event JSON (tracing.py)
+    tracing_enabled = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    trace_dir = os.getenv("TRACE_DIR", "saved_chats/traces")
+    trace_sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+
+    # On-demand sampling profiler (profiler.py), toggled by SIGUSR2 or {"profile": ...} on the /admin WebSocket path
+    profiler_interval_ms = float(os.getenv("PROFILER_INTERVAL_MS", 10))
+    profiler_dir = os.getenv("PROFILER_DIR", "saved_chats/profiles")
+    profiler_max_seconds = float(os.getenv("PROFILER_MAX_SECONDS", 300))
+
     # Testing
     group = os.getenv("GROUP")
 
@@ -30,9 +102,79 @@ class Config:
     namespace = os.getenv("PINECONE_NAMESPACE")
     index_name = os.getenv("PINECONE_INDEX")
 
+    # Cross-session embedding request coalescing
+    embedding_batching_enabled = os.getenv("EMBEDDING_BATCHING_ENABLED", "true").lower() == "true"
+    embedding_batch_window_ms = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 10))
+    embedding_batch_max = int(os.getenv("EMBEDDING_BATCH_MAX", 256))
+
+    # Dense retrieval backend ("pinecone" or "local") and cross-session query batching
+    vector_backend = os.getenv("VECTOR_BACKEND", "pinecone")
+    query_batching_enabled = os.getenv("QUERY_BATCHING_ENABLED", "true").lower() == "true"
+    query_batch_window_ms = float(os.getenv("QUERY_BATCH_WINDOW_MS", 10))
+    query_batch_max = int(os.getenv("QUERY_BATCH_MAX", 64))
+
+    # Quantized memory-mapped store for the local backend (directory written by quantized_store.py)
+    vector_store_path = os.getenv("VECTOR_STORE_PATH")
+    vector_store_rescore = os.getenv("VECTOR_STORE_RESCORE", "true").lower() == "true"
+    rescore_factor = int(os.getenv("RESCORE_FACTOR", 4))
+
+    # Local lexical / hybrid retrieval ("dense", "lexical" or "hybrid")
+    retrieval_mode = os.getenv("RETRIEVAL_MODE", "dense")
+    knowledge_corpus_path = os.getenv("KNOWLEDGE_CORPUS_PATH")
+    lexical_confidence = float(os.getenv("LEXICAL_CONFIDENCE", 0.8))
+    hybrid_alpha = float(os.getenv("HYBRID_ALPHA", 0.5))
+
+    # Incremental knowledge ingestion (ingest.py)
+    knowledge_source_dir = os.getenv("KNOWLEDGE_SOURCE_DIR")
+    chunk_max_words = int(os.getenv("CHUNK_MAX_WORDS", 200))
+    ingest_batch_size = int(os.getenv("INGEST_BATCH_SIZE", 64))
+    ingest_workers = int(os.getenv("INGEST_WORKERS", 4))
+    ingest_embedding_timeout = float(os.getenv("INGEST_EMBEDDING_TIMEOUT", 60))
+    ingest_max_retries = int(os.getenv("INGEST_MAX_RETRIES", 5))
+
+    # Columnar export of saved sessions for analysis (session_export.py)
+    session_export_dir = os.getenv("SESSION_EXPORT_DIR", "saved_chats/columnar")
+    export_workers = int(os.getenv("EXPORT_WORKERS", os.cpu_count() or 4))
+
+    # Precomputed per-segment domain knowledge
+    knowledge_cache_enabled = os.getenv("KNOWLEDGE_CACHE_ENABLED", "true").lower() == "true"
+    knowledge_cache_top_k = int(os.getenv("KNOWLEDGE_CACHE_TOP_K", 3))
+    knowledge_cache_threshold = float(os.getenv("KNOWLEDGE_CACHE_THRESHOLD", 0.9))
+    knowledge_templates_path = os.getenv("KNOWLEDGE_TEMPLATES_PATH")
+    knowledge_analysis_cache_size = int(os.getenv("KNOWLEDGE_ANALYSIS_CACHE_SIZE", 256))
+
+    # Shared HTTP clients (OpenAI via httpx, Pinecone via urllib3)
+    http_timeout = float(os.getenv("HTTP_TIMEOUT", 60))
+    http_connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+    http_max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+    http_max_keepalive_connections = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+    http_keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+    pinecone_pool_threads = int(os.getenv("PINECONE_POOL_THREADS", 1))
+    pinecone_connection_pool_maxsize = int(os.getenv("PINECONE_CONNECTION_POOL_MAXSIZE", 20))
+
     # API call error handling
     backoff_factor = float(os.getenv("BACKOFF_FACTOR", 0.5))
     max_retries = int(os.getenv("MAX_RETRIES", 3))
 
+    # Tail-latency controls: per-call timeouts (seconds), hedged requests and circuit breakers
+    llm_timeout = float(os.getenv("LLM_TIMEOUT", 30))
+    embedding_timeout = float(os.getenv("EMBEDDING_TIMEOUT", 5))
+    retrieval_timeout = float(os.getenv("RETRIEVAL_TIMEOUT", 5))
+    hedge_enabled = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+    hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", 95))
+    hedge_min_samples = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+    breaker_failure_threshold = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+    breaker_reset_seconds = float(os.getenv("BREAKER_RESET_SECONDS", 30))
+    # Shared LLM rate limiter with priority classes (0 disables a limit)
+    llm_requests_per_minute = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 500))
+    llm_tokens_per_minute = int(os.getenv("LLM_TOKENS_PER_MINUTE", 200000))
+    llm_output_tokens_estimate = int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE", 800))
+    background_reserve_fraction = float(os.getenv("BACKGROUND_RESERVE_FRACTION", 0.2))
+    background_max_wait = float(os.getenv("BACKGROUND_MAX_WAIT", 10))
+    interactive_max_wait = float(os.getenv("INTERACTIVE_MAX_WAIT", 20))
+
+    embedding_cache_size = int(os.getenv("EMBEDDING_CACHE_SIZE", 256))
+    retrieval_cache_size = int(os.getenv("RETRIEVAL_CACHE_SIZE", 64))
+
     # GUI/Gradio
     hf_token = os.getenv("HF_TOKEN")
\ No newline at end of file
@@ -0,0 +1,277 @@
+from globals import Config
+from clients import get_openai_client
+from rag import RAG
+from quantized_store import write_store
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+"""
+Incremental ingestion of knowledge documents into the retrieval backends.
+
+Source documents (.txt / .md files under `Config.knowledge_source_dir`) are split into paragraph-packed
+chunks of at most `Config.chunk_max_words` words. Each chunk's id is the hash of its normalized text, so
+identical chunks are stored once and an edited chunk gets a new id. The JSONL knowledge corpus
+(`Config.knowledge_corpus_path`) doubles as the ingestion manifest: it records every chunk's id, text,
+source file and embedding. On each run:
+    - chunks whose id is already in the corpus reuse the stored embedding,
+    - new or changed chunks are embedded in batches of `Config.ingest_batch_size` on
+      `Config.ingest_workers` parallel workers, calling the embeddings API directly with their own timeout
+      and retries rather than through the interactive `RAG.get_embeddings` path (its short timeout,
+      cross-session batching and query cache are meant for student turns),
+    - new vectors are upserted and ids no longer produced by any source are deleted in Pinecone
+      ("pinecone" backend), the corpus is rewritten atomically for the local backend and BM25, and a new
+      version of the quantized store at `Config.vector_store_path` (if set) is published.
+
+The quantized store is never rewritten in place: `write_store` writes the new version to its own directory
+and atomically repoints the store's `current` link, so running servers keep reading the version they have
+memory-mapped, unchanged, and switch to the new one when they reopen the store on restart.
+
+Usage:
+    python ingest.py [--source <dir>] [--dry-run]
+"""
+
+source_extensions = (".txt", ".md")
+paragraph_pattern = re.compile(r"\n\s*\n")
+
+
+def chunk_hash(text):
+    """
+    Content hash used as the chunk id: whitespace and case differences do not produce a new chunk.
+    """
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+def chunk_document(text, max_words):
+    """
+    Splits a document into chunks of whole paragraphs with at most `max_words` words each. A paragraph
+    longer than `max_words` is split on word boundaries.
+
+    Parameters
+    ----------
+    text : str
+        Document text.
+    max_words : int
+        Maximum words per chunk.
+
+    Returns
+    -------
+    list of str
+        The chunks, in document order.
+    """
+    chunks = []
+    current = []
+    for paragraph in paragraph_pattern.split(text):
+        words = paragraph.split()
+        if not words:
+            continue
+        if current and len(current) + len(words) > max_words:
+            chunks.append(" ".join(current))
+            current = []
+        while len(words) > max_words:
+            chunks.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        current.extend(words)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def collect_chunks(source_dir):
+    """
+    Chunks every source document under a directory.
+
+    Parameters
+    ----------
+    source_dir : str
+        Directory searched recursively for .txt and .md files.
+
+    Returns
+    -------
+    dict
+        Chunk id -> {"id", "text", "source"}, in a stable order; duplicate chunks keep their first source.
+    """
+    chunks = {}
+    for root, _, files in sorted(os.walk(source_dir)):
+        for name in sorted(files):
+            if not name.endswith(source_extensions):
+                continue
+            path = os.path.join(root, name)
+            try:
+                with open(path, 'r', encoding="utf-8") as f:
+                    text = f.read()
+            except (IOError, UnicodeDecodeError) as e:
+                logging.error(f"Skipping unreadable knowledge source '{path}': {e}")
+                continue
+            source = os.path.relpath(path, source_dir)
+            for chunk in chunk_document(text, Config.chunk_max_words):
+                chunks.setdefault(chunk_hash(chunk), {"id": chunk_hash(chunk), "text": chunk, "source": source})
+    return chunks
+
+
+def load_manifest(corpus_path):
+    """
+    Reads the previous ingestion state from the corpus file.
+
+    Returns
+    -------
+    dict
+        Chunk id -> corpus record (with "embedding"), or empty if the corpus does not exist yet.
+    """
+    manifest = {}
+    if not corpus_path or not os.path.exists(corpus_path):
+        return manifest
+    with open(corpus_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                if record.get("embedding"):
+                    manifest[str(record["id"])] = record
+            except (json.JSONDecodeError, KeyError) as e:
+                logging.error(f"Skipping malformed knowledge corpus line in '{corpus_path}': {e}")
+    return manifest
+
+
+def embed_batch(texts):
+    """
+    Embeds one batch of chunk texts, retrying with exponential backoff.
+
+    Parameters
+    ----------
+    texts : list of str
+        Chunk texts.
+
+    Returns
+    -------
+    list of list of float or None
+        One embedding per text, or None if every attempt failed.
+    """
+    import openai
+
+    for i in range(Config.ingest_max_retries):
+        try:
+            res = get_openai_client().embeddings.create(input=texts, model=Config.embedding_model, timeout=Config.ingest_embedding_timeout)
+            return [r.embedding for r in res.data]
+        except openai.APIError as e:
+            logging.error(f"OpenAI API error embedding {len(texts)} knowledge chunks: {e}, retry {i+1}/{Config.ingest_max_retries}")
+            time.sleep(Config.backoff_factor * (2 ** i))
+    return None
+
+
+def embed_chunks(chunks):
+    """
+    Embeds chunks in batches on parallel workers.
+
+    Parameters
+    ----------
+    chunks : list of dict
+        Chunks with key "text".
+
+    Returns
+    -------
+    list of list of float or None
+        One embedding per chunk, or None if any batch failed after all retries.
+    """
+    batches = [chunks[start:start + Config.ingest_batch_size] for start in range(0, len(chunks), Config.ingest_batch_size)]
+    with ThreadPoolExecutor(max_workers=Config.ingest_workers, thread_name_prefix="ingest") as pool:
+        results = list(pool.map(lambda batch: embed_batch([c["text"] for c in batch]), batches))
+    if any(r is None for r in results):
+        return None
+    return [embedding for batch in results for embedding in batch]
+
+
+def _write_corpus(corpus_path, records):
+    """
+    Atomically rewrites the JSONL corpus so readers never see a partial file.
+    """
+    directory = os.path.dirname(os.path.abspath(corpus_path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{corpus_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, corpus_path)
+
+
+def _sync_pinecone(new_records, stale_ids):
+    """
+    Upserts new chunk vectors and deletes stale ids in the configured Pinecone namespace.
+    """
+    index = RAG().index
+    for start in range(0, len(new_records), Config.ingest_batch_size):
+        batch = new_records[start:start + Config.ingest_batch_size]
+        index.upsert(
+            vectors=[{"id": r["id"], "values": r["embedding"], "metadata": {"text": r["text"], "source": r["source"]}} for r in batch],
+            namespace=Config.namespace
+        )
+    for start in range(0, len(stale_ids), 1000):
+        index.delete(ids=stale_ids[start:start + 1000], namespace=Config.namespace)
+    logging.info(f"Upserted {len(new_records)} and deleted {len(stale_ids)} vectors in Pinecone namespace '{Config.namespace}'.")
+
+
+def ingest(source_dir, corpus_path, dry_run=False):
+    """
+    Brings the retrieval backends in line with the source documents, embedding only new or changed chunks.
+
+    Parameters
+    ----------
+    source_dir : str
+        Directory of source documents.
+    corpus_path : str
+        The JSONL corpus / manifest to read and rewrite.
+    dry_run : bool, optional
+        Only compute and report the changes, by default False.
+
+    Returns
+    -------
+    dict or None
+        Counts of "chunks", "new", "unchanged" and "stale" chunks, or None if embedding failed (nothing is written).
+    """
+    chunks = collect_chunks(source_dir)
+    manifest = load_manifest(corpus_path)
+
+    new = [c for chunk_id, c in chunks.items() if chunk_id not in manifest]
+    stale_ids = [chunk_id for chunk_id in manifest if chunk_id not in chunks]
+    stats = {"chunks": len(chunks), "new": len(new), "unchanged": len(chunks) - len(new), "stale": len(stale_ids)}
+    logging.info(f"Knowledge ingestion plan: {stats}.")
+    if dry_run or (not new and not stale_ids):
+        return stats
+
+    embeddings = embed_chunks(new)
+    if embeddings is None:
+        logging.error("Knowledge ingestion aborted: failed to embed new chunks; the existing corpus is unchanged.")
+        return None
+    for chunk, embedding in zip(new, embeddings):
+        chunk["embedding"] = embedding
+
+    records = [manifest.get(chunk_id, chunk) for chunk_id, chunk in chunks.items()]
+    if Config.vector_backend != "local":
+        _sync_pinecone(new, stale_ids)
+    _write_corpus(corpus_path, records)
+    if Config.vector_store_path and records:
+        # Publishes a new store version; mapped readers keep the previous version's files
+        write_store(Config.vector_store_path, [r["id"] for r in records], [r["text"] for r in records], [r["embedding"] for r in records])
+    logging.info(f"Successfully ingested knowledge base into '{corpus_path}': {stats}.")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incrementally ingest knowledge documents into the retrieval backends.")
+    parser.add_argument("--source", default=Config.knowledge_source_dir, help="Directory of .txt/.md source documents")
+    parser.add_argument("--corpus", default=Config.knowledge_corpus_path, help="JSONL corpus / manifest path")
+    parser.add_argument("--dry-run", action="store_true", help="Report new, unchanged and stale chunks without writing")
+    args = parser.parse_args()
+
+    if not args.source or not args.corpus:
+        parser.error("a source directory and corpus path are required (KNOWLEDGE_SOURCE_DIR / KNOWLEDGE_CORPUS_PATH)")
+    ingest(args.source, args.corpus, dry_run=args.dry_run)
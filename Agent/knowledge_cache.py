@@ -0,0 +1,158 @@
+from globals import Config
+from learner_model import LearnerModel
+from collections import OrderedDict
+import json
+import logging
+import math
+import threading
+
+class KnowledgeCache:
+    """
+    Process-wide cache of domain-knowledge passages precomputed for each task segment and for
+    common recommendation templates.
+
+    Groups in the same segment usually need the same material, so the passages for every segment
+    in `LearnerModel.task_contexts_map` (and for each query in the optional templates file at
+    `Config.knowledge_templates_path`) are retrieved once, in one embedding batch, and reused by
+    every session. Live retrieval is only needed when a session's recommended query is not close
+    to any cached one.
+
+    It also remembers recent domain-knowledge analyses by student model, so groups with identical
+    models (typically the starter project early in a class) share one LLM analysis.
+
+    Attributes
+    ----------
+    entries : dict
+        Maps a key ("segment:<name>" or "template:<i>") to a dict with "query", "embedding", "norm" and "knowledge".
+    ready : bool
+        Whether `precompute` has completed.
+    analyses : OrderedDict
+        LRU map of student model text to its (summary, recommended query) analysis.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.ready = False
+        self.analyses = OrderedDict()
+        self._lock = threading.Lock()
+        self._analyses_lock = threading.Lock()
+
+    def _load_templates(self):
+        if not Config.knowledge_templates_path:
+            return []
+        try:
+            with open(Config.knowledge_templates_path, 'r') as f:
+                return [t for t in json.load(f) if isinstance(t, str) and t.strip()]
+        except (FileNotFoundError, IOError, json.JSONDecodeError) as e:
+            logging.error(f"Error loading knowledge templates from '{Config.knowledge_templates_path}': {e}")
+            return []
+
+    def precompute(self, rag):
+        """
+        Retrieves and caches the top-k passages for every segment and template. Runs once per process.
+
+        Parameters
+        ----------
+        rag : RAG
+            The RAG instance used for embedding and retrieval.
+        """
+        with self._lock:
+            if self.ready:
+                return
+            queries = {f"segment:{segment}": context for segment, context in LearnerModel.task_contexts_map.items()}
+            for i, template in enumerate(self._load_templates()):
+                queries[f"template:{i}"] = template
+
+            keys = list(queries.keys())
+            embeddings = rag.get_embeddings([queries[k] for k in keys])
+            if embeddings is None:
+                logging.error("Failed to precompute domain knowledge cache: embeddings unavailable.")
+                return
+
+            for key, embedding in zip(keys, embeddings):
+                result = rag.retrieve(embedding, Config.knowledge_cache_top_k)
+                if result is None or not result.get("matches"):
+                    logging.error(f"No passages retrieved while precomputing domain knowledge for '{key}'.")
+                    continue
+                self.entries[key] = {
+                    "query": queries[key],
+                    "embedding": embedding,
+                    "norm": math.sqrt(sum(x * x for x in embedding)) or 1.0,
+                    "knowledge": "\n\n".join([m["metadata"]["text"] for m in result["matches"]])
+                }
+            self.ready = True
+            logging.info(f"Precomputed domain knowledge cache with {len(self.entries)} entries.")
+
+    def for_segment(self, segment):
+        """
+        Returns the cached passages for a task segment, or None if not cached.
+        """
+        entry = self.entries.get(f"segment:{segment}")
+        return entry["knowledge"] if entry else None
+
+    def lookup(self, query):
+        """
+        Returns (cache key, passages) for a cached query with the same text (ignoring case and
+        whitespace), or None. Checked before `match` so a repeated query needs no embedding call.
+        """
+        normalized = " ".join(query.lower().split())
+        for key, entry in list(self.entries.items()):
+            if " ".join(entry["query"].lower().split()) == normalized:
+                return key, entry["knowledge"]
+        return None
+
+    def analysis(self, user_model):
+        """
+        Returns the remembered (summary, recommended query) for a student model, or None.
+        """
+        with self._analyses_lock:
+            result = self.analyses.get(user_model)
+            if result is not None:
+                self.analyses.move_to_end(user_model)
+            return result
+
+    def remember_analysis(self, user_model, summary, query):
+        """
+        Remembers the analysis of a student model, evicting the least recently used beyond
+        `Config.knowledge_analysis_cache_size`.
+        """
+        with self._analyses_lock:
+            self.analyses[user_model] = (summary, query)
+            self.analyses.move_to_end(user_model)
+            while len(self.analyses) > Config.knowledge_analysis_cache_size:
+                self.analyses.popitem(last=False)
+
+    def match(self, embedding):
+        """
+        Returns the cached passages whose query is closest to `embedding`, if close enough.
+
+        Parameters
+        ----------
+        embedding : list of float
+            Embedding of the recommended domain-knowledge query.
+
+        Returns
+        -------
+        tuple of (str, str) or None
+            (cache key, passages) if the best cosine similarity is at least
+            `Config.knowledge_cache_threshold`, otherwise None.
+        """
+        norm = math.sqrt(sum(x * x for x in embedding)) or 1.0
+        best_key, best_score = None, -1.0
+        for key, entry in list(self.entries.items()):
+            score = sum(a * b for a, b in zip(embedding, entry["embedding"])) / (norm * entry["norm"])
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_key is not None and best_score >= Config.knowledge_cache_threshold:
+            logging.info(f"Domain knowledge cache hit '{best_key}' (similarity {best_score:.3f}).")
+            return best_key, self.entries[best_key]["knowledge"]
+        return None
+
+
+_cache = KnowledgeCache()
+
+
+def get_knowledge_cache():
+    """
+    Returns the process-wide domain knowledge cache shared by every session.
+    """
+    return _cache
@@ -0,0 +1,172 @@
+from globals import Config
+from collections import Counter, deque
+import threading
+import time
+
+class ActivityFeatures:
+    """
+    Incremental sliding-window feature counters over ingested C2STEM actions.
+
+    Each ingested action is added to every window in O(1) and evicted once it falls out of the
+    window, so reading features never rescans `LearnerModel.raw_actions`. Prompt builders, the
+    strategy detector and dashboards read `snapshot(window_seconds)` instead.
+
+    Attributes
+    ----------
+    windows : list of int
+        Window lengths in seconds (`Config.feature_windows` plus `Config.strategy_window_seconds`).
+    last_run_ms : int or None
+        Time of the most recent green-flag run.
+    edits_since_last_run : int
+        Edit actions since the most recent run.
+    consecutive_runs : int
+        Runs since the most recent edit.
+    """
+
+    tool_action_types = {"tableDialog", "graphDialog"}
+    edit_action_types = {"addBlock", "moveBlock", "setField", "setBlockPosition", "removeBlock"}
+
+    def __init__(self):
+        self.windows = sorted(set(Config.feature_windows) | {Config.strategy_window_seconds})
+        self.run_action_types = set(Config.run_action_types)
+        self._lock = threading.Lock()
+        self._state = {w: self._empty_window() for w in self.windows}
+
+        self.total_actions = 0
+        self.last_run_ms = None
+        self.edits_since_last_run = 0
+        self.consecutive_runs = 0
+
+    def _empty_window(self):
+        return {
+            "events": deque(),
+            "action_counts": Counter(),
+            "block_counts": Counter(),
+            "edits": 0,
+            "runs": 0,
+            "tool_uses": 0,
+            "unattached_adds": 0,
+            "edits_before_runs": 0
+        }
+
+    @staticmethod
+    def is_unattached_add(action):
+        """
+        Whether an `addBlock` action dropped the block loose in the scripting area.
+
+        NetsBlox sends numeric x/y coordinates (args[2], args[3]) for blocks placed at a position,
+        and a target description instead when the block is snapped onto an existing script.
+        """
+        if action.action_type != "addBlock":
+            return False
+        args = action.data.get("args", [])
+        return len(args) >= 4 and isinstance(args[2], (int, float)) and isinstance(args[3], (int, float))
+
+    def _apply(self, state, event, sign):
+        t, action_type, block, is_edit, is_run, is_tool, is_unattached, edit_streak = event
+        state["action_counts"][action_type] += sign
+        if state["action_counts"][action_type] == 0:
+            del state["action_counts"][action_type]
+        if block:
+            state["block_counts"][block] += sign
+            if state["block_counts"][block] == 0:
+                del state["block_counts"][block]
+        state["edits"] += sign * is_edit
+        state["runs"] += sign * is_run
+        state["tool_uses"] += sign * is_tool
+        state["unattached_adds"] += sign * is_unattached
+        state["edits_before_runs"] += sign * edit_streak
+
+    def _evict(self, window, now_ms):
+        state = self._state[window]
+        cutoff = now_ms - window * 1000
+        events = state["events"]
+        while events and events[0][0] < cutoff:
+            self._apply(state, events.popleft(), -1)
+
+    def ingest(self, t_ms, action):
+        """
+        Adds one action to every window.
+
+        Parameters
+        ----------
+        t_ms : int
+            Arrival time of the action in epoch milliseconds.
+        action : C2STEMAction
+            The parsed action.
+        """
+        is_run = action.action_type in self.run_action_types
+        is_edit = action.action_type in self.edit_action_types
+        is_tool = action.action_type in self.tool_action_types
+        is_unattached = self.is_unattached_add(action)
+
+        with self._lock:
+            self.total_actions += 1
+            # Number of edits that preceded this run, so windows can report edits per run
+            edit_streak = 0
+            if is_run:
+                edit_streak = self.edits_since_last_run
+                self.last_run_ms = t_ms
+                self.edits_since_last_run = 0
+                self.consecutive_runs += 1
+            elif is_edit:
+                self.edits_since_last_run += 1
+                self.consecutive_runs = 0
+
+            event = (t_ms, action.action_type, getattr(action, "block", ""), int(is_edit), int(is_run), int(is_tool), int(is_unattached), edit_streak)
+            for window in self.windows:
+                state = self._state[window]
+                state["events"].append(event)
+                self._apply(state, event, 1)
+                self._evict(window, t_ms)
+
+    def snapshot(self, window_seconds, now_ms=None):
+        """
+        Returns the precomputed features for one window.
+
+        Parameters
+        ----------
+        window_seconds : int
+            One of `windows`.
+        now_ms : int, optional
+            Current time in epoch milliseconds, by default the wall clock.
+
+        Returns
+        -------
+        dict
+            "actions", "action_counts", "block_counts", "edits", "runs", "tool_uses", "unattached_adds",
+            "edit_to_test_ratio" (edits per run, or None without runs), "mean_edits_between_runs",
+            plus the window-independent "time_since_last_run_s", "edits_since_last_run" and "consecutive_runs".
+
+        Raises
+        ------
+        KeyError
+            If `window_seconds` is not a tracked window.
+        """
+        if now_ms is None:
+            now_ms = int(time.time()*1000)
+        with self._lock:
+            self._evict(window_seconds, now_ms)
+            state = self._state[window_seconds]
+            runs = state["runs"]
+            return {
+                "window_seconds": window_seconds,
+                "actions": len(state["events"]),
+                "action_counts": dict(state["action_counts"]),
+                "block_counts": dict(state["block_counts"]),
+                "edits": state["edits"],
+                "runs": runs,
+                "tool_uses": state["tool_uses"],
+                "unattached_adds": state["unattached_adds"],
+                "edit_to_test_ratio": state["edits"] / runs if runs else None,
+                "mean_edits_between_runs": state["edits_before_runs"] / runs if runs else None,
+                "time_since_last_run_s": (now_ms - self.last_run_ms) / 1000 if self.last_run_ms is not None else None,
+                "edits_since_last_run": self.edits_since_last_run,
+                "consecutive_runs": self.consecutive_runs
+            }
+
+    def snapshot_all(self, now_ms=None):
+        """
+        Returns `snapshot` for every tracked window, keyed by window length in seconds.
+        """
+        return {w: self.snapshot(w, now_ms) for w in self.windows}
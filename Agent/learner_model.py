@@ -1,7 +1,6 @@
-from collections import deque
 from globals import Config
-import datetime
-import pytz
+from event_store import EventStore, now_ms
+from learner_features import ActivityFeatures
 
 class LearnerModel:
     """
@@ -12,20 +11,29 @@ class LearnerModel:
     ----------
     user_model : str
         A string representing the students' current computational model in C2STEM.
-    raw_actions : deque
-        A deque of the actions taken by the student in the C2STEM environment. 
-        Each action is represented as a dictionary with keys "time", "type", and "block".
-    action_groups : deque
-        A deque of the action groups taken by the student with keys "time" and "action".
-    model_scores: deque
-        A deque of the model scores with keys "time" and "scores", where "scores" is a dictionary of individual scores and a "total_score".
-    task_contexts: deque
-        A deque of the task contexts with keys "time" and "segment", where "segment" is a string representing the current task segment.
-    strategies: deque
-        A deque of strategies used by the student with keys "time" and "strategy", where "strategy" is a string representing the strategy used.
+    raw_actions : EventStore
+        The actions taken by the student in the C2STEM environment, with keys "time" and "action".
+    features : ActivityFeatures
+        Incremental sliding-window counters over `raw_actions`, updated by `record_action`.
+    action_groups : EventStore
+        The action groups taken by the student with keys "time" and "action".
+    model_scores: EventStore
+        The model scores with keys "time" and "scores", where "scores" is a dictionary of individual scores and a "total_score".
+    task_contexts: EventStore
+        The task contexts with keys "time" and "segment", where "segment" is a string representing the current task segment.
+    strategies: EventStore
+        The strategies used by the student with keys "time" and "strategy", where "strategy" is a string representing the strategy used.
+    learner_state: EventStore
+        The learner state classifications with keys "time", "summary" and "learner_state".
+    needed_domain_knowledge: EventStore
+        The domain knowledge recommendations with keys "time", "summary", "recommended_domain_knowledge" and "knowledge".
+
+    All "time" values are epoch milliseconds; they are formatted as Central Time only on export.
     
     Methods
     -------
+    record_action(time, action)
+        Appends an action to `raw_actions` and updates the activity features.
     print_model_state()
         Prints the current state of the C2STEM model.
     print_raw_actions()
@@ -49,24 +57,55 @@ class LearnerModel:
         "updating-variables-under-conditons":"Students are updating variables within the conditional statements. For cruising, they must set acceleration to zero. For decelerating, they must set acceleration to -4. For stopping, they must stop the simulation."
     }
 
+    # Column layout of each event stream: (categorical fields, object fields)
+    stream_columns = {
+        "raw_actions": ([], ["action"]),
+        "action_groups": ([], ["action"]),
+        "model_scores": ([], ["scores"]),
+        "task_contexts": (["segment"], []),
+        "strategies": (["strategy"], []),
+        "learner_state": (["learner_state"], ["summary"]),
+        "needed_domain_knowledge": ([], ["summary", "recommended_domain_knowledge", "knowledge"])
+    }
+
     def __init__(self):
-        utc_now = datetime.datetime.now(pytz.utc)
-        central_tz = pytz.timezone('America/Chicago')
-        central_now = utc_now.astimezone(central_tz)
-        formatted_time = central_now.strftime('%Y-%m-%d %H:%M:%S %Z%z')
+        created = now_ms()
 
         self.user_model = ""
-        self.raw_actions = deque()
-        self.action_groups = deque()
-        self.model_scores = deque()
-        self.task_contexts = deque()
-        self.strategies = deque()
+        self.raw_actions = self.new_stream("raw_actions")
+        self.features = ActivityFeatures()
+        self.action_groups = self.new_stream("action_groups")
+        self.model_scores = self.new_stream("model_scores")
+        self.task_contexts = self.new_stream("task_contexts")
+        self.strategies = self.new_stream("strategies")
+
+        self.learner_state = self.new_stream("learner_state")
+        self.learner_state.append({"time":created,"summary":"Initial learner state.","learner_state":"STARTING"})
+
+        self.needed_domain_knowledge = self.new_stream("needed_domain_knowledge")
+        self.needed_domain_knowledge.append({"time":created,"summary":"Initial domain knowledge needed.","recommended_domain_knowledge":"Students should start by initializing variables","knowledge":"Students must begin by initializing variables under the [When Green Flag Clicked] block."})
 
-        self.learner_state = deque()
-        self.learner_state.append({"time":formatted_time,"summary":"Initial learner state.","learner_state":"STARTING"})
+    @classmethod
+    def new_stream(cls, name):
+        """
+        Returns an empty EventStore with the column layout of the named stream.
+        """
+        categorical, fields = cls.stream_columns[name]
+        return EventStore(categorical=categorical, fields=fields)
 
-        self.needed_domain_knowledge = deque()
-        self.needed_domain_knowledge.append({"time":formatted_time,"summary":"Initial domain knowledge needed.","recommended_domain_knowledge":"Students should start by initializing variables","knowledge":"Students must begin by initializing variables under the [When Green Flag Clicked] block."})
+    def record_action(self, time, action):
+        """
+        Records a parsed C2STEM action.
+
+        Parameters
+        ----------
+        time : int
+            Arrival time in epoch milliseconds.
+        action : C2STEMAction
+            The parsed action.
+        """
+        self.raw_actions.append({"time":time,"action":action})
+        self.features.ingest(time, action)
 
     # Print the current C2STEM model state
     def print_model_state(self):
@@ -82,7 +121,7 @@ class LearnerModel:
         """
         Prints the list of actions taken by the student in the C2STEM environment.
 
-        This method outputs all actions recorded in the `raw_actions` deque.
+        This method outputs all actions recorded in `raw_actions`.
         """
         print("Actions taken by the student:")
         for action in self.raw_actions:
@@ -93,7 +132,7 @@ class LearnerModel:
         Converts the action groups to a string representation.
 
         This method concatenates the string representations of all action groups
-        in the `action_groups` deque, separated by newlines.
+        in `action_groups`, separated by newlines.
 
         Returns
         -------
@@ -0,0 +1,146 @@
+from collections import Counter, defaultdict
+import json
+import logging
+import math
+import re
+
+"""
+Local BM25 inverted index over the domain knowledge passages.
+
+The corpus is a JSONL file (`Config.knowledge_corpus_path`) with one passage per line:
+    {"id": "<passage id>", "text": "<passage text>", "embedding": [<optional floats>]}
+using the same ids and text as the vector store, so lexical and dense results can be fused.
+The optional embeddings back the local dense index in `vector_index.py`.
+"""
+
+token_pattern = re.compile(r"[a-z0-9_]+")
+
+# Function words that carry no retrieval signal in this corpus
+stop_words = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it", "of", "on",
+    "or", "that", "the", "their", "they", "this", "to", "was", "what", "when", "with", "students", "student"
+}
+
+
+def tokenize(text):
+    """
+    Lowercases and splits text into terms, keeping underscores so identifiers such as `delta_t`
+    and `start_simulation` stay whole. Adjacent-word bigrams are added so phrases such as
+    "change by" and "speed limit" can match as units.
+
+    Parameters
+    ----------
+    text : str
+        Text to tokenize.
+
+    Returns
+    -------
+    list of str
+        Unigram terms (stop words removed) followed by bigram terms.
+    """
+    words = token_pattern.findall(text.lower())
+    bigrams = [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return [w for w in words if w not in stop_words] + bigrams
+
+
+def load_corpus(path, with_embeddings=False):
+    """
+    Loads knowledge passages from a JSONL corpus file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the JSONL file.
+    with_embeddings : bool, optional
+        Also keep each line's "embedding" field (lines without one are skipped), by default False.
+
+    Returns
+    -------
+    list of dict
+        Passages with keys "id" and "text" (and "embedding" if requested). Malformed lines are skipped.
+    """
+    passages = []
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    passage = {"id": str(record["id"]), "text": record["text"]}
+                    if with_embeddings:
+                        passage["embedding"] = record["embedding"]
+                    passages.append(passage)
+                except (json.JSONDecodeError, KeyError) as e:
+                    logging.error(f"Skipping malformed knowledge corpus line in '{path}': {e}")
+    except (FileNotFoundError, IOError) as e:
+        logging.error(f"Error loading knowledge corpus from '{path}': {e}")
+    return passages
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a list of passages.
+
+    Parameters
+    ----------
+    passages : list of dict
+        Passages with keys "id" and "text".
+    k1 : float, optional
+        Term-frequency saturation, by default 1.5.
+    b : float, optional
+        Length normalization, by default 0.75.
+    """
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+
+        for i, passage in enumerate(passages):
+            counts = Counter(tokenize(passage["text"]))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+
+        n = len(passages)
+        self.avg_length = (sum(self.doc_lengths) / n) if n else 0.0
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+
+    def search(self, query, k):
+        """
+        Returns the top-k passages for a query.
+
+        Parameters
+        ----------
+        query : str
+            Query text.
+        k : int
+            Number of passages to return.
+
+        Returns
+        -------
+        list of tuple
+            (passage index, BM25 score, coverage) sorted by score, where coverage is the share of the
+            query's words (stop words excluded) that appear in the passage, used as a confidence signal.
+        """
+        query_terms = set(tokenize(query))
+        words = {t for t in query_terms if " " not in t}
+        terms = [t for t in query_terms if t in self.postings]
+        if not terms or not words:
+            return []
+
+        scores = defaultdict(float)
+        matched = defaultdict(int)
+        for term in terms:
+            idf = self.idf[term]
+            for i, tf in self.postings[term]:
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / self.avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / norm
+                if term in words:
+                    matched[i] += 1
+
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(i, score, matched[i] / len(words)) for i, score in top]
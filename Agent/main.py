@@ -2,11 +2,17 @@ from agent import Agent
 from globals import Config
 import asyncio
 import websockets
-import json
 from c2stem_state import C2STEMState
 import logging
 import threading
 from c2stem_action import C2STEMAction
+from supervisor import connection_group, connection_path, is_local_connection, run_supervisor
+from profiler import install_signal_handler, profile_command
+from urllib.parse import urlparse
+import json
+from structured_logging import configure_logging
+from session_mailbox import LatestWinsMailbox
+from framing import FrameCodec, serve_options
 import time
 
 """
@@ -17,9 +23,97 @@ The file listens to the messages on websocket and saves them to userState.
 """
 
 #  Global variables and data structure
-chat_window_URL = "URL= http://127.0.0.1:7860",
-computational_model_state = C2STEMState()
-agent = Agent(use_gui=True)
+# One agent and one model state per group served by this process (see supervisor.py for multi-process routing)
+agents = {}
+computational_model_states = {}
+agent_lock = threading.Lock()
+background_loops_started = False
+# Set by supervisor.run_worker: agents are then only created for groups the supervisor routes here
+worker_mode = False
+
+
+def chat_window_url(group):
+    # Gradio's default port unless this process is one of several workers; the group id maps the
+    # browser session to the group's agent
+    return f"URL= http://127.0.0.1:{Config.gradio_port}/?group={group}"
+
+
+def get_agent(group=None):
+    """
+    Returns the agent for a group, constructing it on first use.
+
+    The agent is not built at import time so that importing this module (e.g. from
+    analysis scripts or the startup report) does not pay for agent initialization.
+    With `Config.checkpoint_enabled`, the session state from the last checkpoint is restored and
+    periodic checkpointing is started.
+
+    Parameters
+    ----------
+    group : str, optional
+        The group id, by default `Config.group`.
+
+    Returns
+    -------
+    Agent
+        The group's agent in this process.
+    """
+    group = str(group if group is not None else (Config.group or "0"))
+    # The WebSocket thread and the main thread can both ask for an agent at startup
+    with agent_lock:
+        if group not in agents:
+            agent = Agent(use_gui=True, group=group)
+            if Config.checkpoint_enabled:
+                agent.checkpointer.restore()
+                agent.checkpointer.start()
+            # Groups that connect after startup get their own background loops
+            if background_loops_started:
+                agent.start_strategy_generation()
+                agent.start_domain_knowledge_retrieval()
+            agents[group] = agent
+            computational_model_states[group] = C2STEMState()
+    return agents[group]
+
+
+def existing_agent(group):
+    """
+    Returns the group's agent if this process has one, without creating it.
+    """
+    with agent_lock:
+        return agents.get(str(group if group is not None else (Config.group or "0")))
+
+
+def flush_checkpoints():
+    """
+    Stops checkpointing and writes a final checkpoint for every agent in this process.
+    """
+    if not Config.checkpoint_enabled:
+        return
+    with agent_lock:
+        group_agents = list(agents.values())
+    for agent in group_agents:
+        agent.checkpointer.stop()
+
+
+def install_shutdown_handler():
+    """
+    On SIGTERM (e.g. a drained worker being stopped), flushes every agent's checkpoint and the log writer,
+    then exits. Must be called from the main thread; a no-op where SIGTERM cannot be handled.
+    """
+    import os
+    import signal
+    from structured_logging import stop_logging
+
+    if not hasattr(signal, "SIGTERM") or threading.current_thread() is not threading.main_thread():
+        return
+
+    def shutdown(signum, frame):
+        logging.info("Received SIGTERM; writing final session checkpoints.")
+        flush_checkpoints()
+        stop_logging()
+        # The Gradio and WebSocket threads never return on their own, so exit without waiting for them
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
 
 
 async def initialize_agent_server():
@@ -36,9 +130,60 @@ async def initialize_agent_server():
     Exception
         If an error occurs while sending the URL or initializing the agent server.
     """
-    agent.start_strategy_generation()
-    agent.start_domain_knowledge_retrieval()
-    agent.talk()
+    global background_loops_started
+    if worker_mode:
+        # No default agent: groups get agents (and background loops) when the supervisor routes them here
+        with agent_lock:
+            background_loops_started = True
+        Agent.launch_gui(agent_for_group=existing_agent)
+        return
+
+    agent = get_agent()
+    with agent_lock:
+        for group_agent in agents.values():
+            group_agent.start_strategy_generation()
+            group_agent.start_domain_knowledge_retrieval()
+        background_loops_started = True
+    agent.talk(agent_for_group=get_agent)
+
+
+def apply_state(agent, computational_model_state, data):
+    """
+    Applies a computational model snapshot to the group's state and learner model if it changed.
+    """
+    new_state = str(data)
+    if new_state != computational_model_state.user_model:
+        computational_model_state.set_user_model(new_state)
+        agent.learner_model.user_model = computational_model_state.user_model
+        logging.info("User model updated (%d chars).", len(new_state), extra={"category": "state"})
+        logging.debug("User model updated: %s", agent.learner_model.user_model, extra={"category": "state"})
+
+
+def apply_score(agent, time_now, data):
+    """
+    Records a model score message, adding the "total_score" of the rubric scores.
+    """
+    agent.learner_model.model_scores.append({"time":time_now,"scores":data})
+    total_score_values = [v for k, v in data.items() if k not in {"physics_mastery","computing_mastery","overall_mastery"}]
+    agent.learner_model.model_scores[-1]["scores"]["total_score"] = sum(total_score_values)
+    logging.info("User Action Score Updated: %s", agent.learner_model.model_scores[-1]['scores']['total_score'], extra={"category": "score"})
+
+
+async def admin(websocket):
+    """
+    Handles local admin commands for this process: {"profile": "start" | "stop" | "status"} (see profiler.py).
+    """
+    if not is_local_connection(websocket):
+        await websocket.close(code=1008, reason="Admin commands are only accepted locally")
+        return
+    async for message in websocket:
+        try:
+            command = json.loads(message)
+            # Stopping joins the sampler and writes the profile; keep that off the event loop
+            status = await asyncio.to_thread(profile_command, command)
+            await websocket.send(json.dumps({"type": "profile", "data": status}))
+        except (json.JSONDecodeError, TypeError, ValueError, AttributeError) as e:
+            await websocket.send(json.dumps({"type": "error", "data": f"Invalid admin command: {e}"}))
 
 
 # Message handler for incoming message over the WebSocket.
@@ -47,11 +192,13 @@ async def handler(websocket):
     Handles incoming WebSocket messages and maintains the user state.
 
     This function manages communication over a WebSocket connection. It:
-    1. Establishes a new connection and assigns it to the `user_state`.
+    1. Establishes a new connection for the group given in the connection URL (`?group=<id>`)
+       and assigns it to that group's `user_state`.
     2. Sends chat window URL to the client.
     3. Initializes the agent server for the connection.
     4. Processes incoming messages, which may include actions, user state updates, 
-       or other types, and appropriately updates the `user_state`.
+       or other types, and appropriately updates the `user_state`. "state" and "score" messages go
+       through a latest-wins mailbox and are applied at most once per `Config.state_coalesce_interval`.
 
     Parameters
     ----------
@@ -67,66 +214,83 @@ async def handler(websocket):
 
     Notes
     -----
-    - Incoming messages are expected to be JSON formatted.
+    - Incoming messages are expected to be JSON text frames or MessagePack binary frames (see framing.py);
+      replies use the encoding of the client's last frame, and traffic is logged when the connection closes.
     - Recognized message types are "action" and "state". Unrecognized types are 
       returned back to the sender.
     - Invalid JSON messages are handled gracefully, returning an error response.
     """
+    if urlparse(connection_path(websocket)).path == "/admin":
+        await admin(websocket)
+        return
+
+    mailbox = None
+    codec = FrameCodec()
     try:
-        # Assigning websocket to user state to be used globally.
+        group = connection_group(websocket)
+        agent = get_agent(group)
+        computational_model_state = computational_model_states[group]
+
+        # Assigning websocket to the group's user state to be used globally.
         computational_model_state.set_socket(websocket)
-        global chat_window_URL
         try:
-            # Hardcoded chat_window_URL to http://127.0.0.1:7860, as this is Gradio default
-            await websocket.send(chat_window_URL)
+            # Gradio runs on Config.gradio_port (7860, the Gradio default, unless running as a worker)
+            await codec.send_raw(websocket, chat_window_url(group))
             logging.info("Chat window URL sent to client.")
         except Exception as e:
             logging.error(f"Error initializing agent server: {e}")
         logging.info("New Websocket connection established")
 
+        def apply_update(kind, time_now, data):
+            if kind == "state":
+                apply_state(agent, computational_model_state, data)
+            else:
+                apply_score(agent, time_now, data)
+
+        mailbox = LatestWinsMailbox(apply_update, Config.state_coalesce_interval)
+
         async for message in websocket:
             try:
-                # Parse the incoming message
-                message = json.loads(message)
+                # Parse the incoming message (JSON text or MessagePack binary frame)
+                message = codec.decode(message)
 
                 time_now = int(time.time()*1000)
 
                 # Process C2STEM physics actions
                 if message['type'] == "action":
                     action = C2STEMAction(message['data'])
-                    agent.learner_model.raw_actions.append({"time":time_now,"action":action})
-                    logging.info(f"Action added:\n{agent.learner_model.raw_actions[-1]}")
+                    agent.learner_model.record_action(time_now, action)
+                    logging.debug("Action added:\n%s", agent.learner_model.raw_actions[-1], extra={"category": "action"})
 
-                # Update the user model
-                elif message['type'] == "state":
-                    new_state = str(message['data'])
-                    if new_state != computational_model_state.user_model:
-                        computational_model_state.set_user_model(new_state)
-                        agent.learner_model.user_model = computational_model_state.user_model
-                        logging.info(f"User model updated: {agent.learner_model.user_model}")
+                # Update the user model and scores (latest-wins: intermediate snapshots are dropped)
+                elif message['type'] in ("state", "score"):
+                    mailbox.put(message['type'], time_now, message['data'])
 
                 elif message['type'] == "group":
                     agent.learner_model.action_groups.append({"time":time_now,"action":message['data']})
                     logging.info(f"User Action Group Updated: {agent.learner_model.action_groups[-1]['action']}")
 
-                elif message['type'] == "score":
-                    agent.learner_model.model_scores.append({"time":time_now,"scores":message['data']})
-                    total_score_values = [v for k, v in message['data'].items() if k not in {"physics_mastery","computing_mastery","overall_mastery"}]
-                    agent.learner_model.model_scores[-1]["scores"]["total_score"] = sum(total_score_values)
-                    logging.info(f"User Action Score Updated: {agent.learner_model.model_scores[-1]['scores']['total_score']}")
-
                 elif message['type'] == "segment":
+                    previous_segment = agent.learner_model.task_contexts[-1]["segment"] if agent.learner_model.task_contexts else None
                     agent.learner_model.task_contexts.append({"time":time_now,"segment":message['data']})
                     logging.info(f"User Task Context Updated: {message['data']}")
+                    if message['data'] != previous_segment:
+                        agent.serve_segment_knowledge(message['data'])
+                elif isinstance(message['data'], (str, bytes)):
+                    await codec.send_raw(websocket, message['data'])
                 else:
-                    await websocket.send(message['data'])
-            except json.JSONDecoderError:
-                await websocket.send(json.dumps({"type": "error", "data": "Invalid JSON format."}))
+                    await codec.send(websocket, message['data'])
+            except ValueError:
+                await codec.send(websocket, {"type": "error", "data": "Invalid message format."})
                 logging.error("Invalid message type received")
     except websockets.exceptions.ConnectionClosed as e:
         logging.error(f"WebSocket connection closed: {e}")
     except Exception as e:
         logging.error(f"Error in handler: {e}")
+    finally:
+        if mailbox is not None:
+            mailbox.close()
+        codec.log_stats(connection_group(websocket))
 
 def run_websocket_server():
     """
@@ -155,11 +319,11 @@ def run_websocket_server():
     """
 
     async def websocket_server():
-        logging.info("Starting WebSocket server on ws://localhost:8080")
+        logging.info(f"Starting WebSocket server on ws://localhost:{Config.websocket_port}")
         try:
             # Start the WebSocket server and run it indefinitely
-            async with websockets.serve(handler, "localhost", 8080):
-                logging.info("WebSocket server successfully started and listening on ws://localhost:8080")
+            async with websockets.serve(handler, "localhost", Config.websocket_port, **serve_options()):
+                logging.info(f"WebSocket server successfully started and listening on ws://localhost:{Config.websocket_port}")
                 try:
                     await asyncio.Future()  # run forever
                 except KeyboardInterrupt:
@@ -207,7 +371,8 @@ if __name__ == "__main__":
 
     Based on the environment (`Config.env`), this script either:
     1. Runs the `agent.talk` method in development mode.
-    2. Starts the WebSocket server in production mode.
+    2. Starts the WebSocket server in production mode, or the multi-process supervisor
+       when `Config.workers` is greater than one.
     3. Raises an exception if the environment is invalid.
 
     Raises
@@ -215,8 +380,13 @@ if __name__ == "__main__":
     Exception
         If `Config.env` is not set to "dev" or "prod".
     """
+    configure_logging()
+    install_signal_handler()
+    install_shutdown_handler()
     if Config.env == "dev":
-        agent.talk()
+        get_agent().talk()
+    elif Config.env == "prod" and Config.workers > 1:
+        run_supervisor()
     elif Config.env == "prod":
         try:
             asyncio.run(main())
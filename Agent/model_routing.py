@@ -0,0 +1,102 @@
+from globals import Config
+import json
+import logging
+import threading
+
+"""
+Per-task routing table for LLM calls made by the Agent.
+
+Every `_get_openai_response` call names its task, and the task's route decides the model and how it is
+called. A route is a dict with:
+    model              model name
+    reasoning          reasoning effort ("minimal", "low", ...) or None for non-reasoning models
+    verbosity          text verbosity or None
+    temperature        sampling temperature or None
+    max_output_tokens  cap on generated tokens or None
+    timeout            per-call timeout in seconds (the task's upstream guard)
+    base_url           None for OpenAI, or the URL of a local OpenAI-compatible server (e.g. vLLM, Ollama)
+    api                "responses" (OpenAI Responses API) or "chat" (Chat Completions, for local servers)
+
+The defaults reproduce the previous hard-wired behavior. Any route field can be overridden per task from a
+JSON file at `Config.model_routes_path`, e.g.
+    {"intro": {"model": "llama3.1:8b", "base_url": "http://localhost:11434/v1", "api": "chat", "timeout": 5}}
+An override that switches a route to "chat" does not inherit the default reasoning and verbosity; set them
+explicitly if the local model supports them.
+"""
+
+tasks = ["reply", "intro", "rag_summary", "strategy", "domain_knowledge", "conversation_summary"]
+
+_routes = None
+_routes_lock = threading.Lock()
+
+
+def default_routes():
+    """
+    The built-in routes, matching the models and parameters each call site used before routing existed.
+    """
+    legacy = {"model": "gpt-4o-2024-08-06", "reasoning": None, "verbosity": None, "temperature": 0.0}
+    routes = {
+        "reply": {"model": Config.model, "reasoning": "low", "verbosity": "low"},
+        "intro": dict(legacy),
+        "rag_summary": dict(legacy),
+        "strategy": {"model": Config.model, "reasoning": "low", "verbosity": "low"},
+        "domain_knowledge": {"model": Config.model, "reasoning": "low", "verbosity": "low"},
+        # Reasoning and verbosity are only accepted by reasoning models, so they follow SUMMARY_REASONING
+        "conversation_summary": {"model": Config.summary_model, "reasoning": Config.summary_reasoning,
+                                 "verbosity": "low" if Config.summary_reasoning else None}
+    }
+    for route in routes.values():
+        route.setdefault("temperature", None)
+        route.update({"max_output_tokens": None, "timeout": Config.llm_timeout, "base_url": None, "api": "responses"})
+    return routes
+
+
+def _load_routes():
+    routes = default_routes()
+    if not Config.model_routes_path:
+        return routes
+    try:
+        with open(Config.model_routes_path, 'r') as f:
+            overrides = json.load(f)
+        for task, fields in overrides.items():
+            if task not in routes:
+                logging.error(f"Ignoring model route for unknown task '{task}'.")
+                continue
+            if fields.get("api") == "chat":
+                fields = dict({"reasoning": None, "verbosity": None}, **fields)
+            routes[task].update(fields)
+        logging.info(f"Successfully loaded model routes from '{Config.model_routes_path}'.")
+    except (FileNotFoundError, IOError, json.JSONDecodeError) as e:
+        logging.error(f"Error loading model routes from '{Config.model_routes_path}': {e}")
+    return routes
+
+
+def get_route(task):
+    """
+    Returns the route for a task, loading the table on first use.
+
+    Parameters
+    ----------
+    task : str
+        One of `tasks`.
+
+    Returns
+    -------
+    dict
+        The task's route.
+    """
+    global _routes
+    with _routes_lock:
+        if _routes is None:
+            _routes = _load_routes()
+    return _routes[task]
+
+
+def guard_name(route):
+    """
+    The upstream guard for a route: one per model, endpoint and timeout, so a slow or failing model only trips its own
+    breaker and each task's timeout applies (a guard's timeout is fixed when it is created).
+    """
+    if route["base_url"]:
+        return f"local_llm:{route['model']}:{float(route['timeout']):g}s"
+    return f"openai_responses:{route['model']}:{float(route['timeout']):g}s"
@@ -0,0 +1,186 @@
+from globals import Config
+from collections import Counter
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+"""
+On-demand sampling profiler for the live agent server.
+
+While running, a background thread samples the stack of every thread (WebSocket server, Gradio workers,
+strategy and domain-knowledge loops, background summaries) with `sys._current_frames()` every
+`Config.profiler_interval_ms` milliseconds. Nothing is instrumented and nothing runs while it is stopped.
+When stopped, or after `Config.profiler_max_seconds`, the samples are written to `Config.profiler_dir`
+in collapsed-stack format (`thread;outer (file:line);...;inner (file:line) <count>` per line), which
+flamegraph.pl, speedscope and inferno read directly.
+
+It can be toggled without restarting the server:
+    kill -USR2 <pid>                                     start / stop and dump (per process)
+    {"profile": "start", "seconds": 60} on ws://localhost:<port>/admin
+    {"profile": "stop"} / {"profile": "status"}
+With several workers, the supervisor's /admin forwards profile commands to every worker, or to one
+with {"profile": ..., "worker": <index>}.
+"""
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler over all threads of the process.
+
+    Attributes
+    ----------
+    samples : Counter
+        Collapsed stack -> number of samples in the current or last run.
+    sample_count : int
+        Sampling rounds in the current or last run.
+    last_profile : str or None
+        Path of the last written profile.
+    """
+    def __init__(self):
+        self.samples = Counter()
+        self.sample_count = 0
+        self.last_profile = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=None):
+        """
+        Starts sampling in the background.
+
+        Parameters
+        ----------
+        seconds : float, optional
+            Stop and dump automatically after this long, by default `Config.profiler_max_seconds`.
+
+        Returns
+        -------
+        bool
+            False if the profiler was already running.
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self.samples = Counter()
+            self.sample_count = 0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(seconds or Config.profiler_max_seconds,), name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logging.info(f"Sampling profiler started ({Config.profiler_interval_ms} ms interval).")
+        return True
+
+    def stop(self):
+        """
+        Stops sampling and writes the profile.
+
+        Returns
+        -------
+        str or None
+            Path of the written profile, or None if the profiler was not running.
+        """
+        with self._lock:
+            if not self.running:
+                return None
+            self._stop.set()
+            self._thread.join()
+        return self.last_profile
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def status(self):
+        return {"running": self.running, "samples": self.sample_count, "last_profile": self.last_profile}
+
+    def _run(self, seconds):
+        interval = Config.profiler_interval_ms / 1000
+        deadline = time.monotonic() + seconds if seconds else None
+        own = threading.get_ident()
+        started = int(time.time() * 1000)
+        labels = {}
+
+        while not self._stop.wait(interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(";", ":"))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+        self._dump(started)
+
+    def _dump(self, started):
+        path = os.path.join(Config.profiler_dir, f"profile_{os.getpid()}_{started}.folded")
+        try:
+            os.makedirs(Config.profiler_dir, exist_ok=True)
+            with open(path, 'w') as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.last_profile = path
+            logging.info(f"Successfully wrote {self.sample_count} profiler samples to '{path}' in SamplingProfiler class.")
+        except IOError as e:
+            logging.error(f"Error writing profile to '{path}': {e}")
+
+
+_profiler = SamplingProfiler()
+
+
+def get_profiler():
+    """
+    Returns the process-wide sampling profiler.
+    """
+    return _profiler
+
+
+def profile_command(command):
+    """
+    Runs an admin profile command.
+
+    Parameters
+    ----------
+    command : dict
+        {"profile": "start" | "stop" | "status", "seconds": <optional auto-stop>}.
+
+    Returns
+    -------
+    dict
+        The profiler status after the command.
+    """
+    action = command.get("profile")
+    if action == "start":
+        _profiler.start(float(command["seconds"]) if command.get("seconds") else None)
+    elif action == "stop":
+        _profiler.stop()
+    elif action != "status":
+        raise ValueError(f"unknown profile command '{action}'")
+    return _profiler.status()
+
+
+def install_signal_handler():
+    """
+    Toggles the profiler on SIGUSR2. Must be called from the main thread; a no-op where SIGUSR2 does not exist.
+    """
+    if not hasattr(signal, "SIGUSR2") or threading.current_thread() is not threading.main_thread():
+        return
+    # Stopping joins the sampler and writes the file, so do it off the interrupted main thread
+    signal.signal(signal.SIGUSR2, lambda signum, frame: threading.Thread(target=_profiler.toggle, name="profiler-toggle", daemon=True).start())
@@ -0,0 +1,258 @@
+from globals import Config
+from lexical_index import load_corpus
+import json
+import logging
+import os
+import shutil
+import time
+
+"""
+Compact, memory-mapped on-disk embedding store for the knowledge base.
+
+A store is a root directory holding immutable version directories (`v<ns>`) and a `current` symlink to
+the live one. Each version directory has:
+    meta.json         {"count", "dim", "dtype" ("int8" or "float16"), "has_float32"}
+    vectors.bin       count x dim quantized, L2-normalized vectors (row-major)
+    scales.bin        count float32 per-row scales (int8 only: value = q * scale / 127)
+    vectors_f32.bin   count x dim float32 normalized vectors (optional, for rescoring)
+    texts.bin         UTF-8 passage texts, concatenated
+    text_offsets.bin  count + 1 uint64 offsets into texts.bin
+    ids.bin           UTF-8 passage ids, concatenated
+    id_offsets.bin    count + 1 uint64 offsets into ids.bin
+
+`write_store` builds a new version in a temporary sibling directory, fsyncs it, renames it into place and
+then atomically repoints `current` with `os.replace`. Files of a published version are never modified, so
+servers that have a version memory-mapped keep reading it unchanged until they reopen the store; the
+previous version is kept so a reader that resolved `current` just before a swap can still open it.
+A flat directory with meta.json (written before versioning) is still read as is.
+
+Every file is opened with `numpy.memmap`, so all worker processes share the same page cache instead of
+each holding float32 copies. Search runs directly on the quantized rows (in blocks, to bound temporary
+memory) and optionally rescores the best `Config.rescore_factor * k` candidates with the float32 rows.
+
+Usage:
+    python quantized_store.py <corpus.jsonl> <store_dir> [--dtype int8|float16] [--no-float32]
+"""
+
+
+# Staging directories older than this are leftovers of a writer that crashed; younger ones may belong to a running writer
+stale_staging_seconds = 3600
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def resolve_store(path):
+    """
+    The directory holding the live version of a store: the target of `current`, or `path` itself for a flat store.
+    """
+    current = os.path.join(path, "current")
+    if os.path.islink(current):
+        return os.path.realpath(current)
+    return path
+
+
+def _prune_versions(path, keep):
+    versions = sorted(name for name in os.listdir(path) if name.startswith("v") and os.path.isdir(os.path.join(path, name)))
+    for name in versions[:-keep]:
+        # Unlinking files that a reader still has mapped is safe: the mapping keeps the old inode alive
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    now = time.time()
+    for name in os.listdir(path):
+        staging = os.path.join(path, name)
+        try:
+            stale = name.startswith(".tmp-") and now - os.path.getmtime(staging) > stale_staging_seconds
+        except OSError:
+            continue
+        if stale:
+            shutil.rmtree(staging, ignore_errors=True)
+
+
+def write_store(path, ids, texts, matrix, dtype="int8", keep_float32=True):
+    """
+    Writes a new version of a quantized store and atomically makes it the current one.
+
+    Parameters
+    ----------
+    path : str
+        Store root directory (created if needed).
+    ids : list of str
+        Passage ids.
+    texts : list of str
+        Passage texts.
+    matrix : array-like
+        (n_passages, dim) embeddings.
+    dtype : str, optional
+        "int8" or "float16", by default "int8".
+    keep_float32 : bool, optional
+        Also write float32 vectors for rescoring, by default True.
+    """
+    import numpy as np
+
+    if dtype not in ("int8", "float16"):
+        raise ValueError(f"Unsupported quantized store dtype: {dtype}")
+
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
+
+    os.makedirs(path, exist_ok=True)
+    version = f"v{time.time_ns()}"
+    staging = os.path.join(path, f".tmp-{version}")
+    os.makedirs(staging)
+
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1)
+        scales[scales == 0] = 1.0
+        quantized = np.round(matrix / scales[:, None] * 127).astype(np.int8)
+        _write_file(os.path.join(staging, "scales.bin"), scales.astype(np.float32).tobytes())
+    else:
+        quantized = matrix.astype(np.float16)
+    _write_file(os.path.join(staging, "vectors.bin"), quantized.tobytes())
+    if keep_float32:
+        _write_file(os.path.join(staging, "vectors_f32.bin"), matrix.tobytes())
+
+    for name, values in (("texts", texts), ("ids", ids)):
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded], dtype=np.uint64)
+        _write_file(os.path.join(staging, f"{name}.bin"), b"".join(encoded))
+        _write_file(os.path.join(staging, f"{name[:-1]}_offsets.bin"), offsets.tobytes())
+
+    meta = {"count": int(matrix.shape[0]), "dim": int(matrix.shape[1]), "dtype": dtype, "has_float32": keep_float32}
+    _write_file(os.path.join(staging, "meta.json"), json.dumps(meta).encode("utf-8"))
+    _fsync_dir(staging)
+
+    # Publish: rename the complete version into place, then swap the `current` symlink atomically
+    os.rename(staging, os.path.join(path, version))
+    link = os.path.join(path, f".current-{version}")
+    os.symlink(version, link)
+    os.replace(link, os.path.join(path, "current"))
+    _fsync_dir(path)
+    _prune_versions(path, keep=2)
+    logging.info(f"Wrote {dtype} quantized store version '{version}' with {matrix.shape[0]} passages to '{path}'.")
+
+
+class QuantizedVectorStore:
+    """
+    Read-only, memory-mapped quantized store; a dense backend with the same `query_batch` interface as
+    `LocalVectorIndex`.
+
+    Parameters
+    ----------
+    path : str
+        Store root written by `write_store` (or a flat pre-versioning store directory). The live version
+        is resolved once, so the store keeps reading that version after later writes.
+    """
+    guard_name = "local_vector_query"
+    coalesce = True
+    block_rows = 4096
+
+    def __init__(self, path):
+        import numpy as np
+
+        path = resolve_store(path)
+        with open(os.path.join(path, "meta.json"), 'r') as f:
+            self.meta = json.load(f)
+        count, dim = self.meta["count"], self.meta["dim"]
+        self.path = path
+        self.dtype = self.meta["dtype"]
+        self.vectors = np.memmap(os.path.join(path, "vectors.bin"), dtype=self.dtype, mode="r", shape=(count, dim))
+        self.scales = np.memmap(os.path.join(path, "scales.bin"), dtype=np.float32, mode="r", shape=(count,)) if self.dtype == "int8" else None
+        self.full = np.memmap(os.path.join(path, "vectors_f32.bin"), dtype=np.float32, mode="r", shape=(count, dim)) if self.meta.get("has_float32") else None
+        self.texts_blob = np.memmap(os.path.join(path, "texts.bin"), dtype=np.uint8, mode="r") if os.path.getsize(os.path.join(path, "texts.bin")) else b""
+        self.text_offsets = np.memmap(os.path.join(path, "text_offsets.bin"), dtype=np.uint64, mode="r", shape=(count + 1,))
+        self.ids_blob = np.memmap(os.path.join(path, "ids.bin"), dtype=np.uint8, mode="r") if os.path.getsize(os.path.join(path, "ids.bin")) else b""
+        self.id_offsets = np.memmap(os.path.join(path, "id_offsets.bin"), dtype=np.uint64, mode="r", shape=(count + 1,))
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def _string(self, blob, offsets, i):
+        return bytes(blob[int(offsets[i]):int(offsets[i + 1])]).decode("utf-8")
+
+    def text(self, i):
+        return self._string(self.texts_blob, self.text_offsets, i)
+
+    def passage_id(self, i):
+        return self._string(self.ids_blob, self.id_offsets, i)
+
+    def _quantized_scores(self, queries):
+        """
+        Approximate cosine scores of normalized queries against every row, computed block by block on the
+        quantized data so only one block is ever dequantized at a time.
+        """
+        import numpy as np
+
+        scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), self.block_rows):
+            block = np.asarray(self.vectors[start:start + self.block_rows], dtype=np.float32)
+            block_scores = queries @ block.T
+            if self.scales is not None:
+                block_scores *= np.asarray(self.scales[start:start + self.block_rows]) / 127
+            scores[:, start:start + self.block_rows] = block_scores
+        return scores
+
+    def query_batch(self, namespace, vectors, k):
+        import numpy as np
+
+        queries = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        scores = self._quantized_scores(queries)
+        rescore = Config.vector_store_rescore and self.full is not None
+        n_candidates = min(k * Config.rescore_factor if rescore else k, len(self))
+        candidates = np.argpartition(-scores, n_candidates - 1, axis=1)[:, :n_candidates]
+
+        results = []
+        for row in range(queries.shape[0]):
+            rows = candidates[row]
+            if rescore:
+                # Exact float32 scores for the shortlisted rows only; the rest of vectors_f32.bin stays on disk
+                row_scores = np.asarray(self.full[np.sort(rows)], dtype=np.float32) @ queries[row]
+                rows = np.sort(rows)
+            else:
+                row_scores = scores[row, rows]
+            order = np.argsort(-row_scores)[:k]
+            results.append({"matches": [
+                {"id": self.passage_id(int(rows[j])), "score": float(row_scores[j]), "metadata": {"text": self.text(int(rows[j]))}}
+                for j in order
+            ]})
+        return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a quantized, memory-mapped store from a JSONL knowledge corpus with embeddings.")
+    parser.add_argument("corpus", help="JSONL corpus with id, text and embedding per line")
+    parser.add_argument("store_dir", help="Store root directory (a new version is written and made current)")
+    parser.add_argument("--dtype", choices=["int8", "float16"], default="int8")
+    parser.add_argument("--no-float32", action="store_true", help="Do not keep float32 vectors for rescoring")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    passages = load_corpus(args.corpus, with_embeddings=True)
+    write_store(
+        args.store_dir,
+        [p["id"] for p in passages],
+        [p["text"] for p in passages],
+        [p["embedding"] for p in passages],
+        dtype=args.dtype,
+        keep_float32=not args.no_float32
+    )
@@ -1,6 +1,12 @@
-from pinecone import Pinecone
-import openai
 from globals import Config
+from clients import get_openai_client, get_pinecone_client, get_pinecone_index
+from resilience import get_guard, CircuitOpenError
+from lexical_index import BM25Index, load_corpus
+from embedding_batcher import get_embedding_batcher
+from vector_index import get_query_coalescer, get_pinecone_backend, get_local_vector_index
+from tracing import traced
+from collections import OrderedDict
+import threading
 from dotenv import load_dotenv
 import logging
 import time
@@ -15,7 +21,23 @@ class RAG:
 
     The class is designed to generate embeddings for input texts using OpenAI's API and retrieve the most relevant
     documents from Pinecone's vector store based on those embeddings.
+
+    Embeddings and retrieval results are cached at class level so every RAG instance (one per session)
+    shares them: embeddings are deterministic per model and are served from cache whenever present, while
+    cached retrieval results are only served as a fallback when Pinecone is degraded.
+
+    With `Config.retrieval_mode` set to "lexical" or "hybrid", a local BM25 index over the knowledge corpus is
+    also used: `lexical_search` answers keyword-heavy queries without any remote call, and in hybrid mode
+    `retrieve` fuses lexical and dense scores.
     """
+    embedding_cache = OrderedDict()
+    retrieval_cache = OrderedDict()
+    cache_lock = threading.Lock()
+
+    # Local BM25 index over `Config.knowledge_corpus_path`, built once and shared by every instance
+    lexical_index = None
+    lexical_lock = threading.Lock()
+
     def __init__(self):
         """
         Initializes the RAG class with configurations for OpenAI's embedding model and Pinecone vector store.
@@ -24,27 +46,60 @@ class RAG:
         ----------
         embedding_model : str
             The name of the OpenAI embedding model to be used for generating embeddings.
-        vector_store : Pinecone
-            The Pinecone client initialized with the API key from configuration.
         namespace : str
             The namespace in the Pinecone vector store where the index is located.
         index_name : str
             The name of the index in Pinecone to query.
-        index : Pinecone.Index
-            The Pinecone index object to perform retrieval operations.
+
+        Notes
+        -----
+        The Pinecone client and index are not created here; they are connected on first use
+        through the `vector_store` and `index` properties so that constructing a RAG instance is cheap.
+        Both come from the process-wide pool in `clients`, shared by every RAG instance.
         """
         self.embedding_model  = Config.embedding_model
-        self.vector_store = Pinecone(api_key=Config.vector_store_api_key)
         self.namespace = Config.namespace
         self.index_name = Config.index_name
-        self.index = self.vector_store.Index(self.index_name)
+        self._vector_store = None
+        self._index = None
+
+    @property
+    def vector_store(self):
+        """
+        The shared Pinecone client initialized with the API key from configuration, created on first access.
+
+        Returns
+        -------
+        Pinecone
+            The process-wide Pinecone client from `clients.get_pinecone_client`.
+        """
+        if self._vector_store is None:
+            self._vector_store = get_pinecone_client()
+        return self._vector_store
+
+    @property
+    def index(self):
+        """
+        The Pinecone index object to perform retrieval operations, connected on first access.
+
+        Returns
+        -------
+        Pinecone.Index
+            The shared handle for the index named by `Config.index_name`.
+        """
+        if self._index is None:
+            self._index = get_pinecone_index(self.index_name)
+        return self._index
 
+    @traced("embeddings", attrs=lambda self, texts: {"texts": len(texts), "chars": sum(len(t) for t in texts)})
     def get_embeddings(self,texts):
         """
         Generate embeddings for a list of input texts using the OpenAI API.
 
         This method makes an API call to OpenAI's embeddings endpoint and retrieves the vector representation
         (embeddings) for each input text. If rate limits or errors occur, it retries with exponential backoff.
+        With `Config.embedding_batching_enabled`, the call goes through the shared `EmbeddingBatcher`, which
+        combines concurrent requests from all sessions into a single API call.
 
         Parameters
         ----------
@@ -59,6 +114,7 @@ class RAG:
         -------
         list of list of float or None
             A list of embeddings for the input texts, or None if the API call fails after all retries.
+            If every text is already in the shared embedding cache, no API call is made.
 
         Raises
         ------
@@ -69,15 +125,36 @@ class RAG:
         openai.APIError
             Raised when a generic error occurs while calling the OpenAI API.
         """
+        import openai
+
+        cached = self._cache_get(self.embedding_cache, [(self.embedding_model, t) for t in texts])
+        if all(c is not None for c in cached):
+            logging.info("Served embeddings from cache in RAG class.")
+            return cached
+
+        guard = get_guard("openai_embeddings", Config.embedding_timeout)
         for i in range(Config.max_retries):
             try: 
-                res = openai.embeddings.create(
-                    input=texts,
-                    model=self.embedding_model
-                )
+                if Config.embedding_batching_enabled:
+                    # Coalesced with concurrent requests from other sessions into one API call
+                    doc_embeds = get_embedding_batcher().embed(texts, self.embedding_model)
+                else:
+                    res = guard.call(
+                        get_openai_client().embeddings.create,
+                        input=texts,
+                        model=self.embedding_model,
+                        timeout=guard.timeout
+                    )
+                    doc_embeds = [r.embedding for r in res.data]
                 logging.info(f"Successfully retrieved embeddings from OpenAI embedding model in RAG class.'")
-                doc_embeds = [r.embedding for r in res.data]
+                self._cache_put(self.embedding_cache, list(zip([(self.embedding_model, t) for t in texts], doc_embeds)), Config.embedding_cache_size)
                 return doc_embeds 
+            except CircuitOpenError as e:
+                logging.error(f"OpenAI embeddings degraded, failing fast for embedding call from RAG: {e}")
+                break
+            except TimeoutError as e:
+                logging.error(f"OpenAI embedding call from RAG timed out: {e}")
+                break
             except openai.RateLimitError:
                 logging.error(f"Open AI Rate limit exceeded for embedding call from RAG, retry {i+1}/{Config.max_retries}.")
                 time.sleep(Config.backoff_factor * (2 ** i))
@@ -90,12 +167,16 @@ class RAG:
         logging.error("Failed to retrieve embeddings from OpenAI embedding model in RAG class after all retries.")
         return None
     
-    def retrieve(self,embedding,k):
+    @traced("retrieve", attrs=lambda self, embedding, k, query_text=None: {"k": k, "backend": Config.vector_backend, "mode": Config.retrieval_mode})
+    def retrieve(self,embedding,k,query_text=None):
         """
         Retrieve the top-k most relevant documents from the Pinecone vector store based on an input embedding.
 
         This method performs a query to the Pinecone index, returning metadata for the top-k documents
         most similar to the input embedding. If the query fails due to API errors, it retries with exponential backoff.
+        With `Config.vector_backend` set to "local" the in-process index is searched instead, and with
+        `Config.query_batching_enabled` concurrent calls from all sessions are coalesced into one batched search
+        of that index. Pinecone queries are never coalesced, so each one keeps its own timeout.
 
         Parameters
         ----------
@@ -103,6 +184,8 @@ class RAG:
             The embedding vector for which to retrieve the most similar documents from Pinecone.
         k : int
             The number of top documents to retrieve based on similarity to the input embedding.
+        query_text : str, optional
+            The query the embedding was computed from. In "hybrid" mode it is used to fuse BM25 scores into the dense results.
         retries : int, optional
             The number of retry attempts in case of a query error, by default 3.
         backoff_factor : float, optional
@@ -112,6 +195,7 @@ class RAG:
         -------
         dict or None
             A dictionary containing metadata and results from the Pinecone index query, or None if the query fails after all retries.
+            While Pinecone is timing out or its circuit breaker is open, the last cached result for the same query is returned if available.
 
         Raises
         ------
@@ -119,23 +203,189 @@ class RAG:
             Raised if an unknown error occurs while querying the Pinecone index.
         """
         if embedding:
+            cache_key = (tuple(embedding), k, query_text)
             for i in range(Config.max_retries):
                 try:
-                    result = self.index.query(
-                        namespace=self.namespace,
-                        vector=embedding,
-                        top_k=k,
-                        include_values=False,
-                        include_metadata=True
-                    )
+                    backend = self.dense_backend
+                    if backend is None:
+                        logging.error("No local vector index available for retrieval in RAG class.")
+                        break
+                    if Config.query_batching_enabled and backend.coalesce:
+                        # Batched with concurrent retrievals from other sessions into one similarity search
+                        result = get_query_coalescer().query(backend, self.namespace, embedding, k)
+                    else:
+                        guard = get_guard(backend.guard_name, Config.retrieval_timeout)
+                        result = guard.call(backend.query_batch, self.namespace, [embedding], k)[0]
                     logging.info(f"Successfully retrieved domain knowledge from vector store in RAG class.'")
-                    retrieved_info = '\n\n'.join([m["metadata"]["text"] for m in result["matches"]])
-                    print(f"\n\nRetrieved the following information from RAG store:\n{retrieved_info}\n\n")
+                    if Config.retrieval_mode == "hybrid" and query_text:
+                        result = self._fuse(result, query_text, k)
+                    if logging.getLogger().isEnabledFor(logging.DEBUG):
+                        retrieved_info = '\n\n'.join([m["metadata"]["text"] for m in result["matches"]])
+                        logging.debug(f"Retrieved the following information from RAG store:\n{retrieved_info}")
+                    self._cache_put(self.retrieval_cache, [(cache_key, result)], Config.retrieval_cache_size)
                     return result
+                except (CircuitOpenError, TimeoutError) as e:
+                    logging.error(f"Vector store degraded for retrieving from knowledge base in RAG class: {e}")
+                    break
                 except Exception as e:
-                    logging.error(f"Pinecone API error for retrieving from knowledge base in RAG class: {e}, retry {i+1}/{Config.max_retries}")
+                    logging.error(f"Vector store error for retrieving from knowledge base in RAG class: {e}, retry {i+1}/{Config.max_retries}")
                     time.sleep(Config.backoff_factor * (2 ** i))
+
+            # Fall back to the last result for the same query while the vector store is unavailable
+            cached = self._cache_get(self.retrieval_cache, [cache_key])[0]
+            if cached is not None:
+                logging.info("Served cached domain knowledge in RAG class while vector store is unavailable.")
+                return cached
         else:
             logging.error("'None' object passed to retrieve method in RAG class from embedding model.")
         logging.error("Failed to retrieve domain knowledge from vector store in RAG class.")
         return None
+
+    @property
+    def dense_backend(self):
+        """
+        The dense retrieval backend selected by `Config.vector_backend`.
+
+        Returns
+        -------
+        PineconeBackend or LocalVectorIndex or None
+            The shared Pinecone backend for `index`, or the shared local index ("local"), which is None
+            if no corpus with embeddings is configured.
+        """
+        if Config.vector_backend == "local":
+            return get_local_vector_index()
+        return get_pinecone_backend(self.index)
+
+    def _get_lexical_index(self):
+        """
+        Returns the shared BM25 index, building it from `Config.knowledge_corpus_path` on first use.
+
+        Returns
+        -------
+        BM25Index or None
+            The index, or None if retrieval is dense-only or no corpus is configured.
+        """
+        if Config.retrieval_mode == "dense" or not Config.knowledge_corpus_path:
+            return None
+        with RAG.lexical_lock:
+            if RAG.lexical_index is None:
+                passages = load_corpus(Config.knowledge_corpus_path)
+                if not passages:
+                    return None
+                RAG.lexical_index = BM25Index(passages)
+                logging.info(f"Built local BM25 index over {len(passages)} knowledge passages in RAG class.")
+            return RAG.lexical_index
+
+    @traced("lexical_search", attrs=lambda self, query, k: {"k": k, "query_chars": len(query)})
+    def lexical_search(self, query, k):
+        """
+        Retrieve the top-k passages for a query from the local BM25 index, without any remote call.
+
+        In "lexical" mode any non-empty result is returned. In "hybrid" mode a result is only returned when
+        lexical confidence is high, i.e. the top passage contains at least `Config.lexical_confidence` of the
+        query's words; otherwise the caller should fall back to dense retrieval.
+
+        Parameters
+        ----------
+        query : str
+            The query text.
+        k : int
+            The number of passages to retrieve.
+
+        Returns
+        -------
+        dict or None
+            A result in the same shape as a Pinecone query ({"matches": [{"id", "score", "metadata": {"text"}}]}),
+            or None if lexical retrieval is disabled, empty or not confident.
+        """
+        index = self._get_lexical_index()
+        if index is None:
+            return None
+        hits = index.search(query, k)
+        if not hits:
+            return None
+        if Config.retrieval_mode == "hybrid" and hits[0][2] < Config.lexical_confidence:
+            logging.info(f"Lexical confidence too low ({hits[0][2]:.2f}) in RAG class; using dense retrieval.")
+            return None
+        logging.info("Successfully retrieved domain knowledge from local BM25 index in RAG class.")
+        return {"matches": [{"id": index.passages[i]["id"], "score": score, "metadata": {"text": index.passages[i]["text"]}} for i, score, _ in hits]}
+
+    def _fuse(self, dense_result, query_text, k):
+        """
+        Fuse dense matches with BM25 matches by min-max normalizing each score list and combining them as
+        `Config.hybrid_alpha * dense + (1 - Config.hybrid_alpha) * lexical`. Passages are joined on their text.
+        """
+        index = self._get_lexical_index()
+        if index is None:
+            return dense_result
+
+        def normalized(scores):
+            if not scores:
+                return {}
+            lo, hi = min(scores.values()), max(scores.values())
+            return {key: (v - lo) / (hi - lo) if hi > lo else 1.0 for key, v in scores.items()}
+
+        candidates = {}
+        dense_scores = {}
+        for m in dense_result["matches"]:
+            text = m["metadata"]["text"]
+            candidates[text] = m["id"]
+            dense_scores[text] = m["score"]
+        lexical_scores = {}
+        for i, score, _ in index.search(query_text, 2 * k):
+            text = index.passages[i]["text"]
+            candidates.setdefault(text, index.passages[i]["id"])
+            lexical_scores[text] = score
+
+        dense_scores, lexical_scores = normalized(dense_scores), normalized(lexical_scores)
+        alpha = Config.hybrid_alpha
+        fused = sorted(
+            ((text, alpha * dense_scores.get(text, 0.0) + (1 - alpha) * lexical_scores.get(text, 0.0)) for text in candidates),
+            key=lambda item: item[1], reverse=True
+        )[:k]
+        return {"matches": [{"id": candidates[text], "score": score, "metadata": {"text": text}} for text, score in fused]}
+
+    def _cache_get(self, cache, keys):
+        """
+        Look up keys in one of the shared LRU caches, marking hits as most recently used.
+
+        Parameters
+        ----------
+        cache : OrderedDict
+            `embedding_cache` or `retrieval_cache`.
+        keys : list
+            Keys to look up.
+
+        Returns
+        -------
+        list
+            The cached value for each key, or None where it is missing.
+        """
+        values = []
+        with self.cache_lock:
+            for key in keys:
+                value = cache.get(key)
+                if value is not None:
+                    cache.move_to_end(key)
+                values.append(value)
+        return values
+
+    def _cache_put(self, cache, items, max_size):
+        """
+        Insert items into one of the shared LRU caches, evicting the oldest entries beyond `max_size`.
+
+        Parameters
+        ----------
+        cache : OrderedDict
+            `embedding_cache` or `retrieval_cache`.
+        items : list of tuple
+            (key, value) pairs to insert.
+        max_size : int
+            Maximum number of entries to keep.
+        """
+        with self.cache_lock:
+            for key, value in items:
+                cache[key] = value
+                cache.move_to_end(key)
+            while len(cache) > max_size:
+                cache.popitem(last=False)
@@ -0,0 +1,199 @@
+from globals import Config
+import heapq
+import itertools
+import threading
+import time
+
+"""
+Process-wide token-bucket rate limiter for LLM calls, with priority classes.
+
+Every `_get_openai_response` call acquires one request and an estimated number of tokens from
+the shared buckets (requests per minute and tokens per minute) before going to the provider.
+Waiters are served in priority order, so interactive student turns go ahead of queued background
+work (strategy classification, domain-knowledge analysis). Background work may not dip into the
+last `Config.background_reserve_fraction` of either bucket and gives up after
+`Config.background_max_wait` seconds, so it is shed first when the process is near its limits.
+"""
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority_names = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class RateLimitShed(Exception):
+    """
+    Raised when a call is dropped by the limiter instead of being sent to the provider.
+    """
+    pass
+
+
+class PriorityRateLimiter:
+    """
+    Request and token buckets shared by all callers, served in priority order.
+
+    Parameters
+    ----------
+    requests_per_minute : int
+        Request bucket capacity and refill per minute. 0 disables the request limit.
+    tokens_per_minute : int
+        Token bucket capacity and refill per minute. 0 disables the token limit.
+    """
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.request_capacity = float(requests_per_minute)
+        self.token_capacity = float(tokens_per_minute)
+        self.requests = self.request_capacity
+        self.tokens = self.token_capacity
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.queue = []
+        self.sequence = itertools.count()
+        self.cond = threading.Condition()
+        self.stats = {"granted": {"interactive": 0, "background": 0}, "shed": {"interactive": 0, "background": 0}, "waited_seconds": {"interactive": 0.0, "background": 0.0}}
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        if self.request_capacity:
+            self.requests = min(self.request_capacity, self.requests + elapsed * self.request_capacity / 60)
+        if self.token_capacity:
+            self.tokens = min(self.token_capacity, self.tokens + elapsed * self.token_capacity / 60)
+
+    def _can_grant(self, tokens, priority, now):
+        if now < self.blocked_until:
+            return False
+        # Background work must leave a reserve in each bucket for interactive turns
+        reserve = Config.background_reserve_fraction if priority == BACKGROUND else 0.0
+        if self.request_capacity and self.requests - 1 < reserve * self.request_capacity:
+            return False
+        if self.token_capacity and self.tokens - tokens < reserve * self.token_capacity:
+            return False
+        return True
+
+    def _seconds_until_refill(self, tokens, now):
+        waits = [max(self.blocked_until - now, 0)]
+        if self.request_capacity:
+            waits.append(max(1 - self.requests, 0) * 60 / self.request_capacity)
+        if self.token_capacity:
+            waits.append(max(tokens - self.tokens, 0) * 60 / self.token_capacity)
+        return max(max(waits), 0.01)
+
+    def acquire(self, tokens, priority=INTERACTIVE, max_wait=None):
+        """
+        Blocks until the call may proceed or is shed.
+
+        Parameters
+        ----------
+        tokens : int
+            Estimated tokens the call will consume (prompt plus expected output).
+        priority : int, optional
+            `INTERACTIVE` or `BACKGROUND`, by default `INTERACTIVE`.
+        max_wait : float, optional
+            Seconds to wait before shedding. Defaults to `Config.interactive_max_wait` or
+            `Config.background_max_wait` depending on priority.
+
+        Returns
+        -------
+        int
+            The number of tokens charged, to be passed to `reconcile` once actual usage is known.
+
+        Raises
+        ------
+        RateLimitShed
+            If the call could not be admitted within `max_wait` seconds.
+        """
+        if max_wait is None:
+            max_wait = Config.interactive_max_wait if priority == INTERACTIVE else Config.background_max_wait
+        if self.token_capacity:
+            tokens = min(tokens, int(self.token_capacity * (1 - Config.background_reserve_fraction)))
+        name = _priority_names[priority]
+
+        with self.cond:
+            start = time.monotonic()
+            ticket = (priority, next(self.sequence))
+            heapq.heappush(self.queue, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self.queue[0] == ticket and self._can_grant(tokens, priority, now):
+                        self.requests -= 1 if self.request_capacity else 0
+                        self.tokens -= tokens if self.token_capacity else 0
+                        self.stats["granted"][name] += 1
+                        self.stats["waited_seconds"][name] += now - start
+                        return tokens
+                    remaining = start + max_wait - now
+                    if remaining <= 0:
+                        self.stats["shed"][name] += 1
+                        raise RateLimitShed(f"{name.capitalize()} LLM call shed by rate limiter after waiting {now - start:.1f}s.")
+                    self.cond.wait(timeout=min(remaining, self._seconds_until_refill(tokens, now)))
+            finally:
+                self.queue.remove(ticket)
+                heapq.heapify(self.queue)
+                self.cond.notify_all()
+
+    def reconcile(self, charged, actual):
+        """
+        Corrects the token bucket once the provider reports actual usage.
+
+        Parameters
+        ----------
+        charged : int
+            Tokens charged by `acquire`.
+        actual : int or None
+            Tokens actually used, or None if unknown (no correction is made).
+        """
+        if actual is None or not self.token_capacity:
+            return
+        with self.cond:
+            self.tokens = min(self.token_capacity, self.tokens + charged - actual)
+            self.cond.notify_all()
+
+    def backoff(self, seconds):
+        """
+        Holds every waiter for `seconds` after the provider returns a rate-limit error.
+
+        Interactive waiters are still first in line when the hold expires.
+        """
+        with self.cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.cond.notify_all()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_llm_limiter():
+    """
+    Returns the process-wide LLM rate limiter, creating it on first use.
+
+    Returns
+    -------
+    PriorityRateLimiter
+        The limiter configured with `Config.llm_requests_per_minute` and `Config.llm_tokens_per_minute`.
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = PriorityRateLimiter(Config.llm_requests_per_minute, Config.llm_tokens_per_minute)
+        return _limiter
+
+
+def estimate_tokens(messages):
+    """
+    Roughly estimates the tokens an LLM call will use: ~4 characters per prompt token plus
+    `Config.llm_output_tokens_estimate` for the reply.
+
+    Parameters
+    ----------
+    messages : list of dict
+        The messages passed to the model.
+
+    Returns
+    -------
+    int
+        Estimated total tokens.
+    """
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return chars // 4 + Config.llm_output_tokens_estimate
@@ -0,0 +1,279 @@
+from globals import Config
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+import logging
+import threading
+import time
+
+"""
+Tail-latency controls for upstream calls (OpenAI responses, OpenAI embeddings, Pinecone).
+
+Each upstream gets an `UpstreamGuard` that:
+1. Bounds every call with a timeout, so a hung request cannot hold a student turn.
+2. Optionally hedges: if the first attempt is slower than the configured latency percentile,
+   a second identical attempt is started and whichever finishes first wins.
+3. Trips a circuit breaker after repeated failures, so callers fail fast (and serve cached or
+   fallback content) while the upstream is degraded, then probes it again after a cool-down.
+   Only timeouts, connection errors and 5xx responses count as failures; a 4xx (e.g. a bad request)
+   says nothing about the upstream's health.
+
+Attempts that have not started when a call times out are cancelled. Attempts already running cannot be
+interrupted, so callers pass the guard's timeout to the HTTP client as well (e.g. `timeout=guard.timeout`
+on OpenAI calls) to release the connection and pool thread when the guard gives up.
+"""
+
+# Shared pool that runs guarded calls; losing hedge attempts finish here
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="upstream")
+
+
+def is_upstream_failure(error):
+    """
+    Whether an error reflects the upstream's health (timeouts, connection errors, 5xx responses) rather than
+    the request itself (4xx responses such as a bad request or a rate limit).
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(error, "status", None)
+    if isinstance(status, int):
+        return status >= 500
+    # No HTTP status: the request did not complete (timeout, refused or dropped connection)
+    return True
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a call is rejected because the upstream's circuit breaker is open.
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker with a single half-open probe.
+
+    Attributes
+    ----------
+    failure_threshold : int
+        Consecutive failures that open the circuit.
+    reset_seconds : float
+        How long the circuit stays open before a probe call is allowed.
+    state : str
+        One of "closed", "open" or "half_open".
+    """
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns whether a call may proceed, moving an expired open circuit to half-open.
+
+        Returns
+        -------
+        bool
+            `True` if the call may go to the upstream, `False` if it should fail fast.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                # Let exactly one probe through; concurrent callers keep failing fast until it returns
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logging.error(f"Circuit breaker opened after {self.failures} consecutive failures.")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """
+    Rolling window of successful call latencies, used to pick the hedging delay.
+    """
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p):
+        """
+        Returns the p-th percentile latency in seconds, or None if there are too few samples.
+        """
+        with self._lock:
+            if len(self.samples) < Config.hedge_min_samples:
+                return None
+            ordered = sorted(self.samples)
+        idx = min(int(len(ordered) * p / 100), len(ordered) - 1)
+        return ordered[idx]
+
+
+class UpstreamGuard:
+    """
+    Timeout, hedging and circuit breaking for one upstream.
+
+    Parameters
+    ----------
+    name : str
+        Name used in logs and metrics (e.g. "openai_responses").
+    timeout : float
+        Maximum seconds a single guarded call may take, including any hedge.
+    hedge : bool, optional
+        Whether to hedge slow calls, by default `Config.hedge_enabled`.
+    """
+    def __init__(self, name, timeout, hedge=None):
+        self.name = name
+        self.timeout = timeout
+        self.hedge = Config.hedge_enabled if hedge is None else hedge
+        self.breaker = CircuitBreaker(Config.breaker_failure_threshold, Config.breaker_reset_seconds)
+        self.latency = LatencyTracker()
+        self.stats = {"calls": 0, "successes": 0, "failures": 0, "timeouts": 0, "rejected": 0, "hedges": 0, "hedge_wins": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        # Guards are shared by every session thread, and `+=` on a dict entry is not atomic
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _hedge_delay(self):
+        if not self.hedge:
+            return None
+        return self.latency.percentile(Config.hedge_percentile)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Calls `fn(*args, **kwargs)` under this guard.
+
+        Returns
+        -------
+        Any
+            The result of the first attempt to succeed.
+
+        Raises
+        ------
+        CircuitOpenError
+            If the circuit is open and the call was not attempted.
+        TimeoutError
+            If no attempt finished within `timeout` seconds.
+        Exception
+            The exception raised by `fn` if every attempt failed.
+        """
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError(f"Circuit open for upstream '{self.name}'.")
+
+        self._count("calls")
+        start = time.monotonic()
+        deadline = start + self.timeout
+        hedge_delay = self._hedge_delay()
+        first = _executor.submit(fn, *args, **kwargs)
+        pending = {first}
+        hedged = False
+        error = None
+
+        while pending:
+            now = time.monotonic()
+            remaining = deadline - now
+            if remaining <= 0:
+                break
+            wait_for = remaining
+            if hedge_delay is not None and not hedged:
+                wait_for = min(remaining, max(start + hedge_delay - now, 0))
+
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    self.latency.record(time.monotonic() - start)
+                    self.breaker.record_success()
+                    self._count("successes")
+                    if f is not first:
+                        self._count("hedge_wins")
+                    return f.result()
+                error = f.exception()
+
+            if pending and hedge_delay is not None and not hedged and time.monotonic() >= start + hedge_delay:
+                hedged = True
+                self._count("hedges")
+                logging.info(f"Hedging slow call to '{self.name}' after {hedge_delay:.2f}s.")
+                pending.add(_executor.submit(fn, *args, **kwargs))
+
+        for f in pending:
+            # Queued attempts must not start later against a degraded upstream
+            f.cancel()
+        self._count("failures")
+        if pending or error is None:
+            self.breaker.record_failure()
+            self._count("timeouts")
+            raise TimeoutError(f"Call to upstream '{self.name}' timed out after {self.timeout}s.")
+        if is_upstream_failure(error):
+            self.breaker.record_failure()
+        else:
+            # The upstream answered; this also closes a half-open circuit
+            self.breaker.record_success()
+        raise error
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(name, timeout):
+    """
+    Returns the process-wide guard for an upstream, creating it on first use.
+
+    Parameters
+    ----------
+    name : str
+        The upstream name.
+    timeout : float
+        Per-call timeout in seconds, used when the guard is created.
+
+    Returns
+    -------
+    UpstreamGuard
+        The guard shared by every caller of this upstream.
+    """
+    with _guards_lock:
+        if name not in _guards:
+            _guards[name] = UpstreamGuard(name, timeout)
+        return _guards[name]
+
+
+def get_guard_metrics():
+    """
+    Returns call, timeout, hedge and breaker statistics for every guarded upstream.
+
+    Returns
+    -------
+    dict
+        Mapping of upstream name to its stats, breaker state and current p50/p99 latency.
+    """
+    with _guards_lock:
+        guards = dict(_guards)
+    metrics = {}
+    for name, guard in guards.items():
+        with guard.latency._lock:
+            ordered = sorted(guard.latency.samples)
+        with guard._stats_lock:
+            metrics[name] = dict(guard.stats)
+        metrics[name]["breaker"] = guard.breaker.state
+        metrics[name]["p50"] = ordered[len(ordered) // 2] if ordered else None
+        metrics[name]["p99"] = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] if ordered else None
+    return metrics
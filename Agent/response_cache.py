@@ -0,0 +1,124 @@
+from globals import Config
+from collections import OrderedDict
+import hashlib
+import logging
+import math
+import threading
+import time
+
+class SemanticResponseCache:
+    """
+    Process-wide, opt-in cache of dialogue-policy responses to recurring student questions.
+
+    Entries are grouped by a learner-state fingerprint (task segment, current strategy, mastery rounded to
+    `Config.response_cache_mastery_step` and a hash of the computational model), so a cached response is
+    only reused for a group in the same situation. Within a fingerprint, a query matches the most similar
+    cached query if their cosine similarity is at least `Config.response_cache_threshold` and the entry is
+    younger than `Config.response_cache_ttl` seconds.
+
+    Attributes
+    ----------
+    entries : OrderedDict
+        Fingerprint -> list of dicts with "embedding", "norm", "response" and "time", least recently used first.
+    stats : dict
+        Counts of lookups, hits and stores.
+    """
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.stats = {"lookups": 0, "hits": 0, "stores": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(learner_model):
+        """
+        The learner-state key a response is valid for.
+
+        Parameters
+        ----------
+        learner_model : LearnerModel
+            The group's learner model.
+
+        Returns
+        -------
+        tuple
+            (segment, strategy, rounded overall mastery, computational model hash).
+        """
+        segment = learner_model.task_contexts[-1]["segment"] if learner_model.task_contexts else None
+        strategy = learner_model.strategies[-1]["strategy"] if learner_model.strategies else None
+        mastery = None
+        if learner_model.model_scores:
+            scores = learner_model.model_scores[-1]["scores"]
+            overall = scores.get("overall_mastery", scores["total_score"] / Config.n_rubric_scores)
+            mastery = int(overall // Config.response_cache_mastery_step)
+        model_hash = hashlib.sha1(learner_model.user_model.encode("utf-8")).hexdigest()[:16]
+        return segment, strategy, mastery, model_hash
+
+    def lookup(self, fingerprint, embedding):
+        """
+        Returns the cached response for the most similar recent query with the same fingerprint.
+
+        Parameters
+        ----------
+        fingerprint : tuple
+            From `fingerprint`.
+        embedding : list of float
+            Embedding of the student query.
+
+        Returns
+        -------
+        dict or None
+            The cached response data, or None on a miss.
+        """
+        norm = math.sqrt(sum(x * x for x in embedding)) or 1.0
+        now = time.time()
+        with self._lock:
+            self.stats["lookups"] += 1
+            candidates = self.entries.get(fingerprint)
+            if not candidates:
+                return None
+            self.entries.move_to_end(fingerprint)
+            candidates[:] = [e for e in candidates if now - e["time"] < Config.response_cache_ttl]
+            best, best_score = None, -1.0
+            for entry in candidates:
+                score = sum(a * b for a, b in zip(embedding, entry["embedding"])) / (norm * entry["norm"])
+                if score > best_score:
+                    best, best_score = entry, score
+            if best is None or best_score < Config.response_cache_threshold:
+                return None
+            self.stats["hits"] += 1
+        logging.info(f"Semantic response cache hit (similarity {best_score:.3f}).")
+        return dict(best["response"])
+
+    def store(self, fingerprint, embedding, response):
+        """
+        Caches a response, evicting the least recently used fingerprints beyond `Config.response_cache_size` entries.
+
+        Parameters
+        ----------
+        fingerprint : tuple
+            From `fingerprint`.
+        embedding : list of float
+            Embedding of the student query.
+        response : dict
+            The parsed dialogue-policy response ("summary", "agent_talk_move", "dialogue_policy", "response").
+        """
+        entry = {"embedding": embedding, "norm": math.sqrt(sum(x * x for x in embedding)) or 1.0, "response": dict(response), "time": time.time()}
+        with self._lock:
+            self.entries.setdefault(fingerprint, []).append(entry)
+            self.entries.move_to_end(fingerprint)
+            self.stats["stores"] += 1
+            while sum(len(v) for v in self.entries.values()) > Config.response_cache_size:
+                oldest = next(iter(self.entries))
+                self.entries[oldest].pop(0)
+                if not self.entries[oldest]:
+                    del self.entries[oldest]
+
+
+_cache = SemanticResponseCache()
+
+
+def get_response_cache():
+    """
+    Returns the process-wide semantic response cache shared by every session.
+    """
+    return _cache
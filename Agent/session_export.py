@@ -0,0 +1,321 @@
+from globals import Config
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import json
+import logging
+import os
+import re
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+"""
+Columnar export of saved session artifacts for cross-session analysis.
+
+The agent saves each session as small pretty-printed JSON files named
+`<task>_Group<group>_<epoch>_<KIND>.json`:
+    CONVO       conversation messages       (Config.convo_save_path)
+    DIALOGUE    dialogue policy responses   (saved_chats/dialogue_management)
+    STRATEGIES  detected strategies         (saved_chats/strategies)
+    RAG         retrieved domain knowledge  (Config.retrieved_domain_knowledge_save_path)
+
+`export` scans those directories with `Config.export_workers` parallel processes and writes one Parquet
+dataset per kind under `Config.session_export_dir`, hive-partitioned by task, group and session epoch
+(e.g. strategies/task=kinematics/group=3/session_epoch=1727890000/part-0.parquet). Re-exporting only
+replaces the partitions of the sessions it read. Each row also carries its position in the file (`seq`)
+and its timestamp as epoch milliseconds (`time_ms`); fields outside a table's schema are kept as JSON in
+`extra`.
+
+Usage:
+    python session_export.py export [--source <dir> ...] [--out <dir>]
+    python session_export.py query strategies --group 3 --count-by strategy
+    python session_export.py query dialogue_management --where agent_talk_move=REVOICING --columns group,response
+"""
+
+file_pattern = re.compile(r"^(?P<task>.+)_Group(?P<group>[^_]+)_(?P<epoch>\d+)_(?P<kind>CONVO|DIALOGUE|STRATEGIES|RAG)\.json$")
+
+tables = {
+    "CONVO": "conversations",
+    "DIALOGUE": "dialogue_management",
+    "STRATEGIES": "strategies",
+    "RAG": "retrieved_domain_knowledge"
+}
+
+table_fields = {
+    "conversations": ["role", "content", "timestamp"],
+    "dialogue_management": ["timestamp", "summary", "agent_talk_move", "dialogue_policy", "response", "source"],
+    "strategies": ["timestamp", "summary", "strategy", "source"],
+    "retrieved_domain_knowledge": ["timestamp", "summary", "recommended_domain_knowledge", "knowledge", "source"]
+}
+
+partitioning = ds.partitioning(
+    pa.schema([("task", pa.string()), ("group", pa.string()), ("session_epoch", pa.int64())]),
+    flavor="hive"
+)
+
+
+def table_schema(table):
+    """
+    The Arrow schema of an exported table, including the partition columns.
+    """
+    fields = [("task", pa.string()), ("group", pa.string()), ("session_epoch", pa.int64()), ("file", pa.string()),
+              ("seq", pa.int32()), ("time_ms", pa.int64())]
+    fields += [(name, pa.string()) for name in table_fields[table]]
+    fields.append(("extra", pa.string()))
+    return pa.schema(fields)
+
+
+def default_sources():
+    """
+    The directories the agent saves session artifacts to.
+    """
+    sources = [Config.convo_save_path, "saved_chats/dialogue_management", "saved_chats/strategies", Config.retrieved_domain_knowledge_save_path]
+    unique = []
+    for source in sources:
+        if source and os.path.normpath(source) not in unique:
+            unique.append(os.path.normpath(source))
+    return unique
+
+
+def find_session_files(sources):
+    """
+    Lists the session artifact files under the source directories.
+
+    Returns
+    -------
+    list of str
+        Paths of files whose names match `file_pattern`.
+    """
+    paths = set()
+    for source in sources:
+        for root, _, files in os.walk(source):
+            for name in files:
+                if file_pattern.match(name):
+                    paths.add(os.path.join(root, name))
+    return sorted(paths)
+
+
+def parse_timestamp(timestamp):
+    """
+    Converts a saved 'YYYY-MM-DD HH:MM:SS TZ±HHMM' timestamp to epoch milliseconds (None if it cannot be parsed).
+    """
+    if not isinstance(timestamp, str) or len(timestamp) < 24:
+        return None
+    try:
+        parsed = datetime.datetime.strptime(timestamp[:19] + timestamp[-5:], '%Y-%m-%d %H:%M:%S%z')
+    except ValueError:
+        return None
+    return int(parsed.timestamp() * 1000)
+
+
+def _text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def read_session_file(path):
+    """
+    Reads one session artifact into flat rows. Runs in the scanner's worker processes.
+
+    Returns
+    -------
+    tuple
+        (table name, list of row dicts), or (None, []) if the file cannot be read.
+    """
+    match = file_pattern.match(os.path.basename(path))
+    table = tables[match.group("kind")]
+    try:
+        with open(path, 'r') as f:
+            records = json.load(f)
+    except (IOError, json.JSONDecodeError) as e:
+        logging.error(f"Error reading session file '{path}': {e}")
+        return None, []
+    if not isinstance(records, list):
+        records = [records]
+
+    fields = table_fields[table]
+    rows = []
+    for seq, record in enumerate(records):
+        if not isinstance(record, dict):
+            record = {"content": record}
+        row = {
+            "task": match.group("task"),
+            "group": match.group("group"),
+            "session_epoch": int(match.group("epoch")),
+            "file": os.path.basename(path),
+            "seq": seq,
+            "time_ms": parse_timestamp(record.get("timestamp"))
+        }
+        for name in fields:
+            row[name] = _text(record.get(name))
+        extra = {k: v for k, v in record.items() if k not in fields}
+        row["extra"] = json.dumps(extra) if extra else None
+        rows.append(row)
+    return table, rows
+
+
+def export(sources=None, out_dir=None, workers=None):
+    """
+    Converts every session artifact under `sources` into partitioned Parquet datasets.
+
+    Parameters
+    ----------
+    sources : list of str, optional
+        Directories to scan. Defaults to `default_sources()`.
+    out_dir : str, optional
+        Output directory. Defaults to `Config.session_export_dir`.
+    workers : int, optional
+        Parallel reader processes. Defaults to `Config.export_workers`.
+
+    Returns
+    -------
+    dict
+        Rows written per table.
+    """
+    sources = sources or default_sources()
+    out_dir = out_dir or Config.session_export_dir
+    workers = workers or Config.export_workers
+
+    paths = find_session_files(sources)
+    logging.info(f"Exporting {len(paths)} session files from {sources} with {workers} workers.")
+
+    rows = {table: [] for table in table_fields}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for table, file_rows in pool.map(read_session_file, paths, chunksize=max(1, len(paths) // (workers * 8))):
+            if table is not None:
+                rows[table].extend(file_rows)
+
+    counts = {}
+    for table, table_rows in rows.items():
+        counts[table] = len(table_rows)
+        if not table_rows:
+            continue
+        ds.write_dataset(
+            pa.Table.from_pylist(table_rows, schema=table_schema(table)),
+            os.path.join(out_dir, table),
+            format="parquet",
+            partitioning=partitioning,
+            existing_data_behavior="delete_matching"
+        )
+    logging.info(f"Successfully exported session files to '{out_dir}': {counts}")
+    return counts
+
+
+def open_table(table, out_dir=None):
+    """
+    Opens an exported table as a pyarrow dataset.
+    """
+    path = os.path.join(out_dir or Config.session_export_dir, table)
+    return ds.dataset(path, format="parquet", partitioning=partitioning, schema=table_schema(table))
+
+
+def query(table, out_dir=None, task=None, group=None, since=None, until=None, where=None, columns=None, count_by=None, limit=None):
+    """
+    Reads an exported table with partition pruning and simple filters.
+
+    Parameters
+    ----------
+    table : str
+        One of `table_fields`.
+    task, group : str, optional
+        Partition filters.
+    since, until : int, optional
+        Session epoch bounds (seconds, inclusive).
+    where : list of str, optional
+        "column=value" equality filters; the value is converted to the column's type.
+    columns : list of str, optional
+        Columns to return.
+    count_by : str, optional
+        Return row counts per value of this column instead of rows.
+    limit : int, optional
+        Maximum rows to return.
+
+    Returns
+    -------
+    pyarrow.Table
+
+    Raises
+    ------
+    ValueError
+        If a where clause is not "column=value", names a column the table does not have, or has a value
+        that cannot be converted to the column's type.
+    """
+    schema = table_schema(table)
+    expression = None
+    conditions = []
+    if task is not None:
+        conditions.append(ds.field("task") == task)
+    if group is not None:
+        conditions.append(ds.field("group") == str(group))
+    if since is not None:
+        conditions.append(ds.field("session_epoch") >= since)
+    if until is not None:
+        conditions.append(ds.field("session_epoch") <= until)
+    for clause in where or []:
+        if "=" not in clause:
+            raise ValueError(f"Invalid where clause '{clause}': expected column=value.")
+        column, value = (part.strip() for part in clause.split("=", 1))
+        if column not in schema.names:
+            raise ValueError(f"Unknown column '{column}' in where clause for table '{table}'; columns are {', '.join(schema.names)}.")
+        try:
+            value = pa.scalar(value).cast(schema.field(column).type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ValueError(f"Invalid value '{value}' for {schema.field(column).type} column '{column}': {e}")
+        conditions.append(ds.field(column) == value)
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    dataset = open_table(table, out_dir)
+    if count_by:
+        result = dataset.to_table(filter=expression, columns=[count_by])
+        result = result.group_by(count_by).aggregate([(count_by, "count")])
+        return result.sort_by([(f"{count_by}_count", "descending")])
+
+    result = dataset.to_table(filter=expression, columns=columns)
+    sort_keys = [(name, "ascending") for name in ("session_epoch", "group", "seq") if name in result.column_names]
+    if sort_keys:
+        result = result.take(pc.sort_indices(result, sort_keys=sort_keys))
+    if limit is not None:
+        result = result.slice(0, limit)
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export saved sessions to partitioned Parquet and query them.")
+    parser.add_argument("--out", default=None, help="Export directory (default: SESSION_EXPORT_DIR)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Convert saved session JSON files to Parquet")
+    export_parser.add_argument("--source", action="append", help="Directory to scan (repeatable; default: the agent's save paths)")
+    export_parser.add_argument("--workers", type=int, default=None)
+
+    query_parser = subparsers.add_parser("query", help="Query an exported table")
+    query_parser.add_argument("table", choices=list(table_fields))
+    query_parser.add_argument("--task")
+    query_parser.add_argument("--group")
+    query_parser.add_argument("--since", type=int, help="First session epoch (seconds)")
+    query_parser.add_argument("--until", type=int, help="Last session epoch (seconds)")
+    query_parser.add_argument("--where", action="append", help="column=value (repeatable)")
+    query_parser.add_argument("--columns", help="Comma-separated columns")
+    query_parser.add_argument("--count-by", help="Count rows per value of a column")
+    query_parser.add_argument("--limit", type=int, default=50)
+    query_parser.add_argument("--csv", action="store_true", help="Print CSV instead of a table")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "export":
+        export(args.source, args.out, args.workers)
+    else:
+        try:
+            result = query(
+                args.table, args.out, task=args.task, group=args.group, since=args.since, until=args.until, where=args.where,
+                columns=args.columns.split(",") if args.columns else None, count_by=args.count_by,
+                limit=None if args.count_by else args.limit
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        frame = result.to_pandas()
+        print(frame.to_csv(index=False) if args.csv else frame.to_string(index=False))
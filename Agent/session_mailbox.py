@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+
+class LatestWinsMailbox:
+    """
+    Per-connection, latest-wins mailbox for high-frequency C2STEM messages.
+
+    Messages of a coalesced type (e.g. "state" and "score") are not applied one by one. Each type has a
+    single slot: a new message replaces the pending one, so intermediate snapshots sent while a student
+    drags blocks are dropped before any processing. A type is applied at most once per `interval`
+    seconds: the first message after a quiet period is applied immediately and the newest message of a
+    burst is applied when the interval ends.
+
+    Runs on the connection's event loop; `apply` is called synchronously on that loop.
+
+    Parameters
+    ----------
+    apply : callable
+        apply(kind, time_ms, data), called with the newest pending message of a type.
+    interval : float
+        Minimum seconds between two applied messages of the same type; 0 applies every message.
+
+    Attributes
+    ----------
+    stats : dict
+        Counts of messages received, applied and dropped (replaced before being applied).
+    """
+    def __init__(self, apply, interval):
+        self.apply = apply
+        self.interval = interval
+        self.pending = {}
+        self.last_applied = {}
+        self.timers = {}
+        self.stats = {"received": 0, "applied": 0, "dropped": 0}
+
+    def put(self, kind, time_ms, data):
+        """
+        Offers a message; it is applied now, replaces the pending one, or waits for the interval to end.
+
+        Parameters
+        ----------
+        kind : str
+            Message type.
+        time_ms : int
+            Arrival time in epoch milliseconds.
+        data : Any
+            Message payload.
+        """
+        self.stats["received"] += 1
+        if kind in self.pending:
+            self.stats["dropped"] += 1
+        self.pending[kind] = (time_ms, data)
+        if kind in self.timers:
+            return
+
+        wait = self.last_applied.get(kind, float("-inf")) + self.interval - time.monotonic()
+        if wait <= 0:
+            self._flush(kind)
+        else:
+            self.timers[kind] = asyncio.get_running_loop().call_later(wait, self._flush, kind)
+
+    def _flush(self, kind):
+        self.timers.pop(kind, None)
+        item = self.pending.pop(kind, None)
+        if item is None:
+            return
+        self.last_applied[kind] = time.monotonic()
+        self.stats["applied"] += 1
+        try:
+            self.apply(kind, *item)
+        except Exception as e:
+            logging.error(f"Error applying coalesced '{kind}' message: {e}")
+
+    def close(self):
+        """
+        Cancels pending timers and applies the newest message of every type, so the last state is never lost.
+        """
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        for kind in list(self.pending):
+            self._flush(kind)
+        if self.stats["dropped"]:
+            logging.info(f"Coalesced {self.stats['received']} messages into {self.stats['applied']} updates in LatestWinsMailbox class.")
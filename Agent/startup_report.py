@@ -0,0 +1,123 @@
+import subprocess
+import sys
+import time
+import logging
+
+"""
+Startup-time report for the agent process.
+
+Breaks cold-start cost down per module (measured with `python -X importtime` in a fresh
+interpreter, so nothing is already cached in `sys.modules`) and per initialization step
+of the agent (Agent construction, OpenAI client, Pinecone client and index).
+
+Usage:
+    python startup_report.py          # import costs only
+    python startup_report.py --init   # also time Agent/RAG initialization (needs API keys)
+"""
+
+# Project modules in dependency order, plus the heavy third-party packages they may pull in
+project_modules = ["c2stem_action", "c2stem_state", "globals", "structured_logging", "tracing", "profiler", "clients", "resilience", "rate_limiter", "model_routing", "learner_features", "strategy_detector", "event_store", "learner_model", "checkpoint", "lexical_index", "coalescer", "embedding_batcher", "quantized_store", "vector_index", "rag", "knowledge_cache", "response_cache", "ingest", "session_export", "session_mailbox", "framing", "agent", "supervisor", "main"]
+third_party_modules = ["openai", "pinecone", "gradio", "websockets"]
+
+
+def measure_import(module):
+    """
+    Measures the cost of importing a module into a fresh interpreter.
+
+    Parameters
+    ----------
+    module : str
+        The module name to import.
+
+    Returns
+    -------
+    dict
+        Keys "module", "total_ms" (wall time of the top-level import, including everything it
+        pulls in), "self_ms" (time spent in the module body itself) and "error" (None on success).
+    """
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, timeout=300
+        )
+    except subprocess.TimeoutExpired:
+        return {"module": module, "total_ms": None, "self_ms": None, "error": "timeout"}
+
+    self_us, total_us = None, None
+    for line in proc.stderr.splitlines():
+        # Format: "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            self_us, total_us = int(parts[0]), int(parts[1])
+
+    error = None
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+    return {
+        "module": module,
+        "total_ms": total_us / 1000 if total_us is not None else None,
+        "self_ms": self_us / 1000 if self_us is not None else None,
+        "error": error
+    }
+
+
+def measure_init():
+    """
+    Times each step of agent initialization in the current process.
+
+    Returns
+    -------
+    list of tuple
+        (step name, milliseconds or None, error message or None) for each step.
+    """
+    steps = []
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        try:
+            result = fn()
+            steps.append((name, (time.perf_counter() - start) * 1000, None))
+            return result
+        except Exception as e:
+            steps.append((name, None, str(e)))
+            return None
+
+    agent_module = timed("import agent", lambda: __import__("agent"))
+    if agent_module is None:
+        return steps
+    agent = timed("Agent()", lambda: agent_module.Agent(use_gui=False))
+    if agent is None:
+        return steps
+    timed("Agent.openai_client", lambda: agent.openai_client)
+    timed("RAG.vector_store", lambda: agent.RAG.vector_store)
+    timed("RAG.index", lambda: agent.RAG.index)
+    return steps
+
+
+def print_report(include_init=False):
+    """
+    Prints the startup-time report.
+
+    Parameters
+    ----------
+    include_init : bool, optional
+        Whether to also time agent initialization, by default False.
+    """
+    print(f"{'MODULE':<20}{'TOTAL (ms)':>12}{'SELF (ms)':>12}  NOTES")
+    for module in project_modules + third_party_modules:
+        r = measure_import(module)
+        total = f"{r['total_ms']:.1f}" if r["total_ms"] is not None else "-"
+        own = f"{r['self_ms']:.1f}" if r["self_ms"] is not None else "-"
+        print(f"{module:<20}{total:>12}{own:>12}  {r['error'] or ''}")
+
+    if include_init:
+        print(f"\n{'INIT STEP':<32}{'TIME (ms)':>12}  NOTES")
+        for name, ms, error in measure_init():
+            print(f"{name:<32}{(f'{ms:.1f}' if ms is not None else '-'):>12}  {error or ''}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    print_report(include_init="--init" in sys.argv[1:])
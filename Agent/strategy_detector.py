@@ -0,0 +1,65 @@
+from globals import Config
+import logging
+
+class StrategyDetector:
+    """
+    Deterministic sliding-window strategy classifier over parsed `C2STEMAction` events.
+
+    Some strategies in `LearnerModel.strategies_map` are defined by directly observable action
+    patterns. This class labels those clear cases locally so the periodic strategy task only
+    calls the LLM for ambiguous windows.
+
+    Rules (applied to the actions in the last `Config.strategy_window_seconds`):
+    - TOOL_USE: at least one `tableDialog` or `graphDialog` action.
+    - RUN_REPEAT: the window ends with `Config.run_repeat_min` or more green-flag runs with no
+      edits in between.
+    - DRAFTING: at least `Config.drafting_min` blocks added unattached to any script, making up
+      at least half of the edits in the window.
+
+    If no rule fires, or more than one does, the window is ambiguous and `classify` returns None.
+
+    The detector reads the precomputed window from `ActivityFeatures` rather than scanning the
+    action history itself.
+    """
+
+    def classify(self, features, now_ms):
+        """
+        Labels the recent action window if it clearly matches one rule-defined strategy.
+
+        Parameters
+        ----------
+        features : ActivityFeatures
+            The learner model's incremental feature counters.
+        now_ms : int
+            Current time in epoch milliseconds.
+
+        Returns
+        -------
+        dict or None
+            {"strategy": <label>, "summary": <rule explanation>} for a clear case, or None if the
+            window is empty or ambiguous and should be sent to the LLM.
+        """
+        window = features.snapshot(Config.strategy_window_seconds, now_ms)
+        if window["actions"] == 0:
+            return None
+
+        matches = []
+
+        if window["tool_uses"] > 0:
+            matches.append(("TOOL_USE", f"Opened the Graph/Table tools {window['tool_uses']} time(s) in the last {Config.strategy_window_seconds} seconds."))
+
+        trailing_runs = min(window["consecutive_runs"], window["runs"])
+        if trailing_runs >= Config.run_repeat_min:
+            matches.append(("RUN_REPEAT", f"Clicked the Green Flag {trailing_runs} times in a row without changing the model."))
+
+        unattached = window["unattached_adds"]
+        if unattached >= Config.drafting_min and unattached * 2 >= window["edits"]:
+            matches.append(("DRAFTING", f"Added {unattached} blocks that are not connected to a runnable script."))
+
+        if len(matches) != 1:
+            logging.info(f"Strategy window ambiguous for rule-based detector ({[m[0] for m in matches]}); deferring to LLM.")
+            return None
+
+        strategy, summary = matches[0]
+        logging.info(f"Rule-based strategy detected: {strategy}")
+        return {"strategy": strategy, "summary": summary}
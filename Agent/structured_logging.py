@@ -0,0 +1,163 @@
+from globals import Config
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+"""
+Non-blocking, structured logging for the agent server.
+
+`configure_logging()` replaces the root handlers with a `QueueHandler`: callers only put the unformatted
+record on a bounded queue, and a background `QueueListener` thread formats, serializes and writes it. When the
+queue is full (the writer cannot keep up), records are dropped and counted instead of blocking the
+WebSocket or chat paths.
+
+Records are written as one JSON object per line (`Config.log_format` "json") or as plain text ("text").
+Messages longer than `Config.log_max_chars` are cut; tracebacks are kept whole (the "exception" field in JSON). Hot-path records carry a category
+(`extra={"category": "action"}`) and are sampled per category with the rates in `Config.log_sample_rates`,
+e.g. "action=0.1,state=0.2"; warnings and errors are never sampled out. Bulky dumps (full computational
+models, retrieved passages, message histories) are logged at DEBUG and only emitted with LOG_LEVEL=DEBUG.
+"""
+
+_listener = None
+dropped_records = 0
+
+
+def _truncate(message):
+    if len(message) > Config.log_max_chars:
+        return message[:Config.log_max_chars] + f"... [{len(message) - Config.log_max_chars} chars truncated]"
+    return message
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single-line JSON object with a size-capped message.
+    """
+    def format(self, record):
+        message = _truncate(record.getMessage())
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "process": record.process,
+            "category": getattr(record, "category", None),
+            "message": message
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    The default text format with the same message size cap as `JsonFormatter`; tracebacks follow uncut.
+    """
+    def formatMessage(self, record):
+        record.message = _truncate(record.message)
+        return super().formatMessage(record)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a random fraction of INFO/DEBUG records per category, as set in `Config.log_sample_rates`.
+    """
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        category = getattr(record, "category", None)
+        if category is None or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < self.rates.get(category, 1.0)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A queue handler that drops records instead of blocking when the queue is full.
+    """
+    def prepare(self, record):
+        # Unlike the stock handler, do not format on the calling thread: the listener's formatter merges
+        # msg/args and renders the exception. Only the traceback is reduced to text here, so the record
+        # does not keep the failing frames alive while it waits in the queue.
+        record = copy.copy(record)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        global dropped_records
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records += 1
+
+
+def parse_sample_rates(value):
+    """
+    Parses "category=rate,..." into a dict, ignoring malformed entries.
+    """
+    rates = {}
+    for part in (value or "").split(","):
+        if "=" in part:
+            category, rate = part.split("=", 1)
+            try:
+                rates[category.strip()] = float(rate)
+            except ValueError:
+                continue
+    return rates
+
+
+def configure_logging(prefix=None):
+    """
+    Installs the queue-based pipeline on the root logger. Safe to call more than once.
+
+    Parameters
+    ----------
+    prefix : str, optional
+        Text-format prefix identifying the process (e.g. "worker 2").
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    if Config.log_path:
+        handler = logging.FileHandler(Config.log_path)
+    else:
+        handler = logging.StreamHandler(sys.stderr)
+    if Config.log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter(f"[{prefix}] %(levelname)s:%(name)s:%(message)s" if prefix else "%(levelname)s:%(name)s:%(message)s"))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=Config.log_queue_size))
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(Config.log_sample_rates)))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, Config.log_level.upper(), logging.INFO))
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """
+    Flushes queued records and stops the background writer.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,352 @@
+from globals import Config
+from urllib.parse import urlparse, parse_qs
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+
+"""
+Multi-process agent server with group-affine WebSocket routing.
+
+The supervisor starts `Config.workers` worker processes. Each worker runs the regular server from
+`main.py` (WebSocket handler, per-group agents, background loops and its own Gradio app) on its own ports:
+WebSocket `Config.worker_base_port + i` and Gradio `Config.gradio_port + i`. The supervisor listens on
+`Config.websocket_port` and forwards every connection to the worker that owns the connection's group,
+chosen by consistent hashing on the group id, so a group's session state always lives in one worker.
+
+Clients pass their group id in the connection URL (ws://host:8080/?group=<id>); connections without one
+use `Config.group`.
+
+Workers can be drained and brought back without disturbing the others through a local admin connection
+on the `/admin` path:
+    {"drain": <worker>}    stop routing new groups to the worker, stop it once its connections close
+    {"restore": <worker>}  restart the worker if needed and route its groups back to it
+    {"status": true}       report workers, their state and open connections
+    {"profile": "start" | "stop" | "status", "worker": <worker>}
+                           forward a profiler command (see profiler.py) to one worker, or to all without "worker"
+Only the groups owned by a drained worker move; every other group keeps its worker. A draining worker
+keeps the groups it already holds until it stops, and a group only moves once the worker has exited and
+written its final checkpoints, so the new owner restores the group's latest state and no two workers hold
+it at once.
+"""
+
+
+def connection_path(websocket):
+    """
+    The request path (with query string) of a WebSocket connection, across websockets versions.
+    """
+    request = getattr(websocket, "request", None)
+    return request.path if request is not None else websocket.path
+
+
+def is_local_connection(websocket):
+    """
+    Whether a connection comes from this machine (admin commands are only accepted locally).
+    """
+    host = websocket.remote_address[0] if websocket.remote_address else None
+    return host in ("127.0.0.1", "::1", "localhost")
+
+
+def connection_group(websocket):
+    """
+    The group id a connection belongs to, from the `group` query parameter or `Config.group`.
+    """
+    query = parse_qs(urlparse(connection_path(websocket)).query)
+    return query.get("group", [Config.group or "0"])[0]
+
+
+class HashRing:
+    """
+    Consistent hash ring with virtual nodes.
+
+    Parameters
+    ----------
+    replicas : int
+        Virtual nodes per worker; more nodes spread groups more evenly.
+    """
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.keys = []
+        self.nodes = {}
+
+    @staticmethod
+    def _hash(value):
+        return int(hashlib.md5(str(value).encode("utf-8")).hexdigest()[:16], 16)
+
+    def add(self, node):
+        for r in range(self.replicas):
+            key = self._hash(f"{node}#{r}")
+            bisect.insort(self.keys, key)
+            self.nodes[key] = node
+
+    def remove(self, node):
+        for r in range(self.replicas):
+            key = self._hash(f"{node}#{r}")
+            if key in self.nodes:
+                del self.nodes[key]
+                self.keys.remove(key)
+
+    def get(self, item):
+        """
+        Returns the node owning `item`, or None if the ring is empty.
+        """
+        if not self.keys:
+            return None
+        i = bisect.bisect(self.keys, self._hash(item)) % len(self.keys)
+        return self.nodes[self.keys[i]]
+
+
+def run_worker(index):
+    """
+    Entry point of a worker process: serves the agent on the worker's own WebSocket and Gradio ports.
+    """
+    import main
+    from structured_logging import configure_logging
+    from profiler import install_signal_handler
+
+    Config.websocket_port = Config.worker_base_port + index
+    Config.gradio_port = Config.gradio_port + index
+    main.worker_mode = True
+    configure_logging(prefix=f"worker {index}")
+    install_signal_handler()
+    # A drained worker is stopped with SIGTERM; flush its groups' checkpoints before exiting
+    main.install_shutdown_handler()
+    asyncio.run(main.main())
+
+
+class Supervisor:
+    """
+    Starts the worker processes and routes client connections to them.
+
+    Attributes
+    ----------
+    processes : dict
+        Worker index -> multiprocessing.Process.
+    connections : dict
+        Worker index -> number of open proxied connections.
+    draining : set
+        Workers removed from the ring that are waiting for their connections to close.
+    served : dict
+        Worker index -> groups whose session state the worker holds (every group it has been routed since it started).
+    stopping : dict
+        Drained worker index -> asyncio.Event set once the worker has exited.
+    """
+    def __init__(self, n_workers):
+        self.n_workers = n_workers
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = {}
+        self.connections = {i: 0 for i in range(n_workers)}
+        self.draining = set()
+        self.served = {i: set() for i in range(n_workers)}
+        self.stopping = {}
+        self.ring = HashRing(Config.hash_ring_replicas)
+
+    def start_worker(self, index):
+        process = self.context.Process(target=run_worker, args=(index,), name=f"agent-worker-{index}", daemon=True)
+        process.start()
+        self.processes[index] = process
+        self.served[index] = set()
+        logging.info(f"Started agent worker {index} (pid {process.pid}) on port {Config.worker_base_port + index}.")
+
+    def start(self):
+        for i in range(self.n_workers):
+            self.start_worker(i)
+            self.ring.add(i)
+
+    async def _pipe(self, source, destination):
+        async for message in source:
+            await destination.send(message)
+
+    async def _route(self, group):
+        """
+        The worker for a new connection of `group`.
+
+        A draining worker still holds the state of the groups it served, so their connections stay with it while
+        it runs. While it is stopping, they wait for it to exit (and flush its checkpoints) before moving on the ring.
+        """
+        for worker in list(self.draining):
+            if group not in self.served[worker]:
+                continue
+            stopped = self.stopping.get(worker)
+            if stopped is None and self.processes[worker].is_alive():
+                return worker
+            if stopped is not None:
+                await stopped.wait()
+        return self.ring.get(group)
+
+    async def proxy(self, websocket):
+        """
+        Forwards one client connection to its group's worker until either side closes.
+        """
+        import websockets
+
+        path = connection_path(websocket)
+        if urlparse(path).path == "/admin":
+            await self.admin(websocket)
+            return
+
+        group = connection_group(websocket)
+        worker = await self._route(group)
+        if worker is None:
+            logging.error(f"No agent worker available for group {group}.")
+            await websocket.close(code=1013, reason="No agent worker available")
+            return
+
+        self.connections[worker] += 1
+        self.served[worker].add(group)
+        try:
+            # Frames are relayed unchanged (text or binary); compressing the local hop would only cost CPU
+            async with websockets.connect(f"ws://localhost:{Config.worker_base_port + worker}{path}", max_size=None, compression=None) as upstream:
+                logging.info(f"Routed group {group} to agent worker {worker}.")
+                tasks = [asyncio.create_task(self._pipe(websocket, upstream)), asyncio.create_task(self._pipe(upstream, websocket))]
+                done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in pending:
+                    task.cancel()
+        except Exception as e:
+            logging.error(f"Error proxying group {group} to agent worker {worker}: {e}")
+        finally:
+            self.connections[worker] -= 1
+            if worker in self.draining and self.connections[worker] == 0:
+                await self._stop_drained(worker)
+
+    async def drain(self, worker):
+        """
+        Stops routing new groups to a worker; it is stopped once its open connections close.
+        """
+        if worker not in self.processes or worker in self.draining:
+            return
+        self.ring.remove(worker)
+        self.draining.add(worker)
+        logging.info(f"Draining agent worker {worker} ({self.connections[worker]} open connections).")
+        if self.connections[worker] == 0:
+            await self._stop_drained(worker)
+
+    async def _stop_drained(self, worker):
+        """
+        Stops a drained worker without blocking the event loop that proxies every other group.
+
+        SIGTERM lets the worker write its final session checkpoints (see `main.install_shutdown_handler`);
+        it is killed if it has not exited after `Config.worker_stop_timeout` seconds.
+        """
+        if worker in self.stopping:
+            return
+        stopped = self.stopping[worker] = asyncio.Event()
+        process = self.processes[worker]
+        try:
+            if process.is_alive():
+                process.terminate()
+                await asyncio.to_thread(process.join, Config.worker_stop_timeout)
+                if process.is_alive():
+                    logging.error(f"Drained agent worker {worker} did not exit after SIGTERM; killing it.")
+                    process.kill()
+                    await asyncio.to_thread(process.join)
+            logging.info(f"Stopped drained agent worker {worker}.")
+        finally:
+            # Its groups' checkpoints are flushed; connections waiting for them can move to their new workers
+            self.served[worker] = set()
+            stopped.set()
+
+    def restore(self, worker):
+        """
+        Restarts a drained or dead worker and routes its groups back to it.
+        """
+        if worker not in self.processes:
+            return
+        if not self.processes[worker].is_alive():
+            self.start_worker(worker)
+        self.stopping.pop(worker, None)
+        if worker in self.draining:
+            self.draining.discard(worker)
+            self.ring.add(worker)
+        logging.info(f"Restored agent worker {worker}.")
+
+    def status(self):
+        return {
+            str(i): {"alive": p.is_alive(), "draining": i in self.draining, "connections": self.connections[i]}
+            for i, p in self.processes.items()
+        }
+
+    async def admin(self, websocket):
+        """
+        Handles admin commands; only local connections are accepted.
+        """
+        if not is_local_connection(websocket):
+            await websocket.close(code=1008, reason="Admin commands are only accepted locally")
+            return
+        async for message in websocket:
+            try:
+                command = json.loads(message)
+                if "profile" in command:
+                    await websocket.send(json.dumps({"type": "profile", "data": await self.profile(command)}))
+                    continue
+                if "drain" in command:
+                    await self.drain(int(command["drain"]))
+                elif "restore" in command:
+                    self.restore(int(command["restore"]))
+                await websocket.send(json.dumps({"type": "status", "data": self.status()}))
+            except (json.JSONDecodeError, TypeError, ValueError) as e:
+                await websocket.send(json.dumps({"type": "error", "data": f"Invalid admin command: {e}"}))
+
+    async def profile(self, command):
+        """
+        Forwards a profiler command to the worker given in `command["worker"]`, or to every live worker.
+
+        Returns
+        -------
+        dict
+            Worker index -> the worker's profiler status, or the error contacting it.
+        """
+        import websockets
+
+        if "worker" in command:
+            workers = [int(command["worker"])]
+        else:
+            workers = [i for i, p in self.processes.items() if p.is_alive()]
+        forwarded = {k: v for k, v in command.items() if k != "worker"}
+        replies = {}
+        for worker in workers:
+            try:
+                async with websockets.connect(f"ws://localhost:{Config.worker_base_port + worker}/admin", compression=None) as upstream:
+                    await upstream.send(json.dumps(forwarded))
+                    replies[str(worker)] = json.loads(await upstream.recv())["data"]
+            except Exception as e:
+                replies[str(worker)] = f"Error contacting agent worker {worker}: {e}"
+        return replies
+
+    async def monitor(self):
+        """
+        Restarts workers that exit unexpectedly (drained workers are left stopped).
+        """
+        while True:
+            await asyncio.sleep(Config.worker_monitor_interval)
+            for i, process in list(self.processes.items()):
+                if i not in self.draining and not process.is_alive():
+                    logging.error(f"Agent worker {i} exited with code {process.exitcode}; restarting.")
+                    self.start_worker(i)
+
+    async def serve(self):
+        import websockets
+        from framing import serve_options
+
+        self.start()
+        async with websockets.serve(self.proxy, "localhost", Config.websocket_port, max_size=None, **serve_options()):
+            logging.info(f"Supervisor routing ws://localhost:{Config.websocket_port} across {self.n_workers} agent workers.")
+            await self.monitor()
+
+
+def run_supervisor():
+    """
+    Runs the supervisor with `Config.workers` worker processes until interrupted.
+    """
+    from profiler import install_signal_handler
+
+    install_signal_handler()
+    supervisor = Supervisor(Config.workers)
+    try:
+        asyncio.run(supervisor.serve())
+    except KeyboardInterrupt:
+        logging.info("Shutting down the supervisor and agent workers.")
+        for process in supervisor.processes.values():
+            process.terminate()
@@ -0,0 +1,234 @@
+from globals import Config
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+"""
+Span-based request tracing for student turns and background cycles.
+
+A trace is started for every student turn (`_gui_respond` / `_process_query`) and every strategy or
+domain-knowledge cycle. Work done inside it (LLM attempts, rate-limiter waits, embeddings, retrieval,
+file writes) is recorded as nested spans with timings and attributes such as payload sizes, token counts,
+the attempt number of retried calls and the error that ended a failed attempt.
+
+The current span is kept in a context variable, so spans nest across function calls on the same thread or
+asyncio task without being passed around. Work handed to other threads (hedged requests, request
+coalescers) is covered by the span of the caller waiting for it.
+
+With `Config.tracing_enabled`, a fraction `Config.trace_sample_rate` of traces is kept. When its root span
+ends, each trace is written by a background thread to `Config.trace_dir` as a Chrome trace-event JSON file
+(`<start ms>_group<group>_<name>_<trace id>.json`), which opens in Perfetto or chrome://tracing.
+"""
+
+_current = contextvars.ContextVar("trace_span", default=None)
+_span_ids = itertools.count(1)
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-writer")
+
+
+class Trace:
+    """
+    The spans of one turn or cycle, exported together when the root span ends.
+
+    Attributes
+    ----------
+    trace_id : str
+        Random id shared by every span of the trace.
+    name : str
+        Name of the root span.
+    spans : list of Span
+        Ended spans.
+    """
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.spans = []
+
+    def events(self):
+        """
+        The trace as Chrome trace events: one complete ("X") event per span and a name per thread.
+        """
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for span in self.spans:
+            threads[span.tid] = span.thread_name
+            events.append({
+                "name": span.name,
+                "cat": self.name,
+                "ph": "X",
+                "ts": span.start_us,
+                "dur": span.duration_us,
+                "pid": pid,
+                "tid": span.tid,
+                "args": dict(span.attrs, trace_id=self.trace_id, span_id=span.span_id, parent_id=span.parent_id)
+            })
+        for tid, thread_name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+        return events
+
+    def export(self, root):
+        os.makedirs(Config.trace_dir, exist_ok=True)
+        group = root.attrs.get("group", "")
+        path = os.path.join(Config.trace_dir, f"{root.start_us // 1000}_group{group}_{self.name}_{self.trace_id}.json")
+        try:
+            with open(path, 'w') as f:
+                json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms", "otherData": {"trace_id": self.trace_id}}, f, default=str)
+        except (IOError, TypeError, ValueError) as e:
+            logging.error(f"Error writing trace '{path}': {e}")
+
+
+class Span:
+    """
+    A timed operation within a trace. Spans without a trace are no-ops.
+
+    Use spans through `start_trace`, `span` or `traced` rather than directly.
+    """
+    def __init__(self, trace=None, name=None, parent=None, attrs=None):
+        self.trace = trace
+        self.name = name
+        self.parent_id = parent.span_id if parent is not None and parent.trace is not None else None
+        self.span_id = next(_span_ids) if trace is not None else None
+        self.attrs = dict(attrs or {})
+        self.root = trace is not None and self.parent_id is None
+        self._token = None
+        self._ended = False
+        if trace is not None:
+            thread = threading.current_thread()
+            self.tid = thread.native_id
+            self.thread_name = thread.name
+            self.start_us = time.time_ns() // 1000
+            self._start = time.perf_counter_ns()
+
+    def set(self, **attrs):
+        """
+        Adds attributes (payload sizes, token counts, results) to the span.
+        """
+        if self.trace is not None:
+            self.attrs.update(attrs)
+
+    def _activate(self):
+        self._token = _current.set(self)
+        return self
+
+    def end(self, error=None):
+        """
+        Ends the span; ending the root span exports the trace.
+        """
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        if self.trace is None or self._ended:
+            return
+        self._ended = True
+        self.duration_us = (time.perf_counter_ns() - self._start) // 1000
+        if error is not None:
+            self.attrs["error"] = type(error).__name__
+        self.trace.spans.append(self)
+        if self.root:
+            logging.debug(f"Trace {self.trace.trace_id} '{self.name}' took {self.duration_us / 1000:.1f} ms ({len(self.trace.spans)} spans).")
+            _writer.submit(self.trace.export, self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(error=exc if exc_type is not None and not issubclass(exc_type, GeneratorExit) else None)
+        return False
+
+
+_noop = Span()
+
+
+def current_span():
+    """
+    The innermost active span, or a no-op span outside any trace.
+    """
+    return _current.get() or _noop
+
+
+def current_trace_id():
+    """
+    The id of the active trace, or None.
+    """
+    span = _current.get()
+    return span.trace.trace_id if span is not None and span.trace is not None else None
+
+
+def begin_trace(name, **attrs):
+    """
+    Starts a trace, or a child span if a trace is already active on this thread or task.
+
+    The caller must call `end()` on the returned span (or use it as a context manager).
+
+    Parameters
+    ----------
+    name : str
+        Name of the trace, e.g. "turn" or "strategy_cycle".
+    **attrs
+        Attributes of the root span (e.g. group).
+
+    Returns
+    -------
+    Span
+    """
+    parent = _current.get()
+    if parent is not None:
+        if parent.trace is None:
+            return _noop
+        return Span(parent.trace, name, parent, attrs)._activate()
+    if not Config.tracing_enabled:
+        return _noop
+    if random.random() >= Config.trace_sample_rate:
+        # Mark the context as sampled out so nested traces are not sampled separately
+        return Span()._activate()
+    return Span(Trace(name), name, None, attrs)._activate()
+
+
+def start_trace(name, **attrs):
+    """
+    Context-manager form of `begin_trace`.
+    """
+    return begin_trace(name, **attrs)
+
+
+def span(name, **attrs):
+    """
+    Starts a child span of the active span; a no-op outside a trace. Use as a context manager.
+    """
+    parent = _current.get()
+    if parent is None or parent.trace is None:
+        return _noop
+    return Span(parent.trace, name, parent, attrs)._activate()
+
+
+def traced(name, attrs=None, root=False):
+    """
+    Decorator running a function in a span.
+
+    Parameters
+    ----------
+    name : str
+        Span name.
+    attrs : callable, optional
+        Called with the function's arguments; returns the span's initial attributes.
+    root : bool, optional
+        Start a trace if none is active (see `begin_trace`), by default False.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None and not (root and Config.tracing_enabled):
+                return function(*args, **kwargs)
+            initial = attrs(*args, **kwargs) if attrs is not None else {}
+            with (begin_trace(name, **initial) if root else span(name, **initial)):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,215 @@
+from globals import Config
+from coalescer import Coalescer
+from resilience import get_guard
+from lexical_index import load_corpus
+from quantized_store import QuantizedVectorStore
+import logging
+import threading
+
+"""
+Dense retrieval backends and the cross-session query coalescer used by `RAG.retrieve`.
+
+Both backends answer a batch of query vectors at once through `query_batch(namespace, vectors, k)`
+and return one Pinecone-shaped result per vector ({"matches": [{"id", "score", "metadata": {"text"}}]}):
+- `PineconeBackend` overlaps the batch's queries on the shared Pinecone connection pool.
+- `LocalVectorIndex` scores the whole batch with one matrix multiply and a top-k selection.
+- `QuantizedVectorStore` (quantized_store.py) does the same on memory-mapped int8/float16 vectors.
+
+Only backends with `coalesce = True` (the local ones) go through the `QueryCoalescer`. Pinecone has no
+multi-vector query, so a batch would be N queries under one guard timeout where one slow query fails
+every caller; Pinecone retrievals are issued per caller instead.
+"""
+
+
+class PineconeBackend:
+    """
+    Batched queries against a remote Pinecone index.
+
+    Pinecone has no multi-vector query, so the batch is issued as concurrent `async_req` queries that
+    share the index's connection pool (`Config.pinecone_pool_threads`) instead of N sequential round trips.
+    """
+    guard_name = "pinecone_query"
+    coalesce = False
+
+    def __init__(self, index):
+        self.index = index
+
+    def query_batch(self, namespace, vectors, k):
+        kwargs = {"namespace": namespace, "top_k": k, "include_values": False, "include_metadata": True}
+        if len(vectors) == 1 or Config.pinecone_pool_threads <= 1:
+            return [self.index.query(vector=v, **kwargs) for v in vectors]
+        pending = [self.index.query(vector=v, async_req=True, **kwargs) for v in vectors]
+        return [p.get() for p in pending]
+
+
+class LocalVectorIndex:
+    """
+    In-process dense index over the knowledge corpus, searched with numpy.
+
+    Parameters
+    ----------
+    ids : list of str
+        Passage ids.
+    texts : list of str
+        Passage texts.
+    matrix : numpy.ndarray
+        (n_passages, dim) float32 embeddings; rows are L2-normalized here so scores are cosine similarities.
+    """
+    guard_name = "local_vector_query"
+    coalesce = True
+
+    def __init__(self, ids, texts, matrix):
+        import numpy as np
+
+        self.ids = ids
+        self.texts = texts
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = (matrix / norms).astype(np.float32)
+
+    @classmethod
+    def from_corpus(cls, path):
+        """
+        Builds the index from the embeddings stored in a JSONL knowledge corpus.
+
+        Returns
+        -------
+        LocalVectorIndex or None
+            The index, or None if the corpus has no embedded passages.
+        """
+        import numpy as np
+
+        passages = load_corpus(path, with_embeddings=True)
+        if not passages:
+            return None
+        matrix = np.asarray([p["embedding"] for p in passages], dtype=np.float32)
+        return cls([p["id"] for p in passages], [p["text"] for p in passages], matrix)
+
+    def _top_k(self, scores, k):
+        """
+        Row-wise top-k of a (n_queries, n_passages) score matrix, best first.
+        """
+        import numpy as np
+
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+
+    def query_batch(self, namespace, vectors, k):
+        import numpy as np
+
+        queries = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        scores = (queries / norms) @ self.matrix.T
+        top = self._top_k(scores, k)
+        return [
+            {"matches": [{"id": self.ids[j], "score": float(scores[row, j]), "metadata": {"text": self.texts[j]}} for j in top[row]]}
+            for row in range(len(vectors))
+        ]
+
+
+class QueryCoalescer(Coalescer):
+    """
+    Groups concurrent `RAG.retrieve` calls from all sessions into one batched similarity search per
+    backend and namespace, then hands each caller its own top-k.
+
+    Identical query vectors in a batch are searched once. The batch runs under the backend's upstream
+    guard, so errors are raised in every caller of the batch and their retry handling still applies.
+
+    Attributes
+    ----------
+    stats : dict
+        Counts of caller requests, distinct vectors searched and batches executed.
+    """
+    def __init__(self):
+        super().__init__("query-coalescer", lambda: Config.query_batch_window_ms, lambda: Config.query_batch_max)
+        self.stats = {"requests": 0, "searched_vectors": 0, "batches": 0}
+
+    def query(self, backend, namespace, embedding, k):
+        """
+        Returns the top-k matches for one embedding, batched with concurrent queries.
+
+        Parameters
+        ----------
+        backend : LocalVectorIndex or QuantizedVectorStore
+            The backend to search (one with `coalesce = True`).
+        namespace : str
+            The vector store namespace.
+        embedding : list of float
+            The query embedding.
+        k : int
+            Number of matches to return.
+
+        Returns
+        -------
+        dict
+            {"matches": [...]} for this embedding.
+        """
+        return self.submit((backend, namespace), (tuple(embedding), k))
+
+    def _flush(self, key, items):
+        backend, namespace = key
+        distinct = list(dict.fromkeys(vector for (vector, _), _ in items))
+        k_max = max(k for (_, k), _ in items)
+
+        guard = get_guard(backend.guard_name, Config.retrieval_timeout)
+        results = guard.call(backend.query_batch, namespace, [list(v) for v in distinct], k_max)
+        by_vector = dict(zip(distinct, results))
+
+        self._count(requests=len(items), searched_vectors=len(distinct), batches=1)
+        if len(items) > 1:
+            logging.info(f"Coalesced {len(items)} retrieval requests into one batch of {len(distinct)} vectors.")
+        for (vector, k), future in items:
+            future.set_result({"matches": list(by_vector[vector]["matches"])[:k]})
+
+
+_coalescer = QueryCoalescer()
+_pinecone_backends = {}
+_local_index = None
+_backend_lock = threading.Lock()
+
+
+def get_query_coalescer():
+    """
+    Returns the process-wide retrieval query coalescer.
+    """
+    return _coalescer
+
+
+def get_pinecone_backend(index):
+    """
+    Returns the shared batched backend for a Pinecone index handle.
+    """
+    with _backend_lock:
+        if id(index) not in _pinecone_backends:
+            _pinecone_backends[id(index)] = PineconeBackend(index)
+        return _pinecone_backends[id(index)]
+
+
+def get_local_vector_index():
+    """
+    Returns the shared local dense index, opened on first use.
+
+    The memory-mapped quantized store at `Config.vector_store_path` is preferred; otherwise the index is built
+    in memory from the embeddings in `Config.knowledge_corpus_path`.
+
+    Returns
+    -------
+    QuantizedVectorStore or LocalVectorIndex or None
+        The index, or None if neither a store nor a corpus with embeddings is configured.
+    """
+    global _local_index
+    with _backend_lock:
+        if _local_index is None and Config.vector_store_path:
+            try:
+                _local_index = QuantizedVectorStore(Config.vector_store_path)
+                logging.info(f"Opened quantized vector store with {len(_local_index)} passages from '{Config.vector_store_path}'.")
+            except (FileNotFoundError, IOError, ValueError) as e:
+                logging.error(f"Error opening quantized vector store at '{Config.vector_store_path}': {e}")
+        if _local_index is None and Config.knowledge_corpus_path:
+            _local_index = LocalVectorIndex.from_corpus(Config.knowledge_corpus_path)
+            if _local_index is not None:
+                logging.info(f"Built local vector index over {len(_local_index.ids)} knowledge passages.")
+        return _local_index